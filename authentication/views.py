@@ -8,7 +8,6 @@ from django.contrib.auth import login, logout
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
-from django.core.mail import send_mail
 from django.conf import settings
 from django.utils import timezone
 from django.core.cache import cache
@@ -31,7 +30,7 @@ from .serializers import (
     UserProfileSerializer
 )
 from core.models import User
-from core.services.sms import send_sms
+from core.tasks import enqueue, send_email_task, send_sms_task
 from core.utils.notifications import create_notification
 
 logger = logging.getLogger(__name__)
@@ -87,7 +86,7 @@ class RegisterView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     def _send_welcome_email(self, user):
-        """Send welcome email to new user"""
+        """Queue welcome email to new user"""
         try:
             subject = 'Welcome to EMSU - Educational Management System'
             message = f"""
@@ -101,13 +100,7 @@ class RegisterView(APIView):
             EMSU Team
             """
             
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                fail_silently=True
-            )
+            enqueue(send_email_task, args=(subject, message, [user.email]), user=user)
         except Exception as e:
             logger.error(f"Failed to send welcome email to {user.email}: {str(e)}")
 
@@ -223,8 +216,8 @@ class SendOTPView(APIView):
             message = f"Your EMSU verification code is: {otp}. Valid for 10 minutes."
             
             try:
-                send_sms(phone_number, message)
-                logger.info(f"OTP sent to {phone_number}")
+                enqueue(send_sms_task, args=(phone_number, message), user=request.user)
+                logger.info(f"OTP queued for {phone_number}")
                 
                 return Response({
                     'message': 'OTP sent successfully'
@@ -304,7 +297,7 @@ class PasswordResetView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     def _send_reset_email(self, user, token, uid):
-        """Send password reset email"""
+        """Queue password reset email"""
         try:
             reset_url = f"{settings.FRONTEND_URL}/reset-password/{uid}/{token}/"
             
@@ -323,13 +316,7 @@ class PasswordResetView(APIView):
             EMSU Team
             """
             
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                fail_silently=False
-            )
+            enqueue(send_email_task, args=(subject, message, [user.email]), user=user)
         except Exception as e:
             logger.error(f"Failed to send reset email to {user.email}: {str(e)}")
 
@@ -7,3 +7,8 @@ class CoreConfig(AppConfig):
     def ready(self):
         import core.signals  # You have to just Ensure signals are imported when the app is ready bro 
 
+        from django.conf import settings
+        if getattr(settings, 'SMS_WARM_UP', False):
+            from core.services.sms_providers import warm_up_providers
+            warm_up_providers()
+
@@ -23,8 +23,10 @@ import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.utils import timezone
 from .models import Message, MessageRecipient, Notification
+from .services import conversations as conversation_service
 from .utils.notifications import create_notification
 
 logger = logging.getLogger(__name__)
@@ -154,7 +156,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
         try:
             message_id = data.get('message_id')
             if message_id:
-                await self.mark_message_read(message_id, self.user.id)
+                await self.mark_message_read(message_id)
                 await self.send(text_data=json.dumps({
                     'type': 'message_read',
                     'message_id': message_id
@@ -225,24 +227,21 @@ class ChatConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def create_message(self, sender, recipient_ids, subject, body, message_type, is_urgent):
         """Create a new message in the database"""
-        message = Message.objects.create(
-            sender=sender,
-            subject=subject,
-            body=body,
-            message_type=message_type,
-            is_urgent=is_urgent
-        )
-        
-        # Create message recipients
-        recipients = User.objects.filter(id__in=recipient_ids)
-        for recipient in recipients:
-            MessageRecipient.objects.create(
-                message=message,
-                recipient=recipient
+        with transaction.atomic():
+            message = Message.objects.create(
+                sender=sender,
+                subject=subject,
+                body=body,
+                message_type=message_type,
+                is_urgent=is_urgent
             )
             
-            # Create notification for urgent messages
-            if is_urgent:
+            # Create message recipients and update their conversations
+            recipients = conversation_service.add_recipients(message, User.objects.filter(id__in=recipient_ids))
+        
+        # Create notification for urgent messages
+        if is_urgent:
+            for recipient in recipients:
                 create_notification(
                     recipient=recipient,
                     title=f"Urgent Message from {sender.get_full_name()}",
@@ -253,18 +252,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
         return message
     
     @database_sync_to_async
-    def mark_message_read(self, message_id, user_id):
+    def mark_message_read(self, message_id):
         """Mark a message as read"""
-        try:
-            recipient = MessageRecipient.objects.get(
-                message_id=message_id,
-                recipient_id=user_id
-            )
-            recipient.is_read = True
-            recipient.read_at = timezone.now()
-            recipient.save()
-        except MessageRecipient.DoesNotExist:
-            pass
+        conversation_service.mark_message_read(self.user, message_id)
 
 
 class NotificationConsumer(AsyncWebsocketConsumer):
@@ -308,6 +298,13 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             'type': 'notification',
             'notification': event['notification']
         }))
+
+    async def send_notifications(self, event):
+        """Send several notifications, coalesced by the dispatcher, in one frame"""
+        await self.send(text_data=json.dumps({
+            'type': 'notifications',
+            'notifications': event['notifications']
+        }))
     
     @database_sync_to_async
     def mark_notification_read(self, notification_id):
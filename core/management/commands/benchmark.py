@@ -0,0 +1,276 @@
+import datetime
+import itertools
+import random
+import statistics
+import tempfile
+import time
+import zipfile
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Avg
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import (
+    AcademicSession, Attendance, Class, Enrollment, FeePayment, FeeStructure, Grade, ParentProfile, PrincipalProfile,
+    ProprietorProfile, School, StudentProfile, Subject, SubjectResult, TeacherClass, TeacherProfile, Term, User,
+)
+from core.services.attendance import rebuild_attendance_rollups
+from core.services.broadsheets import class_broadsheet, compute_broadsheet, load_grades
+from core.services.report_cards import generate_report_cards, render_report_card, report_card_data
+from core.services.results import rebuild_results
+
+ASSESSMENTS = ('ca1', 'ca2', 'ca3', 'exam')
+_sequence = itertools.count()
+
+
+def create_users(user_type, count):
+    """`count` users of a type, created in one insert without passwords"""
+    users = []
+    for _ in range(count):
+        n = next(_sequence)
+        users.append(User(
+            email=f'{user_type}{n}@benchmark.test', first_name=user_type.title(), last_name=str(n),
+            user_type=user_type,
+        ))
+    return User.objects.bulk_create(users)
+
+
+def create_school(subjects, classes=3, students_per_class=12):
+    """
+    A school with a current session and term, a principal, a teacher per
+    class and enrolled students graded in every assessment of `subjects`
+    """
+    n = next(_sequence)
+    school = School.objects.create(
+        name=f'Benchmark School {n}', slug=f'benchmark-school-{n}', address='1 School Road', city='Lagos',
+        state='Lagos', phone='08000000000', email=f'school{n}@benchmark.test', school_type='secondary',
+        ownership_type='private', registration_number=f'BENCH-{n}',
+    )
+    session = AcademicSession.objects.create(
+        school=school, name='2025/2026', start_date=datetime.date(2025, 9, 1), end_date=datetime.date(2026, 7, 31),
+        is_current=True,
+    )
+    term = Term.objects.create(
+        session=session, name='first', start_date=datetime.date(2025, 9, 1), end_date=datetime.date(2025, 12, 15),
+        is_current=True,
+    )
+    principal_user, = create_users('principal', 1)
+    PrincipalProfile.objects.create(user=principal_user, school=school, employee_id=f'P-{principal_user.last_name}')
+    teachers = TeacherProfile.objects.bulk_create([
+        TeacherProfile(user=user, school=school, employee_id=f'T-{user.last_name}')
+        for user in create_users('teacher', classes)
+    ])
+    school_classes = [
+        Class.objects.create(school=school, name=f'Class {index}', level=f'level{index}', class_teacher=teacher)
+        for index, teacher in enumerate(teachers)
+    ]
+    TeacherClass.objects.bulk_create([
+        TeacherClass(teacher=teacher, class_assigned=school_class, subject=subject, session=session)
+        for teacher, school_class in zip(teachers, school_classes) for subject in subjects
+    ])
+
+    students = StudentProfile.objects.bulk_create([
+        StudentProfile(
+            user=user, school=school, current_class=school_classes[index % classes],
+            admission_number=f'ADM-{user.last_name}', date_of_birth=datetime.date(2010, 1, 1), gender='male',
+            address='1 Home Road', state_of_origin='Lagos', admission_date=datetime.date(2020, 9, 1),
+            guardian_name='Guardian', guardian_phone='08000000000', emergency_contact='Guardian',
+            emergency_phone='08000000000',
+        )
+        for index, user in enumerate(create_users('student', classes * students_per_class))
+    ])
+    Enrollment.objects.bulk_create([
+        Enrollment(student=student, class_enrolled=student.current_class, session=session) for student in students
+    ])
+    today = timezone.now().date()
+    Attendance.objects.bulk_create([
+        Attendance(
+            student=student, class_attended=student.current_class, date=today - datetime.timedelta(days=day),
+            status=random.choice(('present', 'present', 'present', 'late', 'absent')), marked_by=teachers[0],
+        )
+        for student in students for day in range(5)
+    ])
+    Grade.objects.bulk_create([
+        Grade(
+            student=student, subject=subject, class_taken=student.current_class, term=term,
+            assessment_type=assessment, score=random.randint(0, 100 if assessment == 'exam' else 20),
+            total_marks=100 if assessment == 'exam' else 20, teacher=teachers[0],
+        )
+        for student in students for subject in subjects for assessment in ASSESSMENTS
+    ], batch_size=5000)
+    fees = {
+        school_class.pk: FeeStructure.objects.create(
+            school=school, session=session, class_level=school_class, fee_type='tuition', amount=50000
+        )
+        for school_class in school_classes
+    }
+    FeePayment.objects.bulk_create([
+        FeePayment(
+            student=student, fee_structure=fees[student.current_class_id], amount_paid=20000 + 1000 * (index % 5),
+            payment_method='cash', reference_number=f'REF-{school.pk}-{index}',
+            status='completed' if index % 4 else 'pending',
+        )
+        for index, student in enumerate(students)
+    ])
+    return school, term, school_classes, students
+
+
+def measure(run, repeat):
+    """Run `run` `repeat` times; returns its last result, its queries and the median time in ms"""
+    timings = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            result = run()
+            timings.append((time.perf_counter() - started) * 1000)
+    return result, len(queries), statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark a hot path on seeded data in a throwaway test database, '
+        'reporting queries and median time per run. The defaults keep each '
+        'suite quick; report-cards --classes 20 --students 50 --workers 1,4 '
+        'renders a 1,000-student school'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=['dashboards', 'broadsheets', 'report-cards'])
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement')
+        parser.add_argument('--schools', type=int, default=4, help='Schools the dashboards span at most')
+        parser.add_argument('--students', type=int, default=60, help='Students per class (the broadsheet suite seeds one class)')
+        parser.add_argument('--subjects', type=int, default=15, help='Subjects each student is graded in')
+        parser.add_argument('--classes', type=int, default=2, help='Classes to render report cards for')
+        parser.add_argument(
+            '--workers', default='1', help='Comma-separated report card pool sizes to compare, e.g. 1,4'
+        )
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory(prefix='benchmark-') as media, override_settings(MEDIA_ROOT=media):
+                getattr(self, f"benchmark_{options['suite'].replace('-', '_')}")(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def benchmark_dashboards(self, options):
+        """
+        Queries and time per /api/dashboard-stats/ load for each user type,
+        as the proprietor's schools and the parent's children grow
+        """
+        subjects = [Subject.objects.create(name=f'Subject {n}', code=f'SUB{n}') for n in range(4)]
+        proprietor_user, = create_users('proprietor', 1)
+        proprietor = ProprietorProfile.objects.create(user=proprietor_user)
+        parent_user, = create_users('parent', 1)
+        parent = ParentProfile.objects.create(user=parent_user, relationship='father')
+
+        self.stdout.write(f"{'dashboard':<12}{'schools':>8}{'queries':>9}{'ms':>9}")
+        for count in sorted({1, options['schools']}):
+            while proprietor.schools.count() < count:
+                school, term, school_classes, students = create_school(subjects)
+                proprietor.schools.add(school)
+                parent.children.add(*students[:2])
+            rebuild_attendance_rollups()
+            rebuild_results()
+
+            users = {
+                'proprietor': proprietor_user,
+                'principal': PrincipalProfile.objects.first().user,
+                'teacher': TeacherProfile.objects.first().user,
+                'student': StudentProfile.objects.first().user,
+                'parent': parent_user,
+            }
+            for label, user in users.items():
+                client = APIClient()
+                client.force_authenticate(user)
+                response, queries, elapsed = measure(lambda: client.get('/api/dashboard-stats/'), options['repeat'])
+                if response.status_code != 200:
+                    self.stderr.write(f'{label}: HTTP {response.status_code} {response.data}')
+                self.stdout.write(f'{label:<12}{count:>8}{queries:>9}{elapsed:>9.1f}')
+
+    def benchmark_broadsheets(self, options):
+        """
+        One class's broadsheet computed with pandas, against averaging each
+        student's subject with its own query, and checked against the
+        maintained SubjectResult rows
+        """
+        subjects = [Subject.objects.create(name=f'Subject {n}', code=f'SUB{n}') for n in range(options['subjects'])]
+        school, term, (school_class,), students = create_school(
+            subjects, classes=1, students_per_class=options['students']
+        )
+        rebuild_results()
+        self.stdout.write(
+            f"{len(students)} students x {len(subjects)} subjects x {len(ASSESSMENTS)} assessments "
+            f"= {Grade.objects.count()} grades"
+        )
+
+        sheet, queries, elapsed = measure(lambda: class_broadsheet(school_class, term), options['repeat'])
+        self.stdout.write(f'broadsheet            {queries:>5} queries {elapsed:>9.1f} ms')
+        frame, queries, elapsed = measure(lambda: load_grades(school_class, term), options['repeat'])
+        self.stdout.write(f'  load grades         {queries:>5} queries {elapsed:>9.1f} ms')
+        _, queries, elapsed = measure(lambda: compute_broadsheet(frame), options['repeat'])
+        self.stdout.write(f'  compute             {queries:>5} queries {elapsed:>9.1f} ms')
+
+        def per_cell():
+            return {
+                (student.pk, subject.pk): Grade.objects.filter(
+                    student=student, subject=subject, term=term
+                ).aggregate(average=Avg('score'))['average']
+                for student in students for subject in subjects
+            }
+        _, queries, elapsed = measure(per_cell, 1)
+        self.stdout.write(f'per-cell ORM baseline {queries:>5} queries {elapsed:>9.1f} ms')
+
+        results = {
+            (str(result.student_id), str(result.subject_id)): result
+            for result in SubjectResult.objects.filter(term=term)
+        }
+        mismatches = 0
+        for row in sheet['students']:
+            for subject_id, score in row['scores'].items():
+                result = results[(str(row['id']), subject_id)]
+                if (abs(float(result.weighted_score) - score['score']) > 0.011 or result.position != score['position']
+                        or result.letter_grade != score['letter']):
+                    mismatches += 1
+        self.stdout.write(f'subject scores differing from SubjectResult: {mismatches}')
+
+    def benchmark_report_cards(self, options):
+        """
+        Report card throughput: reading a class's cards, rendering one, and
+        generating every class's archive with each pool size in --workers
+        """
+        subjects = [Subject.objects.create(name=f'Subject {n}', code=f'SUB{n}') for n in range(options['subjects'])]
+        school, term, classes, students = create_school(
+            subjects, classes=options['classes'], students_per_class=options['students']
+        )
+        rebuild_attendance_rollups()
+        rebuild_results()
+        self.stdout.write(f'{len(classes)} classes x {options["students"]} students, {len(subjects)} subjects')
+
+        cards, queries, elapsed = measure(lambda: report_card_data(classes[0], term), options['repeat'])
+        self.stdout.write(f'card data, one class  {queries:>5} queries {elapsed:>9.1f} ms')
+        started = time.perf_counter()
+        render_report_card(cards[0])
+        cold = (time.perf_counter() - started) * 1000
+        _, _, warm = measure(lambda: render_report_card(cards[1 % len(cards)]), options['repeat'])
+        self.stdout.write(f'one card              cold {cold:.0f} ms, warm {warm:.0f} ms')
+
+        for workers in [int(size) for size in options['workers'].split(',')]:
+            started = time.perf_counter()
+            archives = generate_report_cards(classes, term, workers=workers)
+            elapsed = time.perf_counter() - started
+            rendered = sum(archive['cards'] for archive in archives)
+            for archive in archives:
+                with default_storage.open(archive['archive']) as stored, zipfile.ZipFile(stored) as bundle:
+                    if len(bundle.namelist()) != archive['cards']:
+                        self.stderr.write(f"{archive['archive']}: {len(bundle.namelist())} of {archive['cards']} cards")
+            self.stdout.write(
+                f'workers={workers:<3} {rendered} cards in {elapsed:.1f} s, {rendered / elapsed:.1f} cards/s'
+            )
@@ -0,0 +1,104 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:34
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_conversations(apps, schema_editor):
+    MessageRecipient = apps.get_model('core', 'MessageRecipient')
+    Conversation = apps.get_model('core', 'Conversation')
+    ConversationParticipant = apps.get_model('core', 'ConversationParticipant')
+
+    threads = {}
+    rows = MessageRecipient.objects.values_list(
+        'recipient_id', 'is_read', 'read_at',
+        'message_id', 'message__sender_id', 'message__created_at'
+    ).order_by('message__created_at').iterator(chunk_size=2000)
+    for recipient_id, is_read, read_at, message_id, sender_id, created_at in rows:
+        if recipient_id == sender_id:
+            continue
+        key = ':'.join(sorted([str(sender_id), str(recipient_id)]))
+        thread = threads.setdefault(key, {
+            'last_message_id': None,
+            'last_message_at': None,
+            'members': {
+                sender_id: {'counterpart': recipient_id, 'unread': 0, 'last_read_at': None},
+                recipient_id: {'counterpart': sender_id, 'unread': 0, 'last_read_at': None},
+            },
+        })
+        thread['last_message_id'] = message_id
+        thread['last_message_at'] = created_at
+        reader = thread['members'][recipient_id]
+        if not is_read:
+            reader['unread'] += 1
+        elif read_at and (reader['last_read_at'] is None or read_at > reader['last_read_at']):
+            reader['last_read_at'] = read_at
+
+    conversations = []
+    participants = []
+    for key, thread in threads.items():
+        conversation = Conversation(
+            id=uuid.uuid4(),
+            participant_key=key,
+            last_message_id=thread['last_message_id'],
+            last_message_at=thread['last_message_at'],
+        )
+        conversations.append(conversation)
+        for user_id, member in thread['members'].items():
+            participants.append(ConversationParticipant(
+                conversation_id=conversation.id,
+                user_id=user_id,
+                counterpart_id=member['counterpart'],
+                unread_count=member['unread'],
+                last_read_at=member['last_read_at'],
+                last_message_at=thread['last_message_at'],
+            ))
+
+    Conversation.objects.bulk_create(conversations, batch_size=1000)
+    ConversationParticipant.objects.bulk_create(participants, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_user_managers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('participant_key', models.CharField(max_length=80, unique=True)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.message')),
+            ],
+            options={
+                'db_table': 'conversations',
+            },
+        ),
+        migrations.CreateModel(
+            name='ConversationParticipant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('last_read_at', models.DateTimeField(blank=True, null=True)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('is_archived', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participants', to='core.conversation')),
+                ('counterpart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'conversation_participants',
+                'indexes': [models.Index(fields=['user', '-last_message_at', '-id'], name='conversatio_user_id_627f89_idx')],
+                'unique_together': {('user', 'counterpart')},
+            },
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_conversations'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='message',
+            name='messages_sender__bf8b1c_idx',
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'created_at', 'id'], name='messages_sender__f40348_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='messagerecipient',
+            index=models.Index(fields=['recipient', 'message'], name='message_rec_recipie_7e202d_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+def mark_existing_delivered(apps, schema_editor):
+    # Announcements created before this migration were notified on save
+    Announcement = apps.get_model('core', 'Announcement')
+    Announcement.objects.update(fanout_status='completed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_message_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='announcement',
+            name='fanout_completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='announcement',
+            name='fanout_sent',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='announcement',
+            name='fanout_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='announcement',
+            name='fanout_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='announcement',
+            name='fanout_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(mark_existing_delivered, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_task_records'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='feepayment',
+            name='fee_payment_status_d14ebc_idx',
+        ),
+        migrations.AddIndex(
+            model_name='feepayment',
+            index=models.Index(fields=['status', 'payment_date'], name='fee_payment_status_09d576_idx'),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:15
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_rollups(apps, schema_editor):
+    # Roll up the attendance recorded before rollups were kept on write.
+    # Keys and counters are spelt out as core.services.attendance keeps them
+    # as of this migration, and rows are read through the historical models.
+    Attendance = apps.get_model('core', 'Attendance')
+    AttendanceRollup = apps.get_model('core', 'AttendanceRollup')
+    StudentProfile = apps.get_model('core', 'StudentProfile')
+    Term = apps.get_model('core', 'Term')
+
+    student_schools = dict(StudentProfile.objects.values_list('pk', 'school_id'))
+    terms_by_school = defaultdict(list)
+    for term_id, school_id, start_date, end_date in Term.objects.values_list(
+        'pk', 'session__school', 'start_date', 'end_date'
+    ):
+        terms_by_school[school_id].append((term_id, start_date, end_date))
+
+    rollups = {}
+    facts = Attendance.objects.values_list('student_id', 'class_attended_id', 'date', 'status')
+    for student_id, class_id, date, status in facts.iterator():
+        school_id = student_schools.get(student_id)
+        if school_id is None:
+            continue
+        # A day outside every term of its school only counts towards day and
+        # all-time rollups
+        term_id = next(
+            (term_id for term_id, start_date, end_date in terms_by_school[school_id] if start_date <= date <= end_date),
+            None
+        )
+        scopes = [
+            ('school', school_id, {}),
+            ('class', class_id, {'class_attended_id': class_id}),
+            ('student', student_id, {'class_attended_id': class_id, 'student_id': student_id}),
+        ]
+        for scope, entity_id, fields in scopes:
+            periods = [('total', 'all', {})]
+            if term_id is not None:
+                periods.append(('term', term_id, {'term_id': term_id}))
+            if scope != 'student':
+                periods.append(('day', date.isoformat(), {'date': date}))
+            for period, value, period_fields in periods:
+                key = f"{scope}:{entity_id}:{period}:{value}"
+                if key not in rollups:
+                    rollups[key] = AttendanceRollup(
+                        key=key, scope=scope, period=period, school_id=school_id, **fields, **period_fields
+                    )
+                rollup = rollups[key]
+                rollup.total += 1
+                setattr(rollup, status, getattr(rollup, status) + 1)
+
+    AttendanceRollup.objects.bulk_create(rollups.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_fee_payment_revenue_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=120, unique=True)),
+                ('scope', models.CharField(choices=[('school', 'School'), ('class', 'Class'), ('student', 'Student')], max_length=10)),
+                ('period', models.CharField(choices=[('day', 'Day'), ('term', 'Term'), ('total', 'All time')], max_length=10)),
+                ('date', models.DateField(blank=True, null=True)),
+                ('total', models.IntegerField(default=0)),
+                ('present', models.IntegerField(default=0)),
+                ('absent', models.IntegerField(default=0)),
+                ('late', models.IntegerField(default=0)),
+                ('excused', models.IntegerField(default=0)),
+                ('class_attended', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='attendance_rollups', to='core.class')),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_rollups', to='core.school')),
+                ('student', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='attendance_rollups', to='core.studentprofile')),
+                ('term', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='attendance_rollups', to='core.term')),
+            ],
+            options={
+                'db_table': 'attendance_rollups',
+                'indexes': [models.Index(fields=['school', 'scope', 'period', 'date'], name='attendance__school__22b1d5_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
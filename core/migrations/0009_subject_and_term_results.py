@@ -0,0 +1,58 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_attendance_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubjectResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('assessments', models.PositiveIntegerField(default=0)),
+                ('score_total', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('marks_total', models.PositiveIntegerField(default=0)),
+                ('weighted_score', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('letter_grade', models.CharField(max_length=2)),
+                ('position', models.PositiveIntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('class_taken', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subject_results', to='core.class')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subject_results', to='core.studentprofile')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='core.subject')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subject_results', to='core.term')),
+            ],
+            options={
+                'db_table': 'subject_results',
+                'indexes': [models.Index(fields=['class_taken', 'subject', 'term'], name='subject_res_class_t_3fdcc5_idx'), models.Index(fields=['term', 'letter_grade'], name='subject_res_term_id_59b7f4_idx')],
+                'unique_together': {('student', 'subject', 'term')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TermResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subjects', models.PositiveIntegerField(default=0)),
+                ('assessments', models.PositiveIntegerField(default=0)),
+                ('score_total', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('average_score', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('letter_grade', models.CharField(max_length=2)),
+                ('position', models.PositiveIntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('class_taken', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='term_results', to='core.class')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='term_results', to='core.studentprofile')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='term_results', to='core.term')),
+            ],
+            options={
+                'db_table': 'term_results',
+                'ordering': ['position'],
+                'indexes': [models.Index(fields=['class_taken', 'term', 'position'], name='term_result_class_t_1e1670_idx')],
+                'unique_together': {('student', 'term')},
+            },
+        ),
+    ]
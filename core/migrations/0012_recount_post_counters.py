@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:05
+
+from django.db import migrations
+from django.db.models import F, Func, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(queryset):
+    # Correlated COUNT(*) over a queryset filtered on an OuterRef
+    counted = queryset.order_by().annotate(count=Func(F('pk'), function='COUNT')).values('count')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def recount(apps, schema_editor):
+    # Counters were recomputed (or not at all) by whichever view wrote the
+    # like or comment; they are kept on write from here on
+    Post = apps.get_model('core', 'Post')
+    PostLike = apps.get_model('core', 'PostLike')
+    Comment = apps.get_model('core', 'Comment')
+    CommentLike = apps.get_model('core', 'CommentLike')
+
+    Post.objects.update(
+        likes_count=count_of(PostLike.objects.filter(post=OuterRef('pk'))),
+        comments_count=count_of(Comment.objects.filter(post=OuterRef('pk'))),
+    )
+    Comment.objects.update(
+        likes_count=count_of(CommentLike.objects.filter(comment=OuterRef('pk'))),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_home_timelines'),
+    ]
+
+    operations = [
+        migrations.RunPython(recount, migrations.RunPython.noop),
+    ]
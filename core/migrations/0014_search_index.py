@@ -0,0 +1,97 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def add_trigram_index(apps, schema_editor):
+    # Lets PostgreSQL match misspelt query words to similar indexed terms;
+    # other databases search on exact terms and prefixes only
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS search_terms_term_trgm ON search_terms USING gin (term gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS search_terms_term_trgm')
+
+
+def _tags(tags):
+    return ' '.join(map(str, tags)) if isinstance(tags, list) else ''
+
+
+# Per kind: the columns read, and a row's school and fields by weight, as
+# core.services.search.DOCUMENTS indexes them as of this migration
+DOCUMENTS = {
+    'user': ('User', [
+        'first_name', 'last_name', 'email', 'user_type',
+        'student_profile__school', 'teacher_profile__school', 'principal_profile__school',
+    ], lambda row: (row.get(f"{row['user_type']}_profile__school"), [
+        (row['first_name'], 3), (row['last_name'], 3), (row['email'], 1),
+    ])),
+    'school': ('School', ['name', 'city', 'state'], lambda row: (row['pk'], [
+        (row['name'], 3), (row['city'], 1), (row['state'], 1),
+    ])),
+    'post': ('Post', ['school', 'title', 'tags', 'content'], lambda row: (row['school'], [
+        (row['title'], 3), (_tags(row['tags']), 2), (row['content'], 1),
+    ])),
+    'group': ('TeacherGroup', ['school', 'name', 'description'], lambda row: (row['school'], [
+        (row['name'], 3), (row['description'], 1),
+    ])),
+}
+
+
+def build_index(apps, schema_editor):
+    # Index what already exists, reading only the indexed columns through
+    # the historical models
+    from core.services.search import INDEX_BATCH_SIZE, document_terms
+
+    SearchTerm = apps.get_model('core', 'SearchTerm')
+    for kind, (model_name, columns, document) in DOCUMENTS.items():
+        rows = apps.get_model('core', model_name).objects.order_by('pk').values('pk', *columns)
+        batch = []
+        for row in rows.iterator(chunk_size=INDEX_BATCH_SIZE):
+            school_id, fields = document(row)
+            links = {'school_id': school_id, f'{kind}_id': row['pk']}
+            batch.extend(
+                SearchTerm(term=term, kind=kind, weight=weight, **links)
+                for term, weight in document_terms(fields).items()
+            )
+            if len(batch) >= INDEX_BATCH_SIZE:
+                SearchTerm.objects.bulk_create(batch)
+                batch = []
+        SearchTerm.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_comment_reply_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=20)),
+                ('kind', models.CharField(choices=[('user', 'User'), ('school', 'School'), ('post', 'Post'), ('group', 'Teacher Group')], max_length=10)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.teachergroup')),
+                ('post', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.post')),
+                ('school', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.school')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'search_terms',
+                'indexes': [models.Index(fields=['kind', 'term', 'school'], name='search_term_kind_5178a8_idx')],
+            },
+        ),
+        migrations.RunPython(add_trigram_index, drop_trigram_index),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
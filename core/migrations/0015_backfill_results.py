@@ -0,0 +1,109 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:14
+
+from collections import Counter, defaultdict
+from decimal import Decimal
+from itertools import groupby
+
+from django.db import migrations
+
+# Grading as core.services.results and Grade.letter_for apply it as of this
+# migration, frozen so later changes to them leave the backfill as it ran
+CENTS = Decimal('0.01')
+ASSESSMENT_WEIGHTS = {'ca1': 10, 'ca2': 10, 'ca3': 10, 'ca4': 10, 'project': 10, 'practical': 10, 'exam': 60}
+LETTER_GRADES = ((90, 'A+'), (80, 'A'), (70, 'B'), (60, 'C'), (50, 'D'), (40, 'E'))
+
+
+def weighted_score(grades):
+    weighted = total_weight = Decimal(0)
+    for grade in grades:
+        weight = Decimal(ASSESSMENT_WEIGHTS.get(grade.assessment_type, 1))
+        weighted += weight * grade.score * 100 / grade.total_marks
+        total_weight += weight
+    return (weighted / total_weight).quantize(CENTS) if total_weight else Decimal(0)
+
+
+def letter_for(percentage):
+    return next((letter for bound, letter in LETTER_GRADES if percentage >= bound), 'F')
+
+
+def rank(rows, score):
+    # Descending score, tied scores sharing a position
+    previous, position = None, 0
+    for index, row in enumerate(sorted(rows, key=lambda row: getattr(row, score), reverse=True), start=1):
+        if getattr(row, score) != previous:
+            previous, position = getattr(row, score), index
+        row.position = position
+
+
+def backfill_results(apps, schema_editor):
+    # Results of the grades recorded before results were kept on write,
+    # read and written through the historical models. Runs after 0009 so
+    # the unique constraints the results are written against exist.
+    Grade = apps.get_model('core', 'Grade')
+    SubjectResult = apps.get_model('core', 'SubjectResult')
+    TermResult = apps.get_model('core', 'TermResult')
+
+    grades = Grade.objects.only(
+        'student', 'subject', 'term', 'class_taken', 'assessment_type', 'score', 'total_marks'
+    ).order_by('term', 'student', 'subject', 'pk')
+
+    subject_results, term_results = [], []
+    for (term_id, student_id), student_grades in groupby(
+        grades.iterator(chunk_size=2000), key=lambda grade: (grade.term_id, grade.student_id)
+    ):
+        rows = []
+        for subject_id, subject_grades in groupby(student_grades, key=lambda grade: grade.subject_id):
+            subject_grades = list(subject_grades)
+            score = weighted_score(subject_grades)
+            rows.append(SubjectResult(
+                student_id=student_id,
+                subject_id=subject_id,
+                term_id=term_id,
+                class_taken_id=subject_grades[-1].class_taken_id,
+                assessments=len(subject_grades),
+                score_total=sum(grade.score for grade in subject_grades),
+                marks_total=sum(grade.total_marks for grade in subject_grades),
+                weighted_score=score,
+                letter_grade=letter_for(score),
+            ))
+        subject_results.extend(rows)
+        average = (sum(row.weighted_score for row in rows) / len(rows)).quantize(CENTS)
+        term_results.append(TermResult(
+            student_id=student_id,
+            term_id=term_id,
+            # The class most of the term's subjects were taken in
+            class_taken_id=Counter(row.class_taken_id for row in rows).most_common(1)[0][0],
+            subjects=len(rows),
+            assessments=sum(row.assessments for row in rows),
+            score_total=sum(row.score_total for row in rows),
+            average_score=average,
+            letter_grade=letter_for(average),
+        ))
+
+    for results, fields, score in (
+        (subject_results, ['class_taken_id', 'subject_id', 'term_id'], 'weighted_score'),
+        (term_results, ['class_taken_id', 'term_id'], 'average_score'),
+    ):
+        groups = defaultdict(list)
+        for result in results:
+            groups[tuple(getattr(result, field) for field in fields)].append(result)
+        for rows in groups.values():
+            rank(rows, score)
+
+    # Results are derived from grades, so any kept on write since 0009 are
+    # replaced rather than merged
+    SubjectResult.objects.all().delete()
+    TermResult.objects.all().delete()
+    SubjectResult.objects.bulk_create(subject_results, batch_size=500)
+    TermResult.objects.bulk_create(term_results, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_results, migrations.RunPython.noop),
+    ]
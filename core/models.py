@@ -540,6 +540,49 @@ class Attendance(models.Model):
         return f"{self.student.user.get_full_name()} - {self.date} ({self.status})"
 
 
+class AttendanceRollup(models.Model):
+    """
+    Attendance counts by status for a school, class or student over a day,
+    a term or all time, maintained incrementally as attendance is written
+    (see core.services.attendance). Student days are not rolled up; each
+    is a single Attendance row already.
+    """
+    SCOPES = (
+        ('school', 'School'),
+        ('class', 'Class'),
+        ('student', 'Student'),
+    )
+    
+    PERIODS = (
+        ('day', 'Day'),
+        ('term', 'Term'),
+        ('total', 'All time'),
+    )
+    
+    key = models.CharField(max_length=120, unique=True)  # scope:id:period:date-or-term
+    scope = models.CharField(max_length=10, choices=SCOPES)
+    period = models.CharField(max_length=10, choices=PERIODS)
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='attendance_rollups')
+    class_attended = models.ForeignKey(Class, on_delete=models.CASCADE, related_name='attendance_rollups', blank=True, null=True)
+    student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name='attendance_rollups', blank=True, null=True)
+    term = models.ForeignKey(Term, on_delete=models.CASCADE, related_name='attendance_rollups', blank=True, null=True)
+    date = models.DateField(blank=True, null=True)
+    total = models.IntegerField(default=0)
+    present = models.IntegerField(default=0)
+    absent = models.IntegerField(default=0)
+    late = models.IntegerField(default=0)
+    excused = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'attendance_rollups'
+        indexes = [
+            models.Index(fields=['school', 'scope', 'period', 'date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.key}: {self.present}/{self.total} present"
+
+
 class Grade(models.Model):
     ASSESSMENT_TYPES = (
         ('ca1', 'Continuous Assessment 1'),
@@ -550,6 +593,16 @@ class Grade(models.Model):
         ('project', 'Project'),
         ('practical', 'Practical'),
     )
+    # Lower percentage bound of each letter grade, highest first; below
+    # the last is an F
+    LETTER_GRADES = (
+        (90, 'A+'),
+        (80, 'A'),
+        (70, 'B'),
+        (60, 'C'),
+        (50, 'D'),
+        (40, 'E'),
+    )
     
     student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name='grades')
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='grades')
@@ -577,26 +630,77 @@ class Grade(models.Model):
     
     @property
     def letter_grade(self):
-        percentage = self.percentage
-        if percentage >= 90:
-            return 'A+'
-        elif percentage >= 80:
-            return 'A'
-        elif percentage >= 70:
-            return 'B'
-        elif percentage >= 60:
-            return 'C'
-        elif percentage >= 50:
-            return 'D'
-        elif percentage >= 40:
-            return 'E'
-        else:
-            return 'F'
+        return self.letter_for(self.percentage)
+    
+    @classmethod
+    def letter_for(cls, percentage):
+        """Letter grade of a percentage, e.g. a weighted term score"""
+        for bound, letter in cls.LETTER_GRADES:
+            if percentage >= bound:
+                return letter
+        return 'F'
     
     def __str__(self):
         return f"{self.student.user.get_full_name()} - {self.subject.name} ({self.score})"
 
 
+class SubjectResult(models.Model):
+    """
+    A student's result in one subject for a term, maintained from their
+    grades as they change (see core.services.results)
+    """
+    student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name='subject_results')
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='results')
+    term = models.ForeignKey(Term, on_delete=models.CASCADE, related_name='subject_results')
+    class_taken = models.ForeignKey(Class, on_delete=models.CASCADE, related_name='subject_results')
+    assessments = models.PositiveIntegerField(default=0)
+    score_total = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    marks_total = models.PositiveIntegerField(default=0)
+    weighted_score = models.DecimalField(max_digits=5, decimal_places=2, default=0)  # percentage
+    letter_grade = models.CharField(max_length=2)
+    position = models.PositiveIntegerField(blank=True, null=True)  # in the class, for the subject and term
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'subject_results'
+        unique_together = ['student', 'subject', 'term']
+        indexes = [
+            models.Index(fields=['class_taken', 'subject', 'term']),
+            models.Index(fields=['term', 'letter_grade']),
+        ]
+    
+    def __str__(self):
+        return f"{self.student.user.get_full_name()} - {self.subject.name} ({self.weighted_score}%)"
+
+
+class TermResult(models.Model):
+    """
+    A student's overall result for a term across their subjects, maintained
+    alongside SubjectResult
+    """
+    student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name='term_results')
+    term = models.ForeignKey(Term, on_delete=models.CASCADE, related_name='term_results')
+    class_taken = models.ForeignKey(Class, on_delete=models.CASCADE, related_name='term_results')
+    subjects = models.PositiveIntegerField(default=0)
+    assessments = models.PositiveIntegerField(default=0)
+    score_total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    average_score = models.DecimalField(max_digits=5, decimal_places=2, default=0)  # mean weighted subject score
+    letter_grade = models.CharField(max_length=2)
+    position = models.PositiveIntegerField(blank=True, null=True)  # in the class for the term
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'term_results'
+        unique_together = ['student', 'term']
+        ordering = ['position']
+        indexes = [
+            models.Index(fields=['class_taken', 'term', 'position']),
+        ]
+    
+    def __str__(self):
+        return f"{self.student.user.get_full_name()} - {self.term} ({self.average_score}%)"
+
+
 # Communication Models
 class Message(models.Model):
     MESSAGE_TYPES = (
@@ -620,7 +724,7 @@ class Message(models.Model):
     class Meta:
         db_table = 'messages'
         indexes = [
-            models.Index(fields=['sender', 'created_at']),
+            models.Index(fields=['sender', 'created_at', 'id']),
             models.Index(fields=['message_type']),
             models.Index(fields=['is_urgent']),
         ]
@@ -641,6 +745,56 @@ class MessageRecipient(models.Model):
     class Meta:
         db_table = 'message_recipients'
         unique_together = ['message', 'recipient']
+        indexes = [
+            models.Index(fields=['recipient', 'message']),
+        ]
+
+
+class Conversation(models.Model):
+    """
+    Materialized one-to-one thread between two users, kept up to date as
+    messages are sent so inbox reads never aggregate the raw message tables.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    participant_key = models.CharField(max_length=80, unique=True)
+    last_message = models.ForeignKey(
+        Message, on_delete=models.SET_NULL,
+        blank=True, null=True, related_name='+'
+    )
+    last_message_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'conversations'
+
+    @staticmethod
+    def key_for(user_id, other_user_id):
+        return ':'.join(sorted([str(user_id), str(other_user_id)]))
+
+    def __str__(self):
+        return self.participant_key
+
+
+class ConversationParticipant(models.Model):
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='participants')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_memberships')
+    counterpart = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    unread_count = models.PositiveIntegerField(default=0)
+    last_read_at = models.DateTimeField(blank=True, null=True)
+    last_message_at = models.DateTimeField(blank=True, null=True)
+    is_archived = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'conversation_participants'
+        unique_together = ['user', 'counterpart']
+        indexes = [
+            models.Index(fields=['user', '-last_message_at', '-id']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.get_full_name()} <-> {self.counterpart.get_full_name()}"
 
 
 class Announcement(models.Model):
@@ -660,6 +814,13 @@ class Announcement(models.Model):
         ('staff', 'Staff Only'),
     )
     
+    FANOUT_STATUSES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='announcements')
     title = models.CharField(max_length=200)
@@ -673,6 +834,11 @@ class Announcement(models.Model):
     is_pinned = models.BooleanField(default=False)
     attachments = models.FileField(upload_to='announcement_attachments/', blank=True, null=True)
     views_count = models.PositiveIntegerField(default=0)
+    fanout_status = models.CharField(max_length=20, choices=FANOUT_STATUSES, default='pending')
+    fanout_total = models.PositiveIntegerField(default=0)
+    fanout_sent = models.PositiveIntegerField(default=0)
+    fanout_started_at = models.DateTimeField(blank=True, null=True)
+    fanout_completed_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -759,6 +925,9 @@ class Post(models.Model):
     is_pinned = models.BooleanField(default=False)
     is_featured = models.BooleanField(default=False)
     is_published = models.BooleanField(default=True)
+    # Set once the post has been written to its audience's timelines; posts
+    # by high-follower authors stay unset and are merged in on read
+    fanned_out = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -767,6 +936,7 @@ class Post(models.Model):
         indexes = [
             models.Index(fields=['author', 'created_at']),
             models.Index(fields=['school', 'visibility']),
+            models.Index(fields=['school', 'created_at']),
             models.Index(fields=['post_type']),
             models.Index(fields=['is_published', 'created_at']),
             models.Index(fields=['is_featured']),
@@ -777,6 +947,24 @@ class Post(models.Model):
         return f"{self.author.get_full_name()}: {self.title}"
 
 
+class FeedEntry(models.Model):
+    """A post written to one user's home timeline when it was published"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feed_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='feed_entries')
+    # The post's created_at, copied so a timeline pages on its own index
+    posted_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'feed_entries'
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(fields=['user', 'posted_at', 'post']),
+        ]
+    
+    def __str__(self):
+        return f"{self.post_id} in the feed of {self.user_id}"
+
+
 class Comment(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
@@ -793,7 +981,7 @@ class Comment(models.Model):
         indexes = [
             models.Index(fields=['post', 'created_at']),
             models.Index(fields=['author']),
-            models.Index(fields=['parent']),
+            models.Index(fields=['parent', 'created_at']),
         ]
         ordering = ['created_at']
     
@@ -878,6 +1066,38 @@ class TeacherGroup(models.Model):
         return self.name
 
 
+
+class SearchTerm(models.Model):
+    """
+    One entry of the search index: a word, or a prefix of one, found in a
+    user, school, post or teacher group, weighted by the field it came from
+    """
+    KINDS = (
+        ('user', 'User'),
+        ('school', 'School'),
+        ('post', 'Post'),
+        ('group', 'Teacher Group'),
+    )
+    
+    term = models.CharField(max_length=20)
+    kind = models.CharField(max_length=10, choices=KINDS)
+    weight = models.PositiveSmallIntegerField(default=1)
+    # The indexed object is whichever of these matches `kind`; `school` is
+    # also the school a user, post or group is scoped to
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', blank=True, null=True)
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='+', blank=True, null=True)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+', blank=True, null=True)
+    group = models.ForeignKey(TeacherGroup, on_delete=models.CASCADE, related_name='+', blank=True, null=True)
+    
+    class Meta:
+        db_table = 'search_terms'
+        indexes = [
+            models.Index(fields=['kind', 'term', 'school']),
+        ]
+    
+    def __str__(self):
+        return f"{self.term} ({self.kind})"
+
 # Fee and Financial Models
 class FeeStructure(models.Model):
     FEE_TYPES = (
@@ -943,7 +1163,8 @@ class FeePayment(models.Model):
         indexes = [
             models.Index(fields=['student', 'payment_date']),
             models.Index(fields=['reference_number']),
-            models.Index(fields=['status']),
+            # Also serves status-only lookups; revenue series range-scan completed payments by date
+            models.Index(fields=['status', 'payment_date']),
         ]
     
     def __str__(self):
@@ -1093,3 +1314,108 @@ class Resource(models.Model):
     
     def __str__(self):
         return self.title
+
+
+class TaskRecord(models.Model):
+    """
+    Status of a background task, written when it is queued and updated by
+    the worker so callers can poll progress without a result backend.
+    """
+    STATUSES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('retrying', 'Retrying'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    )
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)  # also the Celery task id
+    name = models.CharField(max_length=200)
+    queue = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUSES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='task_records', blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        db_table = 'task_records'
+        indexes = [
+            models.Index(fields=['name', 'status']),
+            models.Index(fields=['created_at']),
+        ]
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+class ImportJob(models.Model):
+    """
+    A spreadsheet of students or grades being loaded for a school in the
+    background. Rows are processed in batches and `processed_rows` is
+    committed with each batch, so an interrupted import resumes after the
+    last batch it finished.
+    """
+    KINDS = (
+        ('students', 'Students'),
+        ('grades', 'Grades'),
+    )
+    
+    STATUSES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='import_jobs')
+    kind = models.CharField(max_length=20, choices=KINDS)
+    file = models.FileField(upload_to='imports/')
+    options = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUSES, default='pending')
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_rows = models.PositiveIntegerField(default=0)
+    updated_rows = models.PositiveIntegerField(default=0)
+    unchanged_rows = models.PositiveIntegerField(default=0)
+    failed_rows = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    task = models.ForeignKey(TaskRecord, on_delete=models.SET_NULL, related_name='import_jobs', blank=True, null=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='import_jobs', blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        db_table = 'import_jobs'
+        indexes = [
+            models.Index(fields=['school', 'created_at']),
+            models.Index(fields=['status']),
+        ]
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} import for {self.school.name} ({self.status})"
+
+
+class ImportRowError(models.Model):
+    """A spreadsheet row an import could not load, with the reasons by column"""
+    job = models.ForeignKey(ImportJob, on_delete=models.CASCADE, related_name='row_errors')
+    row_number = models.PositiveIntegerField()
+    errors = models.JSONField(default=dict)
+    data = models.JSONField(default=dict)
+    
+    class Meta:
+        db_table = 'import_row_errors'
+        unique_together = ['job', 'row_number']
+        ordering = ['job', 'row_number']
+    
+    def __str__(self):
+        return f"Row {self.row_number} of import {self.job_id}"
@@ -1,6 +1,14 @@
+from datetime import timedelta
+
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Avg, prefetch_related_objects
+from django.db.models.manager import BaseManager
 from .models import *
+from .services.counters import annotate_liked
+from .services.eager_loading import POST_COMMENTS_SHOWN, load_comment_details, recent_comments
 import logging
 
 logger = logging.getLogger(__name__)
@@ -299,16 +307,30 @@ class SchoolSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'slug', 'created_at', 'is_verified']
 
     def get_total_users(self, obj):
+        # Querysets from annotate_school_statistics carry the counts already
+        if hasattr(obj, 'stats_student_count'):
+            return obj.stats_student_count + obj.stats_teacher_count
         return obj.students.count() + obj.teachers.count()
     
     def get_statistics(self, obj):
+        if hasattr(obj, 'stats_current_session_id'):
+            if not obj.stats_current_session_id:
+                return {}
+            return {
+                'classes_count': obj.stats_classes_count,
+                'subjects_count': self._get_subjects_count(),
+                'enrollments_count': obj.stats_enrollments_count,
+                'posts_count': obj.stats_posts_count,
+                'events_count': obj.stats_events_count,
+            }
+        
         current_session = obj.sessions.filter(is_current=True).first()
         if not current_session:
             return {}
         
         return {
             'classes_count': obj.classes.filter(is_active=True).count(),
-            'subjects_count': Subject.objects.count(),
+            'subjects_count': self._get_subjects_count(),
             'enrollments_count': Enrollment.objects.filter(
                 class_enrolled__school=obj,
                 session=current_session,
@@ -319,6 +341,13 @@ class SchoolSerializer(serializers.ModelSerializer):
                 start_date__gte=timezone.now()
             ).count(),
         }
+    
+    def _get_subjects_count(self):
+        # Subjects are shared by all schools, so count them once per serializer
+        root = self.parent or self
+        if not hasattr(root, '_subjects_count'):
+            root._subjects_count = Subject.objects.count()
+        return root._subjects_count
 
 
 class AcademicSessionSerializer(serializers.ModelSerializer):
@@ -362,32 +391,41 @@ class ClassSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'name', 'level', 'arm', 'school', 'school_name',
             'class_teacher', 'class_teacher_name', 'capacity', 'current_students',
-            'students_count', 'classroom_number', 'subjects', 'is_active', 'created_at'
+            'enrollment_count', 'students_count', 'classroom_number', 'subjects',
+            'is_active', 'created_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'current_students']
 
     def get_enrollment_count(self, obj):
+        # Querysets planned with with_class_details carry the counts already
+        if hasattr(obj, 'active_enrollments_count'):
+            return obj.active_enrollments_count
         return obj.enrollments.filter(is_active=True).count()
     
     def get_students_count(self, obj):
+        if hasattr(obj, 'current_enrollments_count'):
+            return obj.current_enrollments_count
         current_session = obj.school.sessions.filter(is_current=True).first()
         if current_session:
             return obj.enrollments.filter(session=current_session, is_active=True).count()
         return 0
     
     def get_subjects(self, obj):
-        current_session = obj.school.sessions.filter(is_current=True).first()
-        if current_session:
+        if hasattr(obj, 'current_teacher_classes'):
+            teacher_classes = obj.current_teacher_classes
+        else:
+            current_session = obj.school.sessions.filter(is_current=True).first()
+            if not current_session:
+                return []
             teacher_classes = TeacherClass.objects.filter(
                 class_assigned=obj, session=current_session, is_active=True
             ).select_related('subject', 'teacher__user')
-            return [
-                {
-                    'subject': SubjectSerializer(tc.subject).data,
-                    'teacher': tc.teacher.user.get_full_name()
-                } for tc in teacher_classes
-            ]
-        return []
+        return [
+            {
+                'subject': SubjectSerializer(tc.subject).data,
+                'teacher': tc.teacher.user.get_full_name()
+            } for tc in teacher_classes
+        ]
 
 
 # Profile Serializers
@@ -428,8 +466,6 @@ class TeacherProfileSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     school_name = serializers.CharField(source='school.name', read_only=True)
     subjects_taught = serializers.SerializerMethodField()
-    classes_taught = serializers.SerializerMethodField()
-    subjects_taught = serializers.SerializerMethodField()
     classes_assigned = serializers.SerializerMethodField()
     teaching_load = serializers.SerializerMethodField()
 
@@ -444,27 +480,10 @@ class TeacherProfileSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
     def get_subjects_taught(self, obj):
-        current_session = AcademicSession.objects.filter(
-            school=obj.school, is_current=True
-        ).first()
-        if current_session:
-            return obj.subjects.filter(
-                teachersubject__session=current_session,
-                teachersubject__is_active=True
-            ).values_list('name', flat=True)
-        return []
-
-    def get_classes_taught(self, obj):
-        current_session = AcademicSession.objects.filter(
-            school=obj.school, is_current=True
-        ).first()
-        if current_session:
-            return obj.teacherclass_set.filter(
-                session=current_session, is_active=True
-            ).values_list('class_assigned__name', flat=True).distinct()
-        return []
-    
-    def get_subjects_taught(self, obj):
+        # Querysets planned with with_teacher_details carry the current session's rows
+        if hasattr(obj, 'current_teacher_subjects'):
+            subjects = list({ts.subject_id: ts.subject for ts in obj.current_teacher_subjects}.values())
+            return SubjectSerializer(subjects, many=True).data
         current_session = obj.school.sessions.filter(is_current=True).first()
         if current_session:
             subjects = Subject.objects.filter(
@@ -476,6 +495,9 @@ class TeacherProfileSerializer(serializers.ModelSerializer):
         return []
     
     def get_classes_assigned(self, obj):
+        if hasattr(obj, 'current_teacher_classes'):
+            classes = list({tc.class_assigned_id: tc.class_assigned for tc in obj.current_teacher_classes}.values())
+            return ClassSerializer(classes, many=True).data
         current_session = obj.school.sessions.filter(is_current=True).first()
         if current_session:
             classes = Class.objects.filter(
@@ -487,6 +509,8 @@ class TeacherProfileSerializer(serializers.ModelSerializer):
         return []
     
     def get_teaching_load(self, obj):
+        if hasattr(obj, 'current_teacher_classes'):
+            return len(obj.current_teacher_classes)
         current_session = obj.school.sessions.filter(is_current=True).first()
         if current_session:
             return TeacherClass.objects.filter(
@@ -498,7 +522,6 @@ class TeacherProfileSerializer(serializers.ModelSerializer):
 class StudentProfileSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     school_name = serializers.CharField(source='school.name', read_only=True)
-    current_class_name = serializers.CharField(source='current_class.name', read_only=True)
     age = serializers.ReadOnlyField()
     class_name = serializers.CharField(source='current_class.name', read_only=True)
     academic_performance = serializers.SerializerMethodField()
@@ -518,33 +541,48 @@ class StudentProfileSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at', 'admission_number']
 
     def get_academic_performance(self, obj):
-        current_term = Term.objects.filter(
-            session__school=obj.school,
-            session__is_current=True,
-            is_current=True
-        ).first()
-        
-        if current_term:
-            grades = Grade.objects.filter(
-                student=obj, term=current_term
-            ).values('subject__name').annotate(avg_score=Avg('score'))
-            
-            return {
-                'current_term_average': grades.aggregate(
-                    overall_avg=Avg('avg_score')
-                )['overall_avg'] or 0,
-                'subjects_performance': list(grades)
+        # Querysets planned with with_student_details carry the current term's results
+        if hasattr(obj, 'current_subject_results'):
+            results = obj.current_subject_results
+            term_result = obj.current_term_results[0] if obj.current_term_results else None
+        else:
+            current = {
+                'term__session__school': obj.school,
+                'term__session__is_current': True,
+                'term__is_current': True,
             }
-        return {'current_term_average': 0, 'subjects_performance': []}
+            results = SubjectResult.objects.filter(student=obj, **current).select_related('subject')
+            term_result = TermResult.objects.filter(student=obj, **current).first()
+
+        subjects = [
+            {
+                'subject__name': result.subject.name,
+                'avg_score': result.score_total / result.assessments,
+                'weighted_score': result.weighted_score,
+                'letter_grade': result.letter_grade,
+                'position': result.position,
+            }
+            for result in sorted(results, key=lambda result: result.subject.name)
+        ]
+        return {
+            'current_term_average': (
+                sum(subject['avg_score'] for subject in subjects) / len(subjects) if subjects else 0
+            ),
+            'class_position': term_result.position if term_result else None,
+            'subjects_performance': subjects
+        }
     
     def get_attendance_summary(self, obj):
-        thirty_days_ago = timezone.now().date() - timedelta(days=30)
-        attendances = Attendance.objects.filter(
-            student=obj, date__gte=thirty_days_ago
-        )
-        
-        total_days = attendances.count()
-        present_days = attendances.filter(status='present').count()
+        if hasattr(obj, 'recent_attendance_days'):
+            total_days = obj.recent_attendance_days
+            present_days = obj.recent_present_days
+        else:
+            thirty_days_ago = timezone.now().date() - timedelta(days=30)
+            attendances = Attendance.objects.filter(
+                student=obj, date__gte=thirty_days_ago
+            )
+            total_days = attendances.count()
+            present_days = attendances.filter(status='present').count()
         attendance_rate = (present_days / total_days * 100) if total_days > 0 else 0
         
         return {
@@ -557,7 +595,6 @@ class StudentProfileSerializer(serializers.ModelSerializer):
 class ParentProfileSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     children_count = serializers.SerializerMethodField()
-    children_details = serializers.SerializerMethodField()
     children_data = serializers.SerializerMethodField()
 
     class Meta:
@@ -573,12 +610,6 @@ class ParentProfileSerializer(serializers.ModelSerializer):
     def get_children_count(self, obj):
         return obj.children.count()
 
-    def get_children_details(self, obj):
-        return obj.children.values(
-            'user__first_name', 'user__last_name', 
-            'admission_number', 'current_class__name'
-        )
-    
     def get_children_data(self, obj):
         return StudentProfileSerializer(obj.children.all(), many=True).data
 
@@ -614,6 +645,21 @@ class AttendanceSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
+class AttendanceRegisterRowSerializer(serializers.Serializer):
+    """
+    One row of a bulk attendance register. Students and classes are taken
+    as ids and checked for the whole register at once when it is ingested,
+    rather than looked up row by row.
+    """
+    student = serializers.IntegerField()
+    class_attended = serializers.UUIDField()
+    date = serializers.DateField()
+    status = serializers.ChoiceField(choices=Attendance.ATTENDANCE_STATUS)
+    time_in = serializers.TimeField(required=False, allow_null=True)
+    time_out = serializers.TimeField(required=False, allow_null=True)
+    remarks = serializers.CharField(required=False, allow_blank=True, default='')
+
+
 class GradeSerializer(serializers.ModelSerializer):
     student_name = serializers.CharField(source='student.user.get_full_name', read_only=True)
     subject_name = serializers.CharField(source='subject.name', read_only=True)
@@ -635,6 +681,132 @@ class GradeSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'date_recorded']
 
 
+
+class GradeSheetRowSerializer(serializers.Serializer):
+    """One student's score on a grade sheet"""
+    student = serializers.IntegerField()
+    score = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0, max_value=100)
+    comments = serializers.CharField(required=False, allow_blank=True, default='')
+
+
+class GradeSheetSerializer(serializers.Serializer):
+    """
+    The scores of one assessment in one subject for a class, entered
+    together. Rows are validated separately so each can be reported on.
+    """
+    class_taken = serializers.PrimaryKeyRelatedField(queryset=Class.objects.select_related('school'))
+    subject = serializers.PrimaryKeyRelatedField(queryset=Subject.objects.all())
+    term = serializers.PrimaryKeyRelatedField(queryset=Term.objects.select_related('session'))
+    assessment_type = serializers.ChoiceField(choices=Grade.ASSESSMENT_TYPES)
+    total_marks = serializers.IntegerField(min_value=1, max_value=100, default=100)
+    grades = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+
+    def validate(self, data):
+        if data['term'].session.school_id != data['class_taken'].school_id:
+            raise serializers.ValidationError({'term': "Term does not belong to the class's school"})
+        return data
+
+
+class StudentImportRowSerializer(serializers.Serializer):
+    """
+    One row of a student import: the student's account and profile, their
+    class by name, and optionally a parent to create or link by email
+    """
+    first_name = serializers.CharField(max_length=150)
+    last_name = serializers.CharField(max_length=150)
+    email = serializers.EmailField()
+    phone_number = serializers.RegexField(r'^\+?1?\d{9,15}$', required=False)
+    password = serializers.CharField(required=False, write_only=True)
+    admission_number = serializers.CharField(max_length=50)
+    date_of_birth = serializers.DateField()
+    gender = serializers.ChoiceField(choices=StudentProfile.GENDER_CHOICES)
+    class_name = serializers.CharField(required=False)
+    admission_date = serializers.DateField(required=False)
+    address = serializers.CharField()
+    state_of_origin = serializers.CharField(max_length=100)
+    blood_group = serializers.ChoiceField(choices=StudentProfile.BLOOD_GROUP_CHOICES, required=False)
+    religion = serializers.CharField(max_length=50, required=False)
+    guardian_name = serializers.CharField(max_length=200)
+    guardian_phone = serializers.CharField(max_length=20)
+    guardian_email = serializers.EmailField(required=False)
+    emergency_contact = serializers.CharField(max_length=200, required=False)
+    emergency_phone = serializers.CharField(max_length=20, required=False)
+    parent_email = serializers.EmailField(required=False)
+    parent_first_name = serializers.CharField(max_length=150, required=False)
+    parent_last_name = serializers.CharField(max_length=150, required=False)
+    parent_phone = serializers.RegexField(r'^\+?1?\d{9,15}$', required=False)
+    relationship = serializers.ChoiceField(choices=ParentProfile.RELATIONSHIP_CHOICES, required=False)
+
+    def validate_email(self, value):
+        return value.lower()
+
+    def validate_parent_email(self, value):
+        return value.lower()
+
+    def validate_password(self, value):
+        try:
+            validate_password(value)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(list(e.messages))
+        return value
+
+    def validate(self, data):
+        if data.get('parent_email') and not (data.get('parent_first_name') and data.get('parent_last_name')):
+            raise serializers.ValidationError({'parent_first_name': 'A parent needs a first and last name'})
+        return data
+
+
+class GradeImportRowSerializer(serializers.Serializer):
+    """One score in a grade import; the term is chosen for the whole file"""
+    admission_number = serializers.CharField(max_length=50)
+    subject = serializers.CharField(max_length=10)
+    assessment_type = serializers.ChoiceField(choices=Grade.ASSESSMENT_TYPES)
+    score = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0, max_value=100)
+    total_marks = serializers.IntegerField(min_value=1, max_value=100, default=100)
+    comments = serializers.CharField(required=False, allow_blank=True, default='')
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    school_name = serializers.CharField(source='school.name', read_only=True)
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'school', 'school_name', 'kind', 'options', 'status',
+            'total_rows', 'processed_rows', 'created_rows', 'updated_rows',
+            'unchanged_rows', 'failed_rows', 'error', 'task',
+            'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
+
+class SubjectResultSerializer(serializers.ModelSerializer):
+    student_name = serializers.CharField(source='student.user.get_full_name', read_only=True)
+    subject_name = serializers.CharField(source='subject.name', read_only=True)
+
+    class Meta:
+        model = SubjectResult
+        fields = [
+            'id', 'student', 'student_name', 'subject', 'subject_name',
+            'class_taken', 'term', 'assessments', 'score_total', 'marks_total',
+            'weighted_score', 'letter_grade', 'position', 'updated_at'
+        ]
+        read_only_fields = fields
+
+
+class TermResultSerializer(serializers.ModelSerializer):
+    student_name = serializers.CharField(source='student.user.get_full_name', read_only=True)
+
+    class Meta:
+        model = TermResult
+        fields = [
+            'id', 'student', 'student_name', 'class_taken', 'term', 'subjects',
+            'assessments', 'score_total', 'average_score', 'letter_grade',
+            'position', 'updated_at'
+        ]
+        read_only_fields = fields
+
+
 # Communication Serializers
 class MessageSerializer(serializers.ModelSerializer):
     sender_name = serializers.CharField(source='sender.get_full_name', read_only=True)
@@ -645,9 +817,9 @@ class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
         fields = [
-            'id', 'sender', 'sender_name', 'recipients', 'recipients_data',
-            'subject', 'body', 'message_type', 'attachments', 'is_urgent',
-            'read_receipt_required', 'unread_count', 'created_at', 'updated_at'
+            'id', 'sender', 'sender_name', 'recipients', 'recipient_count',
+            'recipients_data', 'subject', 'body', 'message_type', 'attachments',
+            'is_urgent', 'read_receipt_required', 'unread_count', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
 
@@ -655,7 +827,8 @@ class MessageSerializer(serializers.ModelSerializer):
         return obj.recipients.count()
     
     def get_recipients_data(self, obj):
-        recipients = MessageRecipient.objects.filter(message=obj).select_related('recipient')
+        # Reads the prefetched rows when MessageViewSet planned the queryset
+        recipients = obj.messagerecipient_set.all()
         return [
             {
                 'user': UserSerializer(mr.recipient).data,
@@ -665,7 +838,7 @@ class MessageSerializer(serializers.ModelSerializer):
         ]
     
     def get_unread_count(self, obj):
-        return MessageRecipient.objects.filter(message=obj, is_read=False).count()
+        return sum(1 for mr in obj.messagerecipient_set.all() if not mr.is_read)
 
 
 class MessageRecipientSerializer(serializers.ModelSerializer):
@@ -687,9 +860,14 @@ class AnnouncementSerializer(serializers.ModelSerializer):
             'id', 'school', 'school_name', 'title', 'content',
             'announcement_type', 'target_audience', 'author', 'author_name',
             'is_published', 'publish_date', 'expire_date', 'is_pinned',
-            'attachments', 'views_count', 'created_at', 'updated_at'
+            'attachments', 'views_count', 'fanout_status', 'fanout_total',
+            'fanout_sent', 'fanout_started_at', 'fanout_completed_at',
+            'created_at', 'updated_at'
+        ]
+        read_only_fields = [
+            'id', 'views_count', 'fanout_status', 'fanout_total', 'fanout_sent',
+            'fanout_started_at', 'fanout_completed_at', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'views_count', 'created_at', 'updated_at']
 
 
 class NotificationSerializer(serializers.ModelSerializer):
@@ -706,6 +884,38 @@ class NotificationSerializer(serializers.ModelSerializer):
 
 
 # Social Serializers
+class PageListSerializer(serializers.ListSerializer):
+    """
+    Loads what the child serializer reads for the whole page at once when
+    the page was not fetched with it, so a page costs a fixed number of
+    queries wherever it comes from
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, BaseManager) else data)
+        request = self.context.get('request')
+        self.load(items, getattr(request, 'user', None))
+        return super().to_representation(items)
+
+    def load(self, items, user):
+        pass
+
+
+class PostListSerializer(PageListSerializer):
+
+    def load(self, items, user):
+        annotate_liked(items, user, PostLike, 'post')
+        pending = [post for post in items if not hasattr(post, 'recent_comments')]
+        if pending:
+            prefetch_related_objects(pending, recent_comments(user))
+
+
+class CommentListSerializer(PageListSerializer):
+
+    def load(self, items, user):
+        load_comment_details(items, user)
+
+
 class PostSerializer(serializers.ModelSerializer):
     author_name = serializers.CharField(source='author.get_full_name', read_only=True)
     school_name = serializers.CharField(source='school.name', read_only=True)
@@ -727,15 +937,23 @@ class PostSerializer(serializers.ModelSerializer):
             'id', 'likes_count', 'comments_count', 'shares_count', 
             'views_count', 'created_at', 'updated_at'
         ]
+        list_serializer_class = PostListSerializer
 
     def get_is_liked(self, obj):
+        # PostViewSet annotates whether the requesting user liked each post,
+        # and lists resolve it for the whole page otherwise
+        if hasattr(obj, 'liked_by_user'):
+            return obj.liked_by_user
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.likes.filter(user=request.user).exists()
         return False
     
     def get_comments_data(self, obj):
-        comments = obj.comments.filter(parent__isnull=True)[:5]
+        if hasattr(obj, 'recent_comments'):
+            comments = obj.recent_comments
+        else:
+            comments = obj.comments.filter(parent__isnull=True)[:POST_COMMENTS_SHOWN]
         return CommentSerializer(comments, many=True, context=self.context).data
 
 
@@ -751,23 +969,31 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'post', 'author', 'author_name', 'author_profile_picture',
             'parent', 'content', 'likes_count', 'is_liked',
-            'replies', 'is_approved', 'created_at', 'updated_at'
+            'replies_count', 'replies', 'is_approved', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'likes_count', 'created_at', 'updated_at']
+        list_serializer_class = CommentListSerializer
 
     def get_replies_count(self, obj):
+        # Querysets planned with with_comment_details carry the count already
+        if hasattr(obj, 'replies_total'):
+            return obj.replies_total
         return obj.replies.count()
 
     def get_is_liked(self, obj):
+        if hasattr(obj, 'liked_by_user'):
+            return obj.liked_by_user
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.likes.filter(user=request.user).exists()
         return False
     
     def get_replies(self, obj):
-        if obj.replies.exists():
-            return CommentSerializer(obj.replies.all()[:3], many=True, context=self.context).data
-        return []
+        # Only the replies loaded with the comment are nested; deeper ones
+        # are paged from CommentViewSet.replies
+        if not hasattr(obj, 'recent_replies'):
+            return []
+        return CommentSerializer(obj.recent_replies, many=True, context=self.context).data
 
 
 class ConnectionSerializer(serializers.ModelSerializer):
@@ -788,7 +1014,6 @@ class ConnectionSerializer(serializers.ModelSerializer):
 
 class TeacherGroupSerializer(serializers.ModelSerializer):
     creator_name = serializers.CharField(source='creator.user.get_full_name', read_only=True)
-    member_count = serializers.SerializerMethodField()
     school_name = serializers.CharField(source='school.name', read_only=True)
     members_count = serializers.SerializerMethodField()
     members_data = serializers.SerializerMethodField()
@@ -802,9 +1027,6 @@ class TeacherGroupSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at']
 
-    def get_member_count(self, obj):
-        return obj.members.count()
-    
     def get_members_count(self, obj):
         return obj.members.count()
     
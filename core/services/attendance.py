@@ -0,0 +1,301 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Exists, F, FilteredRelation, IntegerField, OuterRef, Q, Value, When
+
+from core.models import Attendance, AttendanceRollup, Class, StudentProfile, TeacherClass, TeacherProfile, Term
+
+STATUSES = ('present', 'absent', 'late', 'excused')
+COUNTERS = ('total',) + STATUSES
+# Keys per UPDATE statement when applying deltas
+APPLY_CHUNK_SIZE = 500
+# Records per INSERT ... ON CONFLICT statement when ingesting a register
+INGEST_CHUNK_SIZE = 500
+# Fields a resubmitted register overwrites on an existing record
+REGISTER_FIELDS = ('class_attended_id', 'status', 'time_in', 'time_out', 'remarks')
+
+
+def rollup_key(scope, entity_id, period, value='all'):
+    """Unique key of the rollup row for `entity_id` over a day, term or all time"""
+    return f"{scope}:{entity_id}:{period}:{value}"
+
+
+def attendance_fact(attendance):
+    """The parts of an attendance record its rollups depend on"""
+    date = Attendance._meta.get_field('date').to_python(attendance.date)
+    return (attendance.student_id, attendance.class_attended_id, date, attendance.status)
+
+
+def accumulate_rollups(facts, student_schools, terms, sign=1, rollups=None):
+    """
+    Add (or, with `sign=-1`, subtract) attendance `facts` to `rollups`, a
+    dict of rollup key to row fields and counter deltas.
+
+    `student_schools` maps student ids to school ids and `terms` holds
+    (term id, school id, start date, end date) tuples; a day outside every
+    term of its school only counts towards day and all-time rollups.
+    """
+    if rollups is None:
+        rollups = {}
+    terms_by_school = defaultdict(list)
+    for term_id, school_id, start_date, end_date in terms:
+        terms_by_school[school_id].append((term_id, start_date, end_date))
+
+    for student_id, class_id, date, status in facts:
+        school_id = student_schools.get(student_id)
+        if school_id is None:
+            continue
+        term_id = next(
+            (term_id for term_id, start_date, end_date in terms_by_school[school_id] if start_date <= date <= end_date),
+            None
+        )
+        scopes = [
+            ('school', school_id, {}),
+            ('class', class_id, {'class_attended_id': class_id}),
+            ('student', student_id, {'class_attended_id': class_id, 'student_id': student_id}),
+        ]
+        for scope, entity_id, fields in scopes:
+            periods = [('total', 'all', {})]
+            if term_id is not None:
+                periods.append(('term', term_id, {'term_id': term_id}))
+            if scope != 'student':
+                periods.append(('day', date.isoformat(), {'date': date}))
+            for period, value, period_fields in periods:
+                key = rollup_key(scope, entity_id, period, value)
+                if key not in rollups:
+                    rollups[key] = {
+                        'fields': {'scope': scope, 'period': period, 'school_id': school_id, **fields, **period_fields},
+                        'counts': dict.fromkeys(COUNTERS, 0),
+                    }
+                counts = rollups[key]['counts']
+                counts['total'] += sign
+                counts[status] += sign
+    return rollups
+
+
+def _resolve(facts):
+    """Schools of the facts' students and the terms their dates may fall in"""
+    student_schools = dict(
+        StudentProfile.objects.filter(pk__in={fact[0] for fact in facts}).values_list('pk', 'school_id')
+    )
+    dates = [fact[2] for fact in facts]
+    terms = Term.objects.filter(
+        session__school__in=set(student_schools.values()),
+        start_date__lte=max(dates),
+        end_date__gte=min(dates)
+    ).values_list('pk', 'session__school', 'start_date', 'end_date')
+    return student_schools, list(terms)
+
+
+def apply_attendance_changes(added=(), removed=()):
+    """
+    Bring the rollups up to date after attendance records (or facts from
+    `attendance_fact`) were added or removed; an edit removes the old fact
+    and adds the new one.
+
+    Every affected rollup is created if missing and then incremented in
+    place by the database, so concurrent writers never overwrite each
+    other's counts. Costs a handful of queries whatever the batch size.
+    """
+    added = [fact if isinstance(fact, tuple) else attendance_fact(fact) for fact in added]
+    removed = [fact if isinstance(fact, tuple) else attendance_fact(fact) for fact in removed]
+    if not added and not removed:
+        return
+
+    student_schools, terms = _resolve(added + removed)
+    rollups = accumulate_rollups(added, student_schools, terms)
+    # Only added facts may need a new row; removed ones were counted into
+    # existing rows, which may themselves be mid-way through a cascade delete
+    created = [AttendanceRollup(key=key, **rollup['fields']) for key, rollup in rollups.items()]
+    accumulate_rollups(removed, student_schools, terms, sign=-1, rollups=rollups)
+    rollups = {key: rollup for key, rollup in rollups.items() if any(rollup['counts'].values())}
+    if not rollups:
+        return
+
+    if created:
+        AttendanceRollup.objects.bulk_create(created, ignore_conflicts=True)
+    keys = list(rollups)
+    for offset in range(0, len(keys), APPLY_CHUNK_SIZE):
+        chunk = keys[offset:offset + APPLY_CHUNK_SIZE]
+        updates = {}
+        for counter in COUNTERS:
+            whens = [
+                When(key=key, then=Value(rollups[key]['counts'][counter]))
+                for key in chunk if rollups[key]['counts'][counter]
+            ]
+            if whens:
+                updates[counter] = F(counter) + Case(*whens, default=Value(0), output_field=IntegerField())
+        AttendanceRollup.objects.filter(key__in=chunk).update(**updates)
+
+
+def rebuild_attendance_rollups(schools=None):
+    """
+    Recompute the rollups of `schools` (every school by default) from the
+    attendance records, e.g. after loading attendance with raw SQL
+    """
+    attendances = Attendance.objects.all()
+    rollups = AttendanceRollup.objects.all()
+    if schools is not None:
+        attendances = attendances.filter(student__school__in=schools)
+        rollups = rollups.filter(school__in=schools)
+    rollups.delete()
+
+    facts = list(attendances.values_list('student_id', 'class_attended_id', 'date', 'status'))
+    if facts:
+        student_schools, terms = _resolve(facts)
+        rebuilt = accumulate_rollups(facts, student_schools, terms)
+        AttendanceRollup.objects.bulk_create(
+            [AttendanceRollup(key=key, **rollup['fields'], **rollup['counts']) for key, rollup in rebuilt.items()],
+            batch_size=APPLY_CHUNK_SIZE
+        )
+
+
+def rollup_counts(key):
+    """Counters of the rollup row `key`, zero when nothing was recorded"""
+    row = AttendanceRollup.objects.filter(key=key).values(*COUNTERS).first()
+    return row or dict.fromkeys(COUNTERS, 0)
+
+
+def markable_classes(user):
+    """
+    Classes `user` may take attendance for: any class for staff, their
+    schools' classes for proprietors and principals, and the classes a
+    teacher teaches or is class teacher of
+    """
+    if user.is_staff:
+        return Class.objects.all()
+    if user.user_type == 'proprietor':
+        return Class.objects.filter(school__proprietors__user=user)
+    if user.user_type == 'principal':
+        return Class.objects.filter(school__principals__user=user)
+    if user.user_type == 'teacher':
+        return Class.objects.filter(
+            Q(class_teacher__user=user)
+            | Exists(TeacherClass.objects.filter(teacher__user=user, class_assigned=OuterRef('pk')))
+        )
+    return Class.objects.none()
+
+
+def student_classes(student_ids):
+    """
+    School and classes of each student, in one query: their current class
+    and the class of any active enrollment
+    """
+    members = {}
+    rows = StudentProfile.objects.filter(pk__in=student_ids).annotate(
+        active_enrollment=FilteredRelation('enrollments', condition=Q(enrollments__is_active=True))
+    ).values_list('pk', 'school_id', 'current_class_id', 'active_enrollment__class_enrolled_id')
+    for student_id, school_id, current_class_id, enrolled_class_id in rows:
+        classes = members.setdefault(student_id, (school_id, set()))[1]
+        classes.update(class_id for class_id in (current_class_id, enrolled_class_id) if class_id)
+    return members
+
+
+def _rejected(field, message):
+    return {'outcome': 'rejected', 'errors': {field: [message]}}
+
+
+def ingest_attendance(rows, user):
+    """
+    Record a register: `rows` are validated AttendanceRegisterRowSerializer
+    items (row index to data), upserted on (student, date) so a resubmitted
+    register updates the day's records instead of failing.
+
+    Every row is checked against the classes `user` may mark and the
+    class's members with one query each. In one transaction, the students
+    are locked and the records already held for the day read with two
+    more, and the changes are written with one INSERT ... ON CONFLICT per
+    chunk and a batch of rollup updates.
+
+    Returns the outcome of each row: 'created', 'updated', 'unchanged' or
+    'rejected' with errors by field.
+    """
+    outcomes = {}
+    if not rows:
+        return outcomes
+
+    class_schools = dict(
+        markable_classes(user).filter(
+            pk__in={row['class_attended'] for row in rows.values()}
+        ).values_list('pk', 'school_id')
+    )
+    members = student_classes({row['student'] for row in rows.values()})
+
+    accepted = {}
+    for index, row in rows.items():
+        key = (row['student'], row['date'])
+        if row['class_attended'] not in class_schools:
+            outcomes[index] = _rejected('class_attended', 'Class not found or not one you can mark')
+        elif row['student'] not in members:
+            outcomes[index] = _rejected('student', 'Student not found')
+        elif row['class_attended'] not in members[row['student']][1]:
+            outcomes[index] = _rejected('student', 'Student is not a member of this class')
+        elif key in accepted:
+            outcomes[index] = _rejected('date', f"Duplicates row {accepted[key][0]} for this student and date")
+        else:
+            accepted[key] = (index, row)
+    if not accepted:
+        return outcomes
+
+    marked_by = None
+    if user.user_type == 'teacher':
+        marked_by = TeacherProfile.objects.filter(user=user).values_list('pk', flat=True).first()
+
+    update_fields = [field.removesuffix('_id') for field in REGISTER_FIELDS]
+    if marked_by is not None:
+        update_fields.append('marked_by')
+    students = {student for student, date in accepted}
+    writes = []
+    with transaction.atomic():
+        # Concurrent submissions for the same students queue here, so each
+        # diffs against the records the previous one wrote and the rollups
+        # are adjusted once per change. Locking the students also covers
+        # records neither submission has created yet.
+        list(StudentProfile.objects.select_for_update().filter(pk__in=students).order_by('pk').values_list('pk', flat=True))
+        existing = {
+            (record.student_id, record.date): record
+            for record in Attendance.objects.select_for_update().filter(
+                student__in=students,
+                date__in={date for student, date in accepted},
+            ).only('student_id', 'date', *REGISTER_FIELDS)
+        }
+
+        added, removed = [], []
+        for key, (index, row) in accepted.items():
+            record = Attendance(
+                student_id=row['student'],
+                class_attended_id=row['class_attended'],
+                date=row['date'],
+                status=row['status'],
+                time_in=row.get('time_in'),
+                time_out=row.get('time_out'),
+                remarks=row.get('remarks', ''),
+                marked_by_id=marked_by,
+            )
+            previous = existing.get(key)
+            if previous is None:
+                outcomes[index] = {'outcome': 'created'}
+            elif all(getattr(previous, field) == getattr(record, field) for field in REGISTER_FIELDS):
+                outcomes[index] = {'outcome': 'unchanged', 'id': previous.pk}
+                continue
+            else:
+                outcomes[index] = {'outcome': 'updated', 'id': previous.pk}
+                removed.append(attendance_fact(previous))
+            writes.append((index, record))
+            added.append(attendance_fact(record))
+
+        if writes:
+            # Signals are bypassed, so the rollups are brought up to date in
+            # one batch for the whole register
+            Attendance.objects.bulk_create(
+                [record for index, record in writes],
+                batch_size=INGEST_CHUNK_SIZE,
+                update_conflicts=True,
+                unique_fields=['student', 'date'],
+                update_fields=update_fields,
+            )
+            apply_attendance_changes(added=added, removed=removed)
+    for index, record in writes:
+        if record.pk is not None:
+            outcomes[index].setdefault('id', record.pk)
+    return outcomes
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models import Q
+
+from core.models import School, Subject, User
+
+from .search import words
+
+AUTOCOMPLETE_LIMIT = 10
+MAX_AUTOCOMPLETE_LIMIT = 20
+# Prefixes up to this long match most of an index, so their best matches
+# are worked out when it is built rather than scanned for on each lookup
+SHORT_PREFIX_LENGTH = 3
+
+
+class PrefixIndex:
+    """
+    An in-memory typeahead index: a sorted array of every suffix of each
+    entry's words ("federal government college", "government college",
+    "college"), searched with bisect, so a query matches entries having a
+    word that starts with it (or a run of words, for several).
+
+    Entries are given best first; matches at an entry's first word rank
+    above matches further in, then entries keep their order.
+    """
+
+    def __init__(self, entries):
+        self.payloads = []
+        keys = []
+        for rank, (payload, texts) in enumerate(entries):
+            self.payloads.append(payload)
+            for text in texts:
+                text_words = words(text)
+                for start in range(len(text_words)):
+                    keys.append((' '.join(text_words[start:]), start > 0, rank))
+        keys.sort()
+        self._keys = [key for key, later, rank in keys]
+        self._ranks = [(later, rank) for key, later, rank in keys]
+
+        shortlists = {}
+        for key, later, rank in keys:
+            for end in range(1, min(SHORT_PREFIX_LENGTH, len(key)) + 1):
+                shortlists.setdefault(key[:end], set()).add((later, rank))
+        self._shortlists = {
+            prefix: self._best(matches, MAX_AUTOCOMPLETE_LIMIT) for prefix, matches in shortlists.items()
+        }
+
+    def __len__(self):
+        return len(self.payloads)
+
+    @staticmethod
+    def _best(matches, limit):
+        best = {}
+        for later, rank in matches:
+            best[rank] = min(later, best.get(rank, True))
+        return [rank for rank, later in sorted(best.items(), key=lambda item: (item[1], item[0]))[:limit]]
+
+    def search(self, query, limit=AUTOCOMPLETE_LIMIT):
+        """Payloads of the best `limit` entries matching `query`"""
+        prefix = ' '.join(words(query))
+        if not prefix:
+            return []
+        if len(prefix) <= SHORT_PREFIX_LENGTH:
+            ranks = self._shortlists.get(prefix, [])[:limit]
+        else:
+            start = bisect_left(self._keys, prefix)
+            end = bisect_left(self._keys, prefix + '\U0010ffff', start)
+            ranks = self._best(self._ranks[start:end], limit)
+        return [self.payloads[rank] for rank in ranks]
+
+
+def _schools(scope):
+    schools = School.objects.filter(is_active=True).order_by('name').values('id', 'name', 'city', 'state')
+    return [
+        ({'id': str(school['id']), 'name': school['name'], 'city': school['city'], 'state': school['state']},
+         [school['name']])
+        for school in schools
+    ]
+
+
+def _subjects(scope):
+    subjects = Subject.objects.order_by('name').values('id', 'name', 'code')
+    return [
+        ({'id': str(subject['id']), 'name': subject['name'], 'code': subject['code']},
+         [subject['name'], subject['code']])
+        for subject in subjects
+    ]
+
+
+def school_member_filter(school_id):
+    """Users whose student, teacher or principal profile is at the school"""
+    return (
+        Q(student_profile__school_id=school_id)
+        | Q(teacher_profile__school_id=school_id)
+        | Q(principal_profile__school_id=school_id)
+    )
+
+
+def _users(scope):
+    users = User.objects.filter(is_active=True).filter(
+        school_member_filter(scope)
+    ).order_by('first_name', 'last_name').values('id', 'first_name', 'last_name', 'user_type').distinct()
+    return [
+        ({'id': str(user['id']), 'name': f"{user['first_name']} {user['last_name']}".strip(),
+          'user_type': user['user_type']},
+         [f"{user['first_name']} {user['last_name']}"])
+        for user in users
+    ]
+
+
+# What each kind is built from; users are indexed per school
+SOURCES = {
+    'schools': _schools,
+    'subjects': _subjects,
+    'users': _users,
+}
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_index(kind, scope=None):
+    """
+    The process's index of `kind` (for one school, for users), rebuilt
+    from the database once older than AUTOCOMPLETE_REFRESH_SECONDS or
+    after invalidate_autocomplete(kind)
+    """
+    key = (kind, str(scope) if scope is not None else None)
+    cached = _indexes.get(key)
+    if cached is not None and time.monotonic() - cached[1] < settings.AUTOCOMPLETE_REFRESH_SECONDS:
+        return cached[0]
+    with _lock:
+        cached = _indexes.get(key)
+        if cached is None or time.monotonic() - cached[1] >= settings.AUTOCOMPLETE_REFRESH_SECONDS:
+            cached = (PrefixIndex(SOURCES[kind](scope)), time.monotonic())
+            _indexes[key] = cached
+    return cached[0]
+
+
+def invalidate_autocomplete(kind):
+    """Rebuild this process's indexes of `kind` on their next lookup"""
+    with _lock:
+        for key in [key for key in _indexes if key[0] == kind]:
+            del _indexes[key]
+
+
+def autocomplete(kind, query, scope=None, limit=AUTOCOMPLETE_LIMIT):
+    """The best `limit` matches of `query` among `kind`"""
+    limit = max(1, min(limit, MAX_AUTOCOMPLETE_LIMIT))
+    return get_index(kind, scope).search(query, limit)
+
+
+def results_etag(results):
+    """
+    A strong ETag for a list of results, the same in every process that
+    finds the same matches
+    """
+    encoded = json.dumps(results, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return f'"{hashlib.sha256(encoded).hexdigest()[:32]}"'
@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from core.models import Grade, StudentProfile, Subject
+
+GRADE_COLUMNS = ['student', 'subject', 'assessment_type', 'score', 'total_marks']
+# Upper-exclusive percentage bins and their letters, lowest first
+LETTER_BINS = [-np.inf] + [bound for bound, letter in reversed(Grade.LETTER_GRADES)] + [np.inf]
+LETTER_LABELS = ['F'] + [letter for bound, letter in reversed(Grade.LETTER_GRADES)]
+
+
+def load_grades(class_obj, term):
+    """The class's grades for `term` as a DataFrame, fetched in one query"""
+    rows = Grade.objects.filter(class_taken=class_obj, term=term).values_list(*GRADE_COLUMNS)
+    frame = pd.DataFrame.from_records(list(rows), columns=GRADE_COLUMNS)
+    frame['score'] = frame['score'].astype(float)
+    frame['total_marks'] = frame['total_marks'].astype(float)
+    return frame
+
+
+def letters(scores):
+    """Letter grade of each percentage in `scores`, as in Grade.letter_grade"""
+    return pd.cut(scores, LETTER_BINS, right=False, labels=LETTER_LABELS).astype(object).where(scores.notna())
+
+
+def positions(scores):
+    """1 for the highest score, tied scores sharing the higher position"""
+    return scores.rank(method='min', ascending=False)
+
+
+def compute_broadsheet(grades, weights=None):
+    """
+    Everything a broadsheet shows, computed column-wise from a frame of
+    `GRADE_COLUMNS`:
+
+    - `assessments`: percentage per student × (subject, assessment type)
+    - `subjects`: weighted subject score per student × subject, each
+      assessment type weighted as for SubjectResult
+    - `subject_positions` and `subject_letters`, shaped like `subjects`
+    - `students`: subjects taken, total, average, letter and class position
+    - `subject_stats`: mean, population standard deviation, highest and
+      lowest subject score, and students graded, per subject
+    """
+    weights = weights or settings.GRADE_ASSESSMENT_WEIGHTS
+    grades = grades.assign(
+        percentage=grades['score'] * 100 / grades['total_marks'],
+        weight=grades['assessment_type'].map(weights).fillna(1).astype(float),
+    )
+    grades['weighted'] = grades['percentage'] * grades['weight']
+
+    assessments = grades.pivot_table(
+        index='student', columns=['subject', 'assessment_type'], values='percentage', aggfunc='first'
+    )
+    sums = grades.groupby(['student', 'subject'])[['weighted', 'weight']].sum()
+    subjects = (sums['weighted'] / sums['weight']).round(2).unstack('subject')
+
+    students = pd.DataFrame({
+        'subjects': subjects.count(axis=1),
+        'total': subjects.sum(axis=1).round(2),
+        'average': subjects.mean(axis=1).round(2),
+    })
+    students['letter'] = letters(students['average'])
+    students['position'] = positions(students['average'])
+
+    subject_stats = pd.DataFrame({
+        'mean': subjects.mean().round(2),
+        'std': subjects.std(ddof=0).round(2),
+        'highest': subjects.max(),
+        'lowest': subjects.min(),
+        'graded': subjects.count(),
+    })
+
+    return {
+        'assessments': assessments,
+        'subjects': subjects,
+        'subject_positions': subjects.apply(positions),
+        'subject_letters': subjects.apply(letters),
+        'students': students.sort_values(['position', 'total'], ascending=[True, False]),
+        'subject_stats': subject_stats,
+    }
+
+
+def _value(value):
+    """JSON-friendly scalar: NaN becomes None and whole positions ints"""
+    if pd.isna(value):
+        return None
+    if isinstance(value, (np.integer, np.floating)):
+        value = value.item()
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+
+def class_broadsheet(class_obj, term, weights=None):
+    """
+    The end-of-term broadsheet of `class_obj`: every student's assessment
+    percentages, weighted score, letter and position in every subject,
+    their overall totals and positions, and per-subject statistics
+    """
+    grades = load_grades(class_obj, term)
+    if grades.empty:
+        return {'class': class_obj.name, 'term': str(term), 'subjects': [], 'students': []}
+
+    sheet = compute_broadsheet(grades, weights)
+    subjects = Subject.objects.in_bulk(list(sheet['subjects'].columns))
+    names = {
+        student.pk: student.user.get_full_name()
+        for student in StudentProfile.objects.filter(pk__in=list(sheet['students'].index)).select_related('user')
+    }
+
+    # Flatten the matrices to one row per graded cell before building the
+    # nested output, rather than indexing the frames cell by cell
+    scores = {}
+    cells = pd.DataFrame({
+        'score': sheet['subjects'].stack(),
+        'letter': sheet['subject_letters'].stack(),
+        'position': sheet['subject_positions'].stack(),
+    })
+    for (student_id, subject_id), score, letter, position in cells.itertuples(name=None):
+        scores.setdefault(student_id, {})[str(subject_id)] = {
+            'assessments': {}, 'score': _value(score), 'letter': letter, 'position': _value(position)
+        }
+    percentages = sheet['assessments'].stack(['subject', 'assessment_type'], future_stack=True).dropna().round(2)
+    for (student_id, subject_id, assessment_type), percentage in percentages.items():
+        scores[student_id][str(subject_id)]['assessments'][assessment_type] = _value(percentage)
+
+    stats = sheet['subject_stats']
+    averages = sheet['students']['average']
+    return {
+        'class': class_obj.name,
+        'term': str(term),
+        'class_average': _value(round(averages.mean(), 2)),
+        'class_std': _value(round(averages.std(ddof=0), 2)),
+        'subjects': sorted(
+            [
+                {
+                    'id': subject_id,
+                    'name': subjects[subject_id].name,
+                    'code': subjects[subject_id].code,
+                    **{column: _value(value) for column, value in row.items()},
+                }
+                for subject_id, row in stats.to_dict('index').items()
+            ],
+            key=lambda subject: subject['name']
+        ),
+        'students': [
+            {
+                'id': student_id,
+                'name': names.get(student_id, ''),
+                **{column: _value(value) for column, value in row.items()},
+                'scores': scores.get(student_id, {}),
+            }
+            for student_id, row in sheet['students'].to_dict('index').items()
+        ],
+    }
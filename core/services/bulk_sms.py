@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+
+from .sms_providers import delivery_report, get_provider
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 8
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens are added per second up to
+    `capacity`, and `acquire` blocks until enough are available.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_rate_limiter(provider_name):
+    """
+    Return the process-wide token bucket for a provider, sized from
+    settings.SMS_RATE_LIMITS (API requests per second), or None if the
+    provider is not rate limited
+    """
+    rate = getattr(settings, 'SMS_RATE_LIMITS', {}).get(provider_name)
+    if not rate:
+        return None
+    with _buckets_lock:
+        if provider_name not in _buckets:
+            _buckets[provider_name] = TokenBucket(rate)
+        return _buckets[provider_name]
+
+
+def send_bulk(phone_numbers, message, sender_name="EMSU", provider=None, max_workers=None, on_progress=None):
+    """
+    Send one message to many numbers and return a delivery report per
+    number, in the order given (duplicates are sent once).
+
+    Numbers are grouped into the provider's multi-recipient batch size and
+    the batches sent from a bounded thread pool sharing the provider's HTTP
+    session, each request first taking a token from the provider's rate
+    limiter. `on_progress(done, total)` is called from the calling thread as
+    batches finish.
+    """
+    provider = provider or get_provider()
+    max_workers = max_workers or getattr(settings, 'SMS_BULK_MAX_WORKERS', DEFAULT_MAX_WORKERS)
+    numbers = list(dict.fromkeys(phone_numbers))
+    if not numbers:
+        return []
+
+    size = provider.max_batch_size
+    batches = [numbers[i:i + size] for i in range(0, len(numbers), size)]
+    limiter = get_rate_limiter(provider.name)
+
+    def send(batch):
+        if limiter:
+            limiter.acquire()
+        try:
+            return provider.send(batch, message, sender_name)
+        except Exception as e:
+            logger.error(f"{provider.name} bulk SMS batch error: {str(e)}")
+            return [delivery_report(number, False, 'error', error=str(e)) for number in batch]
+
+    results = {}
+    done = 0
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+        futures = {pool.submit(send, batch): index for index, batch in enumerate(batches)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            done += len(batches[futures[future]])
+            if on_progress:
+                on_progress(done, len(numbers))
+
+    reports = [report for index in range(len(batches)) for report in results[index]]
+    sent = sum(1 for report in reports if report['success'])
+    logger.info(f"Bulk SMS via {provider.name}: {sent}/{len(reports)} accepted")
+    return reports
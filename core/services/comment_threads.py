@@ -0,0 +1,48 @@
+from django.db.models import Q
+
+from core.models import Comment
+from core.utils.pagination import decode_keyset_cursor, encode_keyset_cursor
+
+from .eager_loading import COMMENT_REPLY_DEPTH, with_comment_details
+
+THREAD_PAGE_SIZE = 20
+MAX_THREAD_PAGE_SIZE = 100
+
+
+def get_comment_page(post, user, cursor=None, limit=THREAD_PAGE_SIZE, depth=COMMENT_REPLY_DEPTH):
+    """
+    Fetch one page of a post's top-level comments, oldest first, keyset
+    paginated on (created_at, id) over the (post, created_at) index.
+
+    Each comment carries its reply count, whether `user` liked it and its
+    first replies `depth` levels down, loaded with one windowed query per
+    level; the rest of a thread is paged with get_reply_page.
+
+    Returns (comments, next_cursor).
+    """
+    comments = Comment.objects.filter(post=post, parent__isnull=True)
+    return _page(with_comment_details(comments, user, depth), cursor, limit)
+
+
+def get_reply_page(comment, user, cursor=None, limit=THREAD_PAGE_SIZE, depth=COMMENT_REPLY_DEPTH - 1):
+    """
+    Fetch one page of the replies to `comment`, planned and paginated as
+    get_comment_page; a reply's own first replies come `depth` levels down.
+
+    Returns (replies, next_cursor).
+    """
+    return _page(with_comment_details(Comment.objects.filter(parent=comment), user, depth), cursor, limit)
+
+
+def _page(queryset, cursor, limit):
+    limit = max(1, min(limit, MAX_THREAD_PAGE_SIZE))
+    anchor = decode_keyset_cursor(cursor)
+    if anchor:
+        at, comment_id = anchor
+        queryset = queryset.filter(Q(created_at__gt=at) | Q(created_at=at, id__gt=comment_id))
+    rows = list(queryset.order_by('created_at', 'id')[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_keyset_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
@@ -0,0 +1,243 @@
+import logging
+
+from django.db import transaction
+from django.db.models import F, Q, Subquery
+from django.utils import timezone
+
+from core.models import Conversation, ConversationParticipant, Message, MessageRecipient
+from core.utils.pagination import InvalidCursor, decode_keyset_cursor, encode_keyset_cursor
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_PAGE_SIZE = 20
+MAX_CONVERSATION_PAGE_SIZE = 100
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 100
+PREVIEW_LENGTH = 100
+
+
+def add_recipients(message, recipients):
+    """
+    Attach recipients to a freshly created message and fold it into the
+    materialized conversations between the sender and each recipient.
+
+    Runs a fixed number of queries whatever the recipient count, and in a
+    single transaction so the inbox never disagrees with the message tables.
+    """
+    recipients = [recipient for recipient in recipients if recipient.pk != message.sender_id]
+    if not recipients:
+        return []
+
+    with transaction.atomic():
+        MessageRecipient.objects.bulk_create([
+            MessageRecipient(message=message, recipient=recipient)
+            for recipient in recipients
+        ])
+
+        conversations = _get_or_create_conversations(
+            message.sender_id, [recipient.pk for recipient in recipients]
+        )
+        conversation_ids = [conversation.pk for conversation in conversations.values()]
+
+        Conversation.objects.filter(id__in=conversation_ids).filter(
+            Q(last_message_at__isnull=True) | Q(last_message_at__lte=message.created_at)
+        ).update(last_message=message, last_message_at=message.created_at, updated_at=timezone.now())
+
+        ConversationParticipant.objects.filter(
+            conversation_id__in=conversation_ids, user_id=message.sender_id
+        ).update(last_message_at=message.created_at, last_read_at=message.created_at)
+
+        ConversationParticipant.objects.filter(
+            conversation_id__in=conversation_ids
+        ).exclude(user_id=message.sender_id).update(
+            last_message_at=message.created_at,
+            unread_count=F('unread_count') + 1
+        )
+
+    return recipients
+
+
+def _get_or_create_conversations(user_id, counterpart_ids):
+    """Return {counterpart_id: Conversation}, creating any missing threads"""
+    keys = {Conversation.key_for(user_id, counterpart_id): counterpart_id for counterpart_id in counterpart_ids}
+    existing = {
+        conversation.participant_key: conversation
+        for conversation in Conversation.objects.filter(participant_key__in=keys)
+    }
+
+    missing = [key for key in keys if key not in existing]
+    if missing:
+        Conversation.objects.bulk_create(
+            [Conversation(participant_key=key) for key in missing],
+            ignore_conflicts=True
+        )
+        # Re-read rather than trusting bulk_create: a concurrent sender may
+        # have created some of these threads first.
+        created = Conversation.objects.filter(participant_key__in=missing)
+        existing.update({conversation.participant_key: conversation for conversation in created})
+
+        participants = []
+        for key in missing:
+            conversation = existing[key]
+            counterpart_id = keys[key]
+            participants.append(ConversationParticipant(
+                conversation=conversation, user_id=user_id, counterpart_id=counterpart_id
+            ))
+            participants.append(ConversationParticipant(
+                conversation=conversation, user_id=counterpart_id, counterpart_id=user_id
+            ))
+        ConversationParticipant.objects.bulk_create(participants, ignore_conflicts=True)
+
+    return {keys[key]: conversation for key, conversation in existing.items()}
+
+
+def mark_conversation_read(user, counterpart):
+    """Mark every message the counterpart sent to the user as read"""
+    now = timezone.now()
+    with transaction.atomic():
+        updated = MessageRecipient.objects.filter(
+            message__sender=counterpart,
+            recipient=user,
+            is_read=False
+        ).update(is_read=True, read_at=now)
+        ConversationParticipant.objects.filter(
+            user=user, counterpart=counterpart
+        ).update(unread_count=0, last_read_at=now)
+    return updated
+
+
+def mark_message_read(user, message_id):
+    """
+    Mark a single received message as read and decrement the unread counter
+    of the conversation it belongs to. Returns True if anything changed.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        updated = MessageRecipient.objects.filter(
+            message_id=message_id,
+            recipient=user,
+            is_read=False
+        ).update(is_read=True, read_at=now)
+        if updated:
+            ConversationParticipant.objects.filter(
+                user=user,
+                counterpart_id=Subquery(Message.objects.filter(id=message_id).values('sender_id')[:1]),
+                unread_count__gt=0
+            ).update(unread_count=F('unread_count') - 1, last_read_at=now)
+    return bool(updated)
+
+
+def get_conversation_summaries(user, cursor=None, limit=CONVERSATION_PAGE_SIZE):
+    """
+    Build one page of the user's inbox, one entry per counterpart, with a
+    single indexed scan of the user's conversation memberships.
+
+    Returns a tuple of (conversations, next_cursor).
+    """
+    position = decode_keyset_cursor(cursor, id_type=int)
+    limit = max(1, min(limit, MAX_CONVERSATION_PAGE_SIZE))
+
+    memberships = (
+        ConversationParticipant.objects
+        .filter(user=user, last_message_at__isnull=False)
+        .select_related('counterpart', 'conversation__last_message')
+        .order_by('-last_message_at', '-id')
+    )
+    if position:
+        last_at, last_id = position
+        memberships = memberships.filter(
+            Q(last_message_at__lt=last_at) |
+            Q(last_message_at=last_at, id__lt=last_id)
+        )
+
+    rows = list(memberships[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_keyset_cursor(last.last_message_at, last.id)
+
+    return [_serialize_summary(user, membership) for membership in rows], next_cursor
+
+
+def get_thread_page(user, other_user, before=None, after=None, limit=MESSAGE_PAGE_SIZE):
+    """
+    Fetch one page of the message history between two users, keyset
+    paginated on (created_at, id).
+
+    `before` pages back towards older messages, `after` forward towards
+    newer ones; with neither the newest page is returned. Each direction of
+    the thread is read with its own bounded query on the
+    (sender, created_at, id) index, so the cost is O(page) not O(thread).
+
+    Returns (messages, has_older, has_newer) with messages oldest first.
+    """
+    if before and after:
+        raise InvalidCursor('Use either before or after, not both')
+    limit = max(1, min(limit, MAX_MESSAGE_PAGE_SIZE))
+    anchor = decode_keyset_cursor(after or before)
+    forward = after is not None
+
+    senders = {user.pk: user, other_user.pk: other_user}
+    branches = [
+        Message.objects.filter(sender=user, messagerecipient__recipient=other_user),
+        Message.objects.filter(sender=other_user, messagerecipient__recipient=user),
+    ]
+    if forward:
+        ordering = ('created_at', 'id')
+    else:
+        ordering = ('-created_at', '-id')
+
+    rows = []
+    for branch in branches:
+        if anchor:
+            at, message_id = anchor
+            if forward:
+                branch = branch.filter(Q(created_at__gt=at) | Q(created_at=at, id__gt=message_id))
+            else:
+                branch = branch.filter(Q(created_at__lt=at) | Q(created_at=at, id__lt=message_id))
+        rows.extend(branch.order_by(*ordering)[:limit + 1])
+
+    rows.sort(key=lambda message: (message.created_at, message.id), reverse=not forward)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    for message in rows:
+        message.sender = senders[message.sender_id]
+
+    if forward:
+        return rows, anchor is not None, has_more
+    rows.reverse()
+    return rows, has_more, anchor is not None
+
+
+def message_cursor(message):
+    """Encode the keyset position of a message for the history endpoints"""
+    return encode_keyset_cursor(message.created_at, message.id)
+
+
+
+def _serialize_summary(user, membership):
+    participant = membership.counterpart
+    message = membership.conversation.last_message
+    last_message = None
+    if message is not None:
+        last_message = {
+            'id': str(message.id),
+            'subject': message.subject,
+            'body': message.body[:PREVIEW_LENGTH] + '...' if len(message.body) > PREVIEW_LENGTH else message.body,
+            'is_urgent': message.is_urgent,
+            'created_at': message.created_at.isoformat(),
+            'is_read': message.sender_id == user.id or membership.unread_count == 0
+        }
+    return {
+        'conversation_id': str(membership.conversation_id),
+        'participant': {
+            'id': str(participant.id),
+            'name': participant.get_full_name(),
+            'email': participant.email,
+            'profile_picture': participant.profile_picture.url if participant.profile_picture else None
+        },
+        'last_message': last_message,
+        'unread_count': membership.unread_count,
+        'last_read_at': membership.last_read_at.isoformat() if membership.last_read_at else None
+    }
@@ -0,0 +1,78 @@
+from django.db import transaction
+from django.db.models import F, OuterRef, QuerySet
+from django.db.models.functions import Greatest
+
+from core.models import Comment, CommentLike, Post, PostLike
+
+from .schools import count_subquery
+
+
+def adjust_counter(model, pk, field, delta):
+    """
+    Add `delta` to a denormalized counter with a single UPDATE, so
+    concurrent writers never overwrite each other's counts
+    """
+    model.objects.filter(pk=pk).update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def deleted_with(origin, *models):
+    """
+    Whether a cascaded delete started from one of `models`, whose counters
+    then go with them and need no adjusting
+    """
+    if isinstance(origin, QuerySet):
+        return origin.model in models
+    return isinstance(origin, models)
+
+
+def toggle_post_like(post, user):
+    """
+    Like `post` as `user`, or take back their like if they already have;
+    the PostLike receivers keep likes_count in step.
+
+    Returns (liked, likes_count).
+    """
+    with transaction.atomic():
+        removed, _ = PostLike.objects.filter(post=post, user=user).delete()
+        if not removed:
+            # A concurrent like by the same user gets the existing row
+            PostLike.objects.get_or_create(post=post, user=user)
+        likes_count = Post.objects.filter(pk=post.pk).values_list('likes_count', flat=True).get()
+    return not removed, likes_count
+
+
+def annotate_liked(objects, user, like_model, field):
+    """
+    Set `liked_by_user` on each of `objects` (posts or comments) that was
+    not loaded with it, resolving the whole list with one query
+    """
+    pending = [obj for obj in objects if not hasattr(obj, 'liked_by_user')]
+    if not pending:
+        return
+    liked = set()
+    if user is not None and user.is_authenticated:
+        liked = set(like_model.objects.filter(
+            user=user, **{f'{field}__in': [obj.pk for obj in pending]}
+        ).values_list(f'{field}_id', flat=True))
+    for obj in pending:
+        obj.liked_by_user = obj.pk in liked
+
+
+def recount_counters(posts=None):
+    """
+    Recompute post like and comment counts and comment like counts (of
+    `posts`, if given) from their rows, e.g. after likes or comments were
+    written with bulk_create or QuerySet.update()
+    """
+    post_queryset = Post.objects.all()
+    comment_queryset = Comment.objects.all()
+    if posts is not None:
+        post_queryset = post_queryset.filter(pk__in=posts)
+        comment_queryset = comment_queryset.filter(post__in=posts)
+    post_queryset.update(
+        likes_count=count_subquery(PostLike.objects.filter(post=OuterRef('pk'))),
+        comments_count=count_subquery(Comment.objects.filter(post=OuterRef('pk'))),
+    )
+    comment_queryset.update(
+        likes_count=count_subquery(CommentLike.objects.filter(comment=OuterRef('pk'))),
+    )
@@ -0,0 +1,22 @@
+def grouped(queryset, field, **aggregates):
+    """
+    Compute `aggregates` for every value of `field` in one GROUP BY query
+    and return them keyed by that value
+    """
+    rows = queryset.order_by().values(field).annotate(**aggregates)
+    return {row.pop(field): row for row in rows}
+
+
+def average_score(totals):
+    """
+    Mean grade score from `total` and `assessments` sums over results,
+    zero when nothing was graded
+    """
+    if not totals or not totals['assessments']:
+        return 0
+    return totals['total'] / totals['assessments']
+
+
+def rate(part, whole):
+    """Percentage of `whole` that `part` is, treating an empty whole as 1"""
+    return (part / max(whole, 1)) * 100
@@ -0,0 +1,137 @@
+from datetime import timedelta
+
+from django.db.models import Count, Exists, F, OuterRef, Prefetch, prefetch_related_objects
+from django.utils import timezone
+
+from core.models import (
+    Attendance, Class, Comment, CommentLike, Enrollment, SubjectResult, TeacherClass, TeacherSubject, TermResult
+)
+
+from .counters import annotate_liked
+from .schools import count_subquery
+
+# Window StudentProfileSerializer.attendance_summary reports on
+ATTENDANCE_SUMMARY_DAYS = 30
+# How many replies CommentSerializer nests per comment, and how many levels are prefetched
+COMMENT_REPLIES_SHOWN = 3
+COMMENT_REPLY_DEPTH = 2
+# How many top-level comments PostSerializer embeds per post
+POST_COMMENTS_SHOWN = 5
+
+
+def with_class_details(queryset):
+    """
+    Load everything ClassSerializer reads: the school and class teacher,
+    enrollment counts, and the current session's subject/teacher pairs
+    """
+    enrollments = Enrollment.objects.filter(class_enrolled=OuterRef('pk'), is_active=True)
+    teacher_classes = TeacherClass.objects.filter(
+        session__school=F('class_assigned__school'),
+        session__is_current=True,
+        is_active=True
+    ).select_related('subject', 'teacher__user')
+
+    return queryset.select_related('school', 'class_teacher__user').annotate(
+        active_enrollments_count=count_subquery(enrollments),
+        current_enrollments_count=count_subquery(enrollments.filter(
+            session__school=OuterRef('school'), session__is_current=True
+        )),
+    ).prefetch_related(
+        Prefetch('teacherclass_set', queryset=teacher_classes, to_attr='current_teacher_classes')
+    )
+
+
+def with_teacher_details(queryset):
+    """
+    Load everything TeacherProfileSerializer reads: the user and school and
+    the current session's subjects and classes, the classes themselves
+    planned with `with_class_details`
+    """
+    current = {
+        'session__school': F('teacher__school'),
+        'session__is_current': True,
+        'is_active': True,
+    }
+    teacher_subjects = TeacherSubject.objects.filter(**current).select_related('subject').order_by('subject__name')
+    teacher_classes = TeacherClass.objects.filter(**current).order_by('class_assigned__level', 'class_assigned__arm')
+
+    return queryset.select_related('user', 'school').prefetch_related(
+        Prefetch('teachersubject_set', queryset=teacher_subjects, to_attr='current_teacher_subjects'),
+        Prefetch('teacherclass_set', queryset=teacher_classes, to_attr='current_teacher_classes'),
+        Prefetch('current_teacher_classes__class_assigned', queryset=with_class_details(Class.objects.all())),
+    )
+
+
+def with_student_details(queryset):
+    """
+    Load everything StudentProfileSerializer reads: the user, school and
+    class, recent attendance counts and the current term's results
+    """
+    since = timezone.now().date() - timedelta(days=ATTENDANCE_SUMMARY_DAYS)
+    attendances = Attendance.objects.filter(student=OuterRef('pk'), date__gte=since)
+    current = {
+        'term__session__school': F('student__school'),
+        'term__session__is_current': True,
+        'term__is_current': True,
+    }
+
+    return queryset.select_related('user', 'school', 'current_class').annotate(
+        recent_attendance_days=count_subquery(attendances),
+        recent_present_days=count_subquery(attendances.filter(status='present')),
+    ).prefetch_related(
+        Prefetch(
+            'subject_results',
+            queryset=SubjectResult.objects.filter(**current).select_related('subject'),
+            to_attr='current_subject_results'
+        ),
+        Prefetch('term_results', queryset=TermResult.objects.filter(**current), to_attr='current_term_results'),
+    )
+
+
+def with_comment_details(queryset, user=None, depth=COMMENT_REPLY_DEPTH):
+    """
+    Load everything CommentSerializer reads: the author, reply count,
+    whether `user` liked the comment and, `depth` levels down, the first
+    replies planned the same way
+    """
+    queryset = queryset.select_related('author').annotate(
+        replies_total=count_subquery(Comment.objects.filter(parent=OuterRef('pk')))
+    )
+    if user is not None and user.is_authenticated:
+        queryset = queryset.annotate(
+            liked_by_user=Exists(CommentLike.objects.filter(comment=OuterRef('pk'), user=user))
+        )
+    if depth:
+        replies = with_comment_details(Comment.objects.all(), user, depth - 1)[:COMMENT_REPLIES_SHOWN]
+        queryset = queryset.prefetch_related(
+            Prefetch('replies', queryset=replies, to_attr='recent_replies')
+        )
+    return queryset
+
+
+def load_comment_details(comments, user=None, depth=COMMENT_REPLY_DEPTH):
+    """
+    Attach what with_comment_details would have loaded to comments fetched
+    without it: reply counts and liked flags with one query each, and the
+    first replies of each level with one windowed query per level
+    """
+    pending = [comment for comment in comments if not hasattr(comment, 'replies_total')]
+    if not pending:
+        return
+    counts = dict(
+        Comment.objects.filter(parent__in=pending).order_by().values('parent').annotate(
+            total=Count('pk')
+        ).values_list('parent', 'total')
+    )
+    for comment in pending:
+        comment.replies_total = counts.get(comment.pk, 0)
+    annotate_liked(pending, user, CommentLike, 'comment')
+    if depth:
+        replies = with_comment_details(Comment.objects.all(), user, depth - 1)[:COMMENT_REPLIES_SHOWN]
+        prefetch_related_objects(pending, Prefetch('replies', queryset=replies, to_attr='recent_replies'))
+
+
+def recent_comments(user=None):
+    """Prefetch of the first top-level comments PostSerializer embeds, planned for `user`"""
+    comments = with_comment_details(Comment.objects.filter(parent__isnull=True), user)[:POST_COMMENTS_SHOWN]
+    return Prefetch('comments', queryset=comments, to_attr='recent_comments')
@@ -0,0 +1,225 @@
+import csv
+import datetime
+import tempfile
+
+from django.db.models import DateTimeField, Exists, OuterRef, Q
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from openpyxl import Workbook
+
+from core.models import Attendance, FeePayment, FeeStructure, Grade, TeacherClass, Term
+
+from .revenue import local_midnight
+
+FILE_FORMATS = ('csv', 'xlsx')
+# Rows fetched from the database at a time while streaming an export
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Export:
+    """
+    A tabular export: the rows of `model` in `order`, one column per
+    (heading, field) pair; fields are values_list lookups, and `display`
+    maps a field to a function formatting its values
+    """
+
+    def __init__(self, model, columns, class_field, order, display=None, date_field=None):
+        self.model = model
+        self.columns = columns
+        self.class_field = class_field
+        self.order = order
+        self.display = display or {}
+        self.date_field = date_field
+
+    @property
+    def headings(self):
+        return [heading for heading, field in self.columns]
+
+    def queryset(self, scope, school=None, class_id=None, term=None):
+        """Rows within `scope` (from export_scope), optionally of one school, class and term"""
+        queryset = self.model.objects.filter(scope)
+        if school is not None:
+            queryset = queryset.filter(student__school=school)
+        if class_id is not None:
+            queryset = queryset.filter(**{self.class_field: class_id})
+        if term is not None:
+            if self.date_field is None:
+                queryset = queryset.filter(term=term)
+            elif isinstance(self.model._meta.get_field(self.date_field), DateTimeField):
+                queryset = queryset.filter(**{
+                    f"{self.date_field}__gte": local_midnight(term.start_date),
+                    f"{self.date_field}__lt": local_midnight(term.end_date + datetime.timedelta(days=1)),
+                })
+            else:
+                queryset = queryset.filter(**{
+                    f"{self.date_field}__gte": term.start_date,
+                    f"{self.date_field}__lte": term.end_date,
+                })
+        return queryset.order_by(*self.order)
+
+    def rows(self, queryset):
+        """Formatted rows, fetched from the database a chunk at a time"""
+        fields = [field for heading, field in self.columns]
+        formatters = [self.display.get(field) for field in fields]
+        values = queryset.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        for row in values:
+            yield [
+                formatter(value) if formatter and value is not None else value
+                for formatter, value in zip(formatters, row)
+            ]
+
+
+def _choices(model, field):
+    labels = dict(model._meta.get_field(field).choices)
+    return lambda value: labels.get(value, value)
+
+
+def _local(value):
+    """Local wall-clock time without a zone, which spreadsheets cannot store"""
+    return timezone.localtime(value).replace(tzinfo=None, microsecond=0)
+
+
+STUDENT_COLUMNS = [
+    ('Admission number', 'student__admission_number'),
+    ('First name', 'student__user__first_name'),
+    ('Last name', 'student__user__last_name'),
+]
+
+EXPORTS = {
+    'grades': Export(
+        Grade,
+        STUDENT_COLUMNS + [
+            ('Class', 'class_taken__name'),
+            ('Session', 'term__session__name'),
+            ('Term', 'term__name'),
+            ('Subject', 'subject__name'),
+            ('Assessment', 'assessment_type'),
+            ('Score', 'score'),
+            ('Total marks', 'total_marks'),
+            ('Comments', 'comments'),
+            ('Recorded at', 'date_recorded'),
+        ],
+        class_field='class_taken',
+        order=['class_taken__name', 'student__user__last_name', 'student__user__first_name', 'subject__name', 'pk'],
+        display={
+            'term__name': _choices(Term, 'name'),
+            'assessment_type': _choices(Grade, 'assessment_type'),
+            'date_recorded': _local,
+        },
+    ),
+    'attendance': Export(
+        Attendance,
+        STUDENT_COLUMNS + [
+            ('Class', 'class_attended__name'),
+            ('Date', 'date'),
+            ('Status', 'status'),
+            ('Time in', 'time_in'),
+            ('Time out', 'time_out'),
+            ('Remarks', 'remarks'),
+        ],
+        class_field='class_attended',
+        order=['date', 'class_attended__name', 'student__user__last_name', 'student__user__first_name', 'pk'],
+        display={'status': _choices(Attendance, 'status')},
+        date_field='date',
+    ),
+    'payments': Export(
+        FeePayment,
+        STUDENT_COLUMNS + [
+            ('Class', 'fee_structure__class_level__name'),
+            ('Fee', 'fee_structure__fee_type'),
+            ('Amount due', 'fee_structure__amount'),
+            ('Amount paid', 'amount_paid'),
+            ('Paid at', 'payment_date'),
+            ('Method', 'payment_method'),
+            ('Status', 'status'),
+            ('Reference', 'reference_number'),
+            ('Receipt', 'receipt_number'),
+        ],
+        class_field='fee_structure__class_level',
+        order=['payment_date', 'pk'],
+        display={
+            'fee_structure__fee_type': _choices(FeeStructure, 'fee_type'),
+            'payment_date': _local,
+            'payment_method': _choices(FeePayment, 'payment_method'),
+            'status': _choices(FeePayment, 'status'),
+        },
+        date_field='payment_date',
+    ),
+}
+
+
+def export_scope(user, dataset):
+    """
+    Filter limiting the exported rows to what `user` may export, or None
+    if they may not export `dataset` at all. Teachers may export the
+    grades and attendance of the classes they teach.
+    """
+    if user.is_staff:
+        return Q()
+    if user.user_type == 'proprietor':
+        return Q(student__school__proprietors__user=user)
+    if user.user_type == 'principal':
+        return Q(student__school__principals__user=user)
+    if user.user_type == 'teacher' and dataset != 'payments':
+        # A teacher can teach several subjects to a class, so test for a
+        # matching assignment rather than joining (and repeating rows)
+        return Exists(TeacherClass.objects.filter(
+            teacher__user=user, class_assigned=OuterRef(EXPORTS[dataset].class_field)
+        ))
+    return None
+
+
+class Echo:
+    """
+    File-like object handing back whatever is written, so csv.writer can
+    format one row at a time for a streaming response
+    """
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(headings, rows, filename):
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield writer.writerow(headings)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def stream_xlsx(headings, rows, filename, title='Export'):
+    """
+    Write the rows with openpyxl's write-only workbook, which keeps only
+    the current row in memory, to a temporary file that is then streamed
+    and removed once sent
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title)
+    sheet.append(headings)
+    for row in rows:
+        sheet.append(row)
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=f"{filename}.xlsx",
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+
+def export_response(dataset, queryset, file_format='csv'):
+    """Stream `queryset` of `dataset` as a CSV or XLSX attachment"""
+    export = EXPORTS[dataset]
+    filename = f"{dataset}-{timezone.localdate().isoformat()}"
+    rows = export.rows(queryset)
+    if file_format == 'xlsx':
+        return stream_xlsx(export.headings, rows, filename, title=dataset.capitalize())
+    return stream_csv(export.headings, rows, filename)
@@ -0,0 +1,122 @@
+from django.db import transaction
+
+from core.models import Grade, TeacherClass, TeacherProfile
+
+from .attendance import student_classes
+from .results import refresh_results
+
+# Grades per INSERT ... ON CONFLICT statement when ingesting a sheet
+INGEST_CHUNK_SIZE = 500
+# Fields a re-entered sheet overwrites on an existing grade
+SHEET_FIELDS = ('class_taken_id', 'score', 'total_marks', 'comments')
+
+
+def can_grade(user, class_obj, subject):
+    """Whether `user` may enter grades in `subject` for `class_obj`"""
+    if user.is_staff:
+        return True
+    if user.user_type == 'proprietor':
+        return class_obj.school.proprietors.filter(user=user).exists()
+    if user.user_type == 'principal':
+        return class_obj.school.principals.filter(user=user).exists()
+    if user.user_type == 'teacher':
+        if class_obj.class_teacher_id and TeacherProfile.objects.filter(pk=class_obj.class_teacher_id, user=user).exists():
+            return True
+        return TeacherClass.objects.filter(teacher__user=user, class_assigned=class_obj, subject=subject).exists()
+    return False
+
+
+def _rejected(field, message):
+    return {'outcome': 'rejected', 'errors': {field: [message]}}
+
+
+def ingest_grade_sheet(sheet, rows, user):
+    """
+    Record a grade sheet: one class, subject, term and assessment type
+    (`sheet`, validated GradeSheetSerializer data) and the scores in `rows`
+    (row index to validated row), upserted on the grades' unique key so a
+    re-entered sheet updates its scores instead of failing.
+
+    Students are checked against the class with one query and existing
+    grades read with another; the grades are written with one
+    INSERT ... ON CONFLICT per chunk, and the subject and term results they
+    feed are refreshed in the same transaction.
+
+    Returns the outcome of each row: 'created', 'updated', 'unchanged' or
+    'rejected' with errors by field.
+    """
+    outcomes = {}
+    if not rows:
+        return outcomes
+    class_obj, subject, term = sheet['class_taken'], sheet['subject'], sheet['term']
+    assessment_type, total_marks = sheet['assessment_type'], sheet['total_marks']
+
+    members = student_classes({row['student'] for row in rows.values()})
+    accepted = {}
+    for index, row in rows.items():
+        if row['student'] not in members:
+            outcomes[index] = _rejected('student', 'Student not found')
+        elif class_obj.pk not in members[row['student']][1]:
+            outcomes[index] = _rejected('student', 'Student is not a member of this class')
+        elif row['score'] > total_marks:
+            outcomes[index] = _rejected('score', f"Score cannot exceed the total marks of {total_marks}")
+        elif row['student'] in accepted:
+            outcomes[index] = _rejected('student', f"Duplicates row {accepted[row['student']][0]} for this student")
+        else:
+            accepted[row['student']] = (index, row)
+    if not accepted:
+        return outcomes
+
+    teacher = None
+    if user.user_type == 'teacher':
+        teacher = TeacherProfile.objects.filter(user=user).values_list('pk', flat=True).first()
+
+    existing = {
+        grade.student_id: grade
+        for grade in Grade.objects.filter(
+            student__in=accepted, subject=subject, term=term, assessment_type=assessment_type
+        ).only('student_id', *SHEET_FIELDS)
+    }
+
+    writes = []
+    for student_id, (index, row) in accepted.items():
+        grade = Grade(
+            student_id=student_id,
+            subject=subject,
+            class_taken=class_obj,
+            term=term,
+            assessment_type=assessment_type,
+            score=row['score'],
+            total_marks=total_marks,
+            comments=row.get('comments', ''),
+            teacher_id=teacher,
+        )
+        previous = existing.get(student_id)
+        if previous is None:
+            outcomes[index] = {'outcome': 'created'}
+        elif all(getattr(previous, field) == getattr(grade, field) for field in SHEET_FIELDS):
+            outcomes[index] = {'outcome': 'unchanged', 'id': previous.pk}
+            continue
+        else:
+            outcomes[index] = {'outcome': 'updated', 'id': previous.pk}
+        writes.append((index, grade))
+
+    if writes:
+        update_fields = [field.removesuffix('_id') for field in SHEET_FIELDS]
+        if teacher is not None:
+            update_fields.append('teacher')
+        with transaction.atomic():
+            # Signals are bypassed, so the results of every student on the
+            # sheet are refreshed (and their classes re-ranked) once
+            Grade.objects.bulk_create(
+                [grade for index, grade in writes],
+                batch_size=INGEST_CHUNK_SIZE,
+                update_conflicts=True,
+                unique_fields=['student', 'subject', 'term', 'assessment_type'],
+                update_fields=update_fields,
+            )
+            refresh_results({(grade.student_id, subject.pk, term.pk) for index, grade in writes})
+        for index, grade in writes:
+            if grade.pk is not None:
+                outcomes[index].setdefault('id', grade.pk)
+    return outcomes
@@ -0,0 +1,427 @@
+import csv
+import datetime
+import io
+import logging
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Lower
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from core.models import (
+    AcademicSession, Class, Enrollment, ImportJob, ImportRowError, ParentProfile, School, StudentProfile,
+    Subject, Term, User
+)
+from core.serializers import GradeImportRowSerializer, StudentImportRowSerializer
+
+from .grades import can_grade, ingest_grade_sheet
+from .search import index_objects
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ('csv', 'xlsx')
+# Headings people commonly use for a column, mapped to the column's name
+COLUMN_ALIASES = {
+    'class': 'class_name',
+    'subject_code': 'subject',
+    'assessment': 'assessment_type',
+}
+
+
+def import_format(filename):
+    """'csv' or 'xlsx' from a file's extension, or None if it is neither"""
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    return extension if extension in IMPORT_FORMATS else None
+
+
+def importable_schools(user):
+    """Schools `user` may import into, or None if they may not import at all"""
+    if user.is_staff:
+        return School.objects.all()
+    if user.user_type == 'proprietor':
+        return School.objects.filter(proprietors__user=user)
+    if user.user_type == 'principal':
+        return School.objects.filter(principals__user=user)
+    return None
+
+
+def _column(heading):
+    name = str(heading or '').strip().lower().replace(' ', '_').replace('-', '_')
+    return COLUMN_ALIASES.get(name, name)
+
+
+def _cell(value):
+    """
+    A spreadsheet value as the row serializers expect it: blanks as None,
+    dates without a time and whole numbers (admission numbers, phone
+    numbers) without a fraction
+    """
+    if isinstance(value, str):
+        return value.strip() or None
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _records(rows):
+    headings = [_column(heading) for heading in next(rows, [])]
+    for number, values in enumerate(rows, start=2):
+        record = {
+            heading: value for heading, value in zip(headings, map(_cell, values))
+            if heading and value is not None
+        }
+        if record:
+            yield number, record
+
+
+def read_rows(file, file_format):
+    """
+    Yield (spreadsheet row number, {column: value}) for each non-blank row
+    of a CSV or XLSX file, reading it a row at a time
+    """
+    if file_format == 'xlsx':
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            yield from _records(workbook.worksheets[0].iter_rows(values_only=True))
+        finally:
+            workbook.close()
+    else:
+        yield from _records(csv.reader(io.TextIOWrapper(file, encoding='utf-8-sig', newline='')))
+
+
+def _rejected(field, message):
+    return {'outcome': 'rejected', 'errors': {field: [message]}}
+
+
+class StudentImporter:
+    """
+    Creates each row's user, student profile and enrollment in the school's
+    current session, and creates or links the row's parent. Users get the
+    password given in the file, hashed across IMPORT_HASH_WORKERS threads,
+    or an unusable one and an invite.
+    """
+    serializer_class = StudentImportRowSerializer
+
+    def __init__(self, job):
+        self.school = job.school
+        self.classes = {
+            name.lower(): class_id
+            for class_id, name in Class.objects.filter(school=self.school).values_list('pk', 'name')
+        }
+        self.session = AcademicSession.objects.filter(school=self.school, is_current=True).first()
+
+    def load(self, rows):
+        """Create the students of `rows` (row number to validated data); returns outcomes and invited user ids"""
+        outcomes = {}
+        student_emails = {row['email'] for row in rows.values()}
+        parent_emails = {row['parent_email'] for row in rows.values() if row.get('parent_email')}
+        # Row emails are lowercased, stored ones keep the case they were given in
+        users = {
+            email: (user_type, parent_id)
+            for email, user_type, parent_id in User.objects.annotate(email_lower=Lower('email')).filter(
+                email_lower__in=student_emails | parent_emails
+            ).values_list('email_lower', 'user_type', 'parent_profile')
+        }
+        admitted = dict(
+            StudentProfile.objects.filter(
+                school=self.school, admission_number__in={row['admission_number'] for row in rows.values()}
+            ).values_list('admission_number', 'user__email')
+        )
+
+        accepted, emails, admission_numbers = {}, {}, {}
+        for number, row in rows.items():
+            email, admission_number = row['email'], row['admission_number']
+            parent_email = row.get('parent_email')
+            class_name = row.get('class_name')
+            if admitted.get(admission_number, '').lower() == email:
+                outcomes[number] = {'outcome': 'unchanged'}
+            elif admission_number in admitted:
+                outcomes[number] = _rejected('admission_number', 'Admission number is already in use at this school')
+            elif email in users:
+                outcomes[number] = _rejected('email', 'A user with this email already exists')
+            elif email in emails:
+                outcomes[number] = _rejected('email', f"Duplicates the email of row {emails[email]}")
+            elif email in parent_emails:
+                outcomes[number] = _rejected('email', 'Email is also given as a parent email')
+            elif admission_number in admission_numbers:
+                outcomes[number] = _rejected(
+                    'admission_number', f"Duplicates the admission number of row {admission_numbers[admission_number]}"
+                )
+            elif class_name and class_name.lower() not in self.classes:
+                outcomes[number] = _rejected('class_name', f"No class named {class_name} at this school")
+            elif parent_email in student_emails:
+                outcomes[number] = _rejected('parent_email', 'Parent email belongs to a student')
+            elif parent_email in users and users[parent_email][1] is None:
+                outcomes[number] = _rejected('parent_email', 'A user with this email already exists and is not a parent')
+            else:
+                accepted[number] = row
+                emails[email] = number
+                admission_numbers[admission_number] = number
+        if not accepted:
+            return outcomes, []
+
+        passwords = self._hash_passwords(accepted)
+        today = timezone.localdate()
+        new_users, profiles, enrollments, links = [], [], [], []
+        parents, new_parents = {}, {}
+        for number, row in accepted.items():
+            user = User(
+                email=row['email'],
+                first_name=row['first_name'],
+                last_name=row['last_name'],
+                user_type='student',
+                phone_number=row.get('phone_number'),
+                password=passwords[number],
+            )
+            class_id = self.classes.get(row['class_name'].lower()) if row.get('class_name') else None
+            profile = StudentProfile(
+                user=user,
+                school=self.school,
+                admission_number=row['admission_number'],
+                date_of_birth=row['date_of_birth'],
+                gender=row['gender'],
+                blood_group=row.get('blood_group', ''),
+                address=row['address'],
+                state_of_origin=row['state_of_origin'],
+                religion=row.get('religion', ''),
+                admission_date=row.get('admission_date', today),
+                current_class_id=class_id,
+                guardian_name=row['guardian_name'],
+                guardian_phone=row['guardian_phone'],
+                guardian_email=row.get('guardian_email', ''),
+                emergency_contact=row.get('emergency_contact', row['guardian_name']),
+                emergency_phone=row.get('emergency_phone', row['guardian_phone']),
+            )
+            new_users.append(user)
+            profiles.append(profile)
+            if class_id and self.session:
+                enrollments.append(Enrollment(student=profile, class_enrolled_id=class_id, session=self.session))
+
+            parent_email = row.get('parent_email')
+            if parent_email in users:
+                parents[parent_email] = users[parent_email][1]
+            elif parent_email and parent_email not in new_parents:
+                parent_user = User(
+                    email=parent_email,
+                    first_name=row['parent_first_name'],
+                    last_name=row['parent_last_name'],
+                    user_type='parent',
+                    phone_number=row.get('parent_phone'),
+                    password=make_password(None),
+                )
+                new_users.append(parent_user)
+                new_parents[parent_email] = ParentProfile(
+                    user=parent_user, relationship=row.get('relationship', 'guardian')
+                )
+            if parent_email:
+                links.append((parent_email, profile))
+            outcomes[number] = {'outcome': 'created'}
+
+        User.objects.bulk_create(new_users)
+        StudentProfile.objects.bulk_create(profiles)
+        Enrollment.objects.bulk_create(enrollments)
+        ParentProfile.objects.bulk_create(new_parents.values())
+        parents.update({email: parent.pk for email, parent in new_parents.items()})
+        ParentProfile.children.through.objects.bulk_create(
+            [
+                ParentProfile.children.through(parentprofile_id=parents[email], studentprofile_id=profile.pk)
+                for email, profile in links
+            ],
+            ignore_conflicts=True
+        )
+        # bulk_create skips the receivers that keep the search index
+        index_objects('user', new_users)
+        return outcomes, [user.pk for user in new_users if not user.has_usable_password()]
+
+    def _hash_passwords(self, rows):
+        """
+        Each row's password hash, or an unusable password if none was given.
+        PBKDF2 releases the GIL, so the hashes are computed in parallel.
+        """
+        given = [(number, row['password']) for number, row in rows.items() if row.get('password')]
+        hashes = {number: make_password(None) for number in rows}
+        if given:
+            with ThreadPoolExecutor(max_workers=settings.IMPORT_HASH_WORKERS) as pool:
+                hashes.update(zip(
+                    [number for number, password in given],
+                    pool.map(make_password, [password for number, password in given])
+                ))
+        return hashes
+
+
+class GradeImporter:
+    """
+    Records each row's score in the import's term, grouping the rows into
+    one grade sheet per class, subject and assessment so each is written
+    and its results refreshed together, as with GradeViewSet.bulk_upsert
+    """
+    serializer_class = GradeImportRowSerializer
+
+    def __init__(self, job):
+        self.school = job.school
+        self.user = job.created_by
+        self.term = Term.objects.get(pk=job.options.get('term'), session__school=self.school)
+        self.subjects = {subject.code.lower(): subject for subject in Subject.objects.all()}
+        self.classes = {}
+        self.allowed = {}
+
+    def load(self, rows):
+        """Record the scores of `rows` (row number to validated data); returns outcomes and no invites"""
+        outcomes = {}
+        students = {
+            admission_number: (student_id, class_id)
+            for student_id, admission_number, class_id in StudentProfile.objects.filter(
+                school=self.school, admission_number__in={row['admission_number'] for row in rows.values()}
+            ).values_list('pk', 'admission_number', 'current_class')
+        }
+
+        sheets = defaultdict(dict)
+        for number, row in rows.items():
+            student = students.get(row['admission_number'])
+            subject = self.subjects.get(row['subject'].lower())
+            if student is None:
+                outcomes[number] = _rejected('admission_number', 'No student with this admission number at this school')
+            elif student[1] is None:
+                outcomes[number] = _rejected('admission_number', 'Student is not in a class')
+            elif subject is None:
+                outcomes[number] = _rejected('subject', f"No subject with the code {row['subject']}")
+            else:
+                key = (student[1], subject, row['assessment_type'], row['total_marks'])
+                sheets[key][number] = {'student': student[0], 'score': row['score'], 'comments': row['comments']}
+
+        missing = {class_id for class_id, subject, assessment_type, total_marks in sheets} - set(self.classes)
+        self.classes.update(Class.objects.select_related('school').in_bulk(missing))
+        for (class_id, subject, assessment_type, total_marks), sheet_rows in sheets.items():
+            class_obj = self.classes[class_id]
+            if (class_id, subject.pk) not in self.allowed:
+                self.allowed[class_id, subject.pk] = self.user is not None and can_grade(self.user, class_obj, subject)
+            if not self.allowed[class_id, subject.pk]:
+                for number in sheet_rows:
+                    outcomes[number] = _rejected('subject', f"You cannot grade {subject.name} for {class_obj.name}")
+                continue
+            sheet = {
+                'class_taken': class_obj,
+                'subject': subject,
+                'term': self.term,
+                'assessment_type': assessment_type,
+                'total_marks': total_marks,
+            }
+            for number, outcome in ingest_grade_sheet(sheet, sheet_rows, self.user).items():
+                if 'student' in outcome.get('errors', {}):
+                    outcome['errors']['admission_number'] = outcome['errors'].pop('student')
+                outcomes[number] = outcome
+        return outcomes, []
+
+
+IMPORTERS = {
+    'students': StudentImporter,
+    'grades': GradeImporter,
+}
+
+
+def _raw(record):
+    """A row as it was read, for the error report"""
+    return {
+        column: value if isinstance(value, (str, int, float)) else str(value)
+        for column, value in record.items()
+    }
+
+
+def _import_batch(job, importer, batch, on_invite=None):
+    """
+    Validate and load one batch of (row number, record) pairs, recording
+    failed rows and advancing the job's counters in the same transaction
+    """
+    rows, outcomes = {}, {}
+    for number, record in batch:
+        serializer = importer.serializer_class(data=record)
+        if serializer.is_valid():
+            rows[number] = serializer.validated_data
+        else:
+            outcomes[number] = {'outcome': 'rejected', 'errors': serializer.errors}
+
+    with transaction.atomic():
+        loaded, invited = importer.load(rows) if rows else ({}, [])
+        outcomes.update(loaded)
+        records = dict(batch)
+        ImportRowError.objects.bulk_create(
+            [
+                ImportRowError(job=job, row_number=number, errors=outcome['errors'], data=_raw(records[number]))
+                for number, outcome in sorted(outcomes.items()) if outcome['outcome'] == 'rejected'
+            ],
+            ignore_conflicts=True
+        )
+        tally = defaultdict(int)
+        for outcome in outcomes.values():
+            tally[outcome['outcome']] += 1
+        ImportJob.objects.filter(pk=job.pk).update(
+            processed_rows=F('processed_rows') + len(batch),
+            created_rows=F('created_rows') + tally['created'],
+            updated_rows=F('updated_rows') + tally['updated'],
+            unchanged_rows=F('unchanged_rows') + tally['unchanged'],
+            failed_rows=F('failed_rows') + tally['rejected'],
+        )
+        if invited and on_invite and job.options.get('send_invites', True):
+            on_invite(invited)
+
+
+def run_import(job_id, batch_size=None, on_progress=None, on_invite=None):
+    """
+    Load an import job's spreadsheet a batch at a time. Each batch commits
+    with the job's progress, so a job that failed part-way (or whose worker
+    died) picks up after its last committed batch when run again.
+
+    `on_progress(done, total)` is called after each batch and
+    `on_invite(user_ids)` with the users each batch created without a
+    password, once that batch commits.
+
+    Returns the job's counts, or None if the job was not waiting to run.
+    """
+    claimed = ImportJob.objects.filter(pk=job_id, status__in=('pending', 'failed')).update(
+        status='running', error='', started_at=timezone.now()
+    )
+    if not claimed:
+        return None
+
+    job = ImportJob.objects.select_related('school', 'created_by').get(pk=job_id)
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+    file_format = import_format(job.file.name)
+    try:
+        importer = IMPORTERS[job.kind](job)
+        with job.file.open('rb'):
+            total = sum(1 for row in read_rows(job.file.file, file_format))
+        ImportJob.objects.filter(pk=job.pk).update(total_rows=total)
+
+        done = job.processed_rows
+        if on_progress:
+            on_progress(done, total)
+        with job.file.open('rb'):
+            records = islice(read_rows(job.file.file, file_format), done, None)
+            while batch := list(islice(records, batch_size)):
+                _import_batch(job, importer, batch, on_invite)
+                done += len(batch)
+                if on_progress:
+                    on_progress(done, total)
+    except Exception as e:
+        ImportJob.objects.filter(pk=job.pk).update(status='failed', error=str(e))
+        raise
+
+    ImportJob.objects.filter(pk=job.pk).update(status='completed', finished_at=timezone.now())
+    job.refresh_from_db()
+    logger.info(f"Import {job.pk} finished: {job.created_rows} created, {job.failed_rows} failed")
+    return {
+        'total': job.total_rows,
+        'created': job.created_rows,
+        'updated': job.updated_rows,
+        'unchanged': job.unchanged_rows,
+        'failed': job.failed_rows,
+    }
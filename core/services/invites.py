@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core.mail import get_connection, send_mass_mail
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+User = get_user_model()
+
+
+class InviteTokenGenerator(PasswordResetTokenGenerator):
+    """
+    Tokens for invited users to choose their first password. Like password
+    reset tokens they stop working once the password is set, and expire
+    after PASSWORD_RESET_TIMEOUT.
+    """
+    key_salt = 'core.services.invites.InviteTokenGenerator'
+
+
+invite_token_generator = InviteTokenGenerator()
+
+
+def invite_url(user):
+    """Link at which `user` accepts their invite and sets a password"""
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    token = invite_token_generator.make_token(user)
+    return f"{settings.FRONTEND_URL}/accept-invite/{uid}/{token}/"
+
+
+def send_invites(user_ids):
+    """
+    Email an invite link to each of `user_ids` still waiting to set a
+    password, over one connection; returns the number of emails sent
+    """
+    users = User.objects.filter(pk__in=user_ids, is_active=True).exclude(email='')
+    invites = [
+        (
+            'You have been invited to EMSU',
+            f"Hello {user.first_name},\n\n"
+            f"An account has been created for you. Choose a password to sign in:\n\n{invite_url(user)}\n",
+            settings.DEFAULT_FROM_EMAIL,
+            [user.email],
+        )
+        for user in users if not user.has_usable_password()
+    ]
+    if not invites:
+        return 0
+    return send_mass_mail(invites, fail_silently=False, connection=get_connection())
+
+
+def redeem_invite(uidb64, token, password):
+    """
+    Set the first password of the invited user, returning the user, or None
+    if the link is invalid, expired or already used
+    """
+    try:
+        user = User.objects.get(pk=force_str(urlsafe_base64_decode(uidb64)))
+    except (User.DoesNotExist, ValueError, TypeError, OverflowError):
+        return None
+    if user.has_usable_password() or not invite_token_generator.check_token(user, token):
+        return None
+    user.set_password(password)
+    user.email_verified = True
+    user.save(update_fields=['password', 'email_verified'])
+    return user
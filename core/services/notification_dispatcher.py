@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def notification_payload(notification):
+    """What a client receives for one notification"""
+    return {
+        "id": str(notification.id),
+        "title": notification.title,
+        "message": notification.message,
+        "notification_type": notification.notification_type,
+        "action_url": notification.action_url,
+        "created_at": notification.created_at.isoformat(),
+        "is_read": notification.is_read
+    }
+
+
+def notification_frame(payloads):
+    """
+    The channel layer event delivering `payloads` to one user: a single
+    notification as before, several coalesced into one frame
+    """
+    if len(payloads) == 1:
+        return {"type": "send_notification", "notification": payloads[0]}
+    return {"type": "send_notifications", "notifications": payloads}
+
+
+class PushMetrics:
+    """Thread-safe counters, queue depth and recent push latencies for a dispatcher"""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.depth = 0
+        self.max_depth = 0
+        self.frames = 0
+        self.pushed = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.last_error = ''
+        self.latencies = deque(maxlen=window)
+
+    def enqueued(self, count):
+        with self._lock:
+            self.queued += count
+            self.depth += count
+            self.max_depth = max(self.max_depth, self.depth)
+
+    def sent(self, notifications, latency, error=None):
+        with self._lock:
+            self.depth -= notifications
+            self.frames += 1
+            self.latencies.append(latency)
+            if error is not None:
+                self.errors += 1
+                self.last_error = str(error)
+            else:
+                self.pushed += notifications
+                self.coalesced += notifications - 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            return {
+                'queued': self.queued,
+                'queue_depth': self.depth,
+                'max_queue_depth': self.max_depth,
+                'frames': self.frames,
+                'pushed': self.pushed,
+                'coalesced': self.coalesced,
+                'errors': self.errors,
+                'last_error': self.last_error,
+                'latency_ms': {
+                    'avg': round(1000 * sum(latencies) / len(latencies), 1) if latencies else None,
+                    'p50': round(1000 * latencies[len(latencies) // 2], 1) if latencies else None,
+                    'p95': round(1000 * latencies[int(len(latencies) * 0.95)], 1) if latencies else None,
+                },
+            }
+
+
+class NotificationDispatcher:
+    """
+    Buffers outbound notification pushes and sends them from one event loop
+    running in a background thread.
+
+    Notifications submitted within `window` seconds of the first one still
+    waiting are sent together; each user's are coalesced into one frame,
+    and frames go to the channel layer `batch_size` at a time. Pushes are
+    best effort: the notifications are already stored, and a client that
+    misses a push picks them up on its next fetch.
+    """
+
+    def __init__(self, window=0.05, batch_size=200):
+        self.window = window
+        self.batch_size = batch_size
+        self.metrics = PushMetrics()
+        self._lock = threading.Lock()
+        self._pending = defaultdict(list)
+        self._scheduled = False
+        self._flushing = set()
+        self._loop = None
+        self._pid = None
+
+    def _ensure_loop(self):
+        """Start the loop thread on first use, and again in a forked child"""
+        if self._loop is not None and self._pid == os.getpid():
+            return self._loop
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name='notification-dispatcher', daemon=True).start()
+        self._loop, self._pid = loop, os.getpid()
+        self._pending.clear()
+        self._scheduled = False
+        self._flushing = set()
+        return loop
+
+    def submit(self, notifications):
+        """Queue pushes for saved notifications; returns at once"""
+        if not notifications:
+            return
+        now = time.monotonic()
+        with self._lock:
+            loop = self._ensure_loop()
+            for notification in notifications:
+                self._pending[notification.recipient_id].append((notification_payload(notification), now))
+            self.metrics.enqueued(len(notifications))
+            if self._scheduled:
+                return
+            self._scheduled = True
+        loop.call_soon_threadsafe(loop.call_later, self.window, self._start_flush)
+
+    def flush(self, timeout=10):
+        """Send everything queued now and wait for it, e.g. before a short-lived process exits"""
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                return
+            loop = self._loop
+        asyncio.run_coroutine_threadsafe(self._drain(), loop).result(timeout)
+
+    def _start_flush(self):
+        task = self._loop.create_task(self._flush())
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _drain(self):
+        await self._flush()
+        if self._flushing:
+            await asyncio.gather(*self._flushing)
+
+    def _take(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(list)
+            self._scheduled = False
+        return pending
+
+    async def _flush(self):
+        pending = self._take()
+        if not pending:
+            return
+        channel_layer = get_channel_layer()
+        frames = list(pending.items())
+        for start in range(0, len(frames), self.batch_size):
+            await asyncio.gather(*[
+                self._send(channel_layer, user_id, entries)
+                for user_id, entries in frames[start:start + self.batch_size]
+            ])
+
+    async def _send(self, channel_layer, user_id, entries):
+        error = None
+        try:
+            if channel_layer is not None:
+                await channel_layer.group_send(
+                    f"notifications_{user_id}", notification_frame([payload for payload, queued_at in entries])
+                )
+        except Exception as e:
+            error = e
+            logger.error(f"Notification push error: {str(e)}")
+        # Latency of the oldest notification in the frame, from submit to sent
+        self.metrics.sent(len(entries), time.monotonic() - entries[0][1], error)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """The process's dispatcher, configured from NOTIFICATION_PUSH_* settings"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = NotificationDispatcher(
+                window=getattr(settings, 'NOTIFICATION_PUSH_WINDOW_MS', 50) / 1000,
+                batch_size=getattr(settings, 'NOTIFICATION_PUSH_BATCH_SIZE', 200),
+            )
+        return _dispatcher
+
+
+def push_notifications(notifications):
+    """Push saved notifications to their recipients' WebSocket groups"""
+    get_dispatcher().submit(list(notifications))
+
+
+def dispatcher_health():
+    """Queue depth, coalescing and push latency of this process's dispatcher"""
+    return get_dispatcher().metrics.snapshot()
@@ -0,0 +1,274 @@
+import base64
+import io
+import mimetypes
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.text import slugify
+
+from core.models import AttendanceRollup, Grade, SubjectResult, TermResult
+
+from .attendance import rollup_key
+
+REPORT_CARD_TEMPLATE = 'core/report_card.html'
+# Cards handed to a worker at a time
+RENDER_CHUNK_SIZE = 8
+# Cards between progress reports
+PROGRESS_INTERVAL = 25
+
+
+class RenderFailed(Exception):
+    """Raised when a report card's HTML cannot be converted to PDF"""
+
+
+def report_card_data(class_obj, term):
+    """
+    Everything each student's card in `class_obj` shows for `term`, as
+    plain picklable dicts, read from the maintained results in a handful
+    of queries for the whole class
+    """
+    school = class_obj.school
+    term_results = list(
+        TermResult.objects.filter(class_taken=class_obj, term=term).select_related('student__user').order_by(
+            'student__user__last_name', 'student__user__first_name'
+        )
+    )
+    students = [result.student_id for result in term_results]
+
+    subject_results = defaultdict(list)
+    for result in SubjectResult.objects.filter(
+        student__in=students, term=term
+    ).select_related('subject').order_by('subject__name'):
+        subject_results[result.student_id].append(result)
+
+    scores = {
+        (student, subject, assessment_type): score
+        for student, subject, assessment_type, score in Grade.objects.filter(
+            student__in=students, term=term
+        ).values_list('student', 'subject', 'assessment_type', 'score')
+    }
+    graded = {assessment_type for student, subject, assessment_type in scores}
+    assessment_types = [(value, label) for value, label in Grade.ASSESSMENT_TYPES if value in graded]
+
+    attendance = {
+        rollup.student_id: rollup
+        for rollup in AttendanceRollup.objects.filter(
+            key__in=[rollup_key('student', student, 'term', term.pk) for student in students]
+        )
+    }
+
+    common = {
+        'school': {'name': school.name, 'address': school.address, 'motto': school.motto},
+        'logo_path': _logo_path(school),
+        'term': f"{term.session.name} {term.get_name_display()}",
+        'class_name': class_obj.name,
+        'class_size': len(term_results),
+        'assessment_types': assessment_types,
+        'generated_at': timezone.now(),
+    }
+    cards = []
+    for result in term_results:
+        rollup = attendance.get(result.student_id)
+        cards.append({
+            **common,
+            'filename': f"{slugify(result.student.user.get_full_name()) or 'student'}-{result.student.admission_number}.pdf",
+            'student': {
+                'name': result.student.user.get_full_name(),
+                'admission_number': result.student.admission_number,
+            },
+            'subjects': [
+                {
+                    'name': subject.subject.name,
+                    'scores': [
+                        scores.get((result.student_id, subject.subject_id, value)) for value, label in assessment_types
+                    ],
+                    'score': subject.weighted_score,
+                    'letter': subject.letter_grade,
+                    'position': subject.position,
+                }
+                for subject in subject_results[result.student_id]
+            ],
+            'result': {
+                'subjects': result.subjects,
+                'average': result.average_score,
+                'letter': result.letter_grade,
+                'position': result.position,
+            },
+            'attendance': {
+                'total': rollup.total if rollup else 0,
+                'present': rollup.present if rollup else 0,
+                'late': rollup.late if rollup else 0,
+            },
+        })
+    return cards
+
+
+def _logo_path(school):
+    """Local path of the school's logo, or None if it has none or it is stored remotely"""
+    if not school.logo:
+        return None
+    try:
+        path = school.logo.path
+    except NotImplementedError:
+        return None
+    return path if os.path.exists(path) else None
+
+
+@lru_cache(maxsize=None)
+def _template():
+    """The report card template, compiled once per process"""
+    return get_template(REPORT_CARD_TEMPLATE)
+
+
+@lru_cache(maxsize=32)
+def _data_uri(path, modified):
+    """
+    An image as a data URI, read once per process (and again only if the
+    file changes), so cards embed the logo without reopening it
+    """
+    content_type = mimetypes.guess_type(path)[0] or 'image/png'
+    with open(path, 'rb') as image:
+        return f"data:{content_type};base64,{base64.b64encode(image.read()).decode()}"
+
+
+@lru_cache(maxsize=None)
+def _signer():
+    """
+    The pyHanko signer configured in REPORT_CARD_SIGNING, loaded once per
+    process, or None when cards are not signed
+    """
+    config = getattr(settings, 'REPORT_CARD_SIGNING', None)
+    if not config:
+        return None
+    from pyhanko.sign import signers
+
+    passphrase = config.get('passphrase')
+    return signers.SimpleSigner.load(
+        config['key'], config['cert'],
+        key_passphrase=passphrase.encode() if passphrase else None
+    )
+
+
+def sign_pdf(pdf):
+    """Sign a rendered card with the configured certificate, if any"""
+    signer = _signer()
+    if signer is None:
+        return pdf
+    from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+    from pyhanko.sign import signers
+
+    signed = signers.sign_pdf(
+        IncrementalPdfFileWriter(io.BytesIO(pdf)),
+        signers.PdfSignatureMetadata(field_name='Signature', reason='Report card'),
+        signer=signer,
+    )
+    return signed.getvalue()
+
+
+def render_report_card(card):
+    """Render one card's data to PDF bytes, signed if signing is configured"""
+    from xhtml2pdf import pisa
+
+    logo = None
+    if card['logo_path']:
+        logo = _data_uri(card['logo_path'], os.path.getmtime(card['logo_path']))
+    html = _template().render({**card, 'logo': logo})
+
+    output = io.BytesIO()
+    status = pisa.CreatePDF(html, dest=output)
+    if status.err:
+        raise RenderFailed(f"Could not render {card['filename']}")
+    return card['filename'], sign_pdf(output.getvalue())
+
+
+def _init_worker():
+    """Prepare a pool process: set Django up when the process was not forked"""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def report_card_pool(workers=None):
+    """
+    A process pool for rendering cards. Database connections are closed
+    first so forked workers never share the parent's sockets.
+
+    Daemonic processes, such as Celery's prefork pool workers, cannot start
+    children, so there the cards are rendered one at a time in-process.
+    """
+    if multiprocessing.current_process().daemon:
+        return ThreadPoolExecutor(max_workers=1)
+    connections.close_all()
+    return ProcessPoolExecutor(
+        max_workers=workers or getattr(settings, 'REPORT_CARD_WORKERS', None) or os.cpu_count(),
+        initializer=_init_worker,
+    )
+
+
+def write_class_archive(class_obj, term, cards, pool, on_card=None):
+    """
+    Render `cards` across `pool` into a zip of PDFs for the class, saved to
+    default storage, calling `on_card()` as each is added; returns the
+    stored archive's name
+    """
+    with tempfile.TemporaryFile() as archive:
+        # PDFs are already compressed, so are stored as they are
+        with zipfile.ZipFile(archive, 'w', compression=zipfile.ZIP_STORED) as bundle:
+            for filename, pdf in pool.map(render_report_card, cards, chunksize=RENDER_CHUNK_SIZE):
+                bundle.writestr(filename, pdf)
+                if on_card:
+                    on_card()
+        archive.seek(0)
+        name = (
+            f"report_cards/{class_obj.school.slug}/{slugify(str(term))}/"
+            f"{slugify(class_obj.name)}-{timezone.now():%Y%m%d%H%M%S}.zip"
+        )
+        return default_storage.save(name, File(archive, name=os.path.basename(name)))
+
+
+def generate_report_cards(classes, term, workers=None, on_progress=None):
+    """
+    Render every report card of `classes` for `term` and write a zip per
+    class. `on_progress(done, total)` is called as cards finish.
+
+    Returns one entry per class with the archive's name, URL and card count.
+    """
+    batches = [(class_obj, report_card_data(class_obj, term)) for class_obj in classes]
+    total = sum(len(cards) for class_obj, cards in batches)
+    done = 0
+    if on_progress:
+        on_progress(done, total)
+
+    def card_done():
+        nonlocal done
+        done += 1
+        if on_progress and (done % PROGRESS_INTERVAL == 0 or done == total):
+            on_progress(done, total)
+
+    archives = []
+    with report_card_pool(workers) as pool:
+        for class_obj, cards in batches:
+            if not cards:
+                continue
+            name = write_class_archive(class_obj, term, cards, pool, on_card=card_done)
+            archives.append({
+                'class': str(class_obj.id),
+                'class_name': class_obj.name,
+                'cards': len(cards),
+                'archive': name,
+                'url': default_storage.url(name),
+            })
+    return archives
@@ -0,0 +1,197 @@
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+from core.models import Grade, SubjectResult, TermResult
+
+CENTS = Decimal('0.01')
+# Result keys recomputed per refresh when rebuilding
+REBUILD_BATCH_SIZE = 2000
+
+
+def weighted_score(grades, weights=None):
+    """
+    Term score, as a percentage, of one student's grades in a subject:
+    each assessment's percentage weighted by its type, over the types
+    graded so far. Types without a weight count once, like ungraded ones.
+    """
+    weights = weights or settings.GRADE_ASSESSMENT_WEIGHTS
+    weighted = total_weight = Decimal(0)
+    for grade in grades:
+        weight = Decimal(weights.get(grade.assessment_type, 1))
+        weighted += weight * grade.score * 100 / grade.total_marks
+        total_weight += weight
+    return (weighted / total_weight).quantize(CENTS) if total_weight else Decimal(0)
+
+
+def rank(rows, score):
+    """
+    Set `position` on `rows` (one class's results) by descending `score`,
+    tied scores sharing a position, and return the rows whose position changed
+    """
+    changed = []
+    previous, position = None, 0
+    for index, row in enumerate(sorted(rows, key=lambda row: getattr(row, score), reverse=True), start=1):
+        if getattr(row, score) != previous:
+            previous, position = getattr(row, score), index
+        if row.position != position:
+            row.position = position
+            changed.append(row)
+    return changed
+
+
+@transaction.atomic
+def refresh_results(keys):
+    """
+    Recompute the subject and term results of (student id, subject id,
+    term id) `keys` from their grades, then re-rank the classes they are in.
+
+    Only the affected students' grades and results, and the results of the
+    classes being re-ranked, are read, so the cost follows the size of the
+    change rather than of the grades table.
+    """
+    keys = set(keys)
+    if not keys:
+        return
+    students = {key[0] for key in keys}
+    subjects = {key[1] for key in keys}
+    terms = {key[2] for key in keys}
+    weights = settings.GRADE_ASSESSMENT_WEIGHTS
+
+    grades = defaultdict(list)
+    for grade in Grade.objects.filter(student__in=students, subject__in=subjects, term__in=terms).order_by('pk'):
+        key = (grade.student_id, grade.subject_id, grade.term_id)
+        if key in keys:
+            grades[key].append(grade)
+
+    existing = {
+        (result.student_id, result.subject_id, result.term_id): result
+        for result in SubjectResult.objects.filter(student__in=students, subject__in=subjects, term__in=terms)
+        if (result.student_id, result.subject_id, result.term_id) in keys
+    }
+    subject_groups = {(result.class_taken_id, result.subject_id, result.term_id) for result in existing.values()}
+
+    stale, results = [], []
+    for key in keys:
+        if not grades[key]:
+            if key in existing:
+                stale.append(existing[key].pk)
+            continue
+        score = weighted_score(grades[key], weights)
+        results.append(SubjectResult(
+            student_id=key[0],
+            subject_id=key[1],
+            term_id=key[2],
+            class_taken_id=grades[key][-1].class_taken_id,
+            assessments=len(grades[key]),
+            score_total=sum(grade.score for grade in grades[key]),
+            marks_total=sum(grade.total_marks for grade in grades[key]),
+            weighted_score=score,
+            letter_grade=Grade.letter_for(score),
+        ))
+        subject_groups.add((grades[key][-1].class_taken_id, key[1], key[2]))
+    SubjectResult.objects.filter(pk__in=stale).delete()
+    SubjectResult.objects.bulk_create(
+        results,
+        update_conflicts=True,
+        unique_fields=['student', 'subject', 'term'],
+        update_fields=[
+            'class_taken', 'assessments', 'score_total', 'marks_total', 'weighted_score', 'letter_grade', 'updated_at'
+        ],
+    )
+
+    term_groups = _refresh_term_results({(key[0], key[2]) for key in keys})
+
+    for result_model, groups, fields, score in (
+        (SubjectResult, subject_groups, ['class_taken', 'subject', 'term'], 'weighted_score'),
+        (TermResult, term_groups, ['class_taken', 'term'], 'average_score'),
+    ):
+        _rank_groups(result_model, groups, fields, score)
+
+
+def _refresh_term_results(student_terms):
+    """
+    Recompute the term results of (student id, term id) pairs from their
+    subject results; returns the (class id, term id) rankings they touch
+    """
+    students = {student for student, term in student_terms}
+    terms = {term for student, term in student_terms}
+
+    subject_results = defaultdict(list)
+    for result in SubjectResult.objects.filter(student__in=students, term__in=terms):
+        if (result.student_id, result.term_id) in student_terms:
+            subject_results[(result.student_id, result.term_id)].append(result)
+
+    existing = {
+        (result.student_id, result.term_id): result
+        for result in TermResult.objects.filter(student__in=students, term__in=terms)
+        if (result.student_id, result.term_id) in student_terms
+    }
+    groups = {(result.class_taken_id, result.term_id) for result in existing.values()}
+
+    stale, results = [], []
+    for key in student_terms:
+        rows = subject_results[key]
+        if not rows:
+            if key in existing:
+                stale.append(existing[key].pk)
+            continue
+        average = (sum(row.weighted_score for row in rows) / len(rows)).quantize(CENTS)
+        # The class most of the term's subjects were taken in
+        class_id = Counter(row.class_taken_id for row in rows).most_common(1)[0][0]
+        results.append(TermResult(
+            student_id=key[0],
+            term_id=key[1],
+            class_taken_id=class_id,
+            subjects=len(rows),
+            assessments=sum(row.assessments for row in rows),
+            score_total=sum(row.score_total for row in rows),
+            average_score=average,
+            letter_grade=Grade.letter_for(average),
+        ))
+        groups.add((class_id, key[1]))
+    TermResult.objects.filter(pk__in=stale).delete()
+    TermResult.objects.bulk_create(
+        results,
+        update_conflicts=True,
+        unique_fields=['student', 'term'],
+        update_fields=[
+            'class_taken', 'subjects', 'assessments', 'score_total', 'average_score', 'letter_grade', 'updated_at'
+        ],
+    )
+    return groups
+
+
+def _rank_groups(result_model, groups, fields, score):
+    """Re-rank the results in each of `groups`, values of `fields`"""
+    if not groups:
+        return
+    filters = {f"{field}__in": {group[index] for group in groups} for index, field in enumerate(fields)}
+    members = defaultdict(list)
+    for result in result_model.objects.filter(**filters).only('pk', 'position', score, *fields):
+        group = tuple(getattr(result, f"{field}_id") for field in fields)
+        if group in groups:
+            members[group].append(result)
+
+    changed = [row for rows in members.values() for row in rank(rows, score)]
+    result_model.objects.bulk_update(changed, ['position'], batch_size=500)
+
+
+def rebuild_results(terms=None):
+    """
+    Recompute every subject and term result (of `terms`, if given) from
+    the grades, e.g. after grades were written with QuerySet.update()
+    """
+    grades = Grade.objects.all()
+    results = [SubjectResult.objects.all(), TermResult.objects.all()]
+    if terms is not None:
+        grades = grades.filter(term__in=terms)
+        results = [queryset.filter(term__in=terms) for queryset in results]
+    for queryset in results:
+        queryset.delete()
+
+    keys = list(grades.order_by('term', 'student').values_list('student_id', 'subject_id', 'term_id').distinct())
+    for offset in range(0, len(keys), REBUILD_BATCH_SIZE):
+        refresh_results(keys[offset:offset + REBUILD_BATCH_SIZE])
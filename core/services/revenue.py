@@ -0,0 +1,150 @@
+import datetime
+
+from django.db.models import Case, Count, DateField, IntegerField, Sum, Value, When
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from core.models import FeePayment, Term
+
+GRANULARITIES = ('day', 'week', 'month', 'term')
+# Longest series a single request may ask for (about three years of days)
+MAX_SERIES_POINTS = 1100
+
+TRUNCATIONS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+class InvalidRange(ValueError):
+    """Raised when a revenue series is requested for an unusable range or granularity"""
+
+
+def add_months(date, months):
+    """First day of the month `months` after (or before) the month of `date`"""
+    index = date.year * 12 + date.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def period_start(date, granularity):
+    """Start of the day, week (Monday) or month containing `date`"""
+    if granularity == 'week':
+        return date - datetime.timedelta(days=date.weekday())
+    if granularity == 'month':
+        return date.replace(day=1)
+    return date
+
+
+def next_period(date, granularity):
+    if granularity == 'week':
+        return date + datetime.timedelta(days=7)
+    if granularity == 'month':
+        return add_months(date, 1)
+    return date + datetime.timedelta(days=1)
+
+
+def local_midnight(date):
+    """Start of `date` in the current time zone"""
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+
+
+def completed_payments(schools, start, end):
+    """
+    Completed payments for students of `schools` made on the local dates
+    `start` to `end` inclusive
+    """
+    return FeePayment.objects.filter(
+        student__school__in=schools,
+        status='completed',
+        payment_date__gte=local_midnight(start),
+        payment_date__lt=local_midnight(end + datetime.timedelta(days=1))
+    )
+
+
+def revenue_series(schools, start, end, granularity='month'):
+    """
+    Completed fee revenue for `schools` from `start` to `end` (inclusive
+    local dates), one point per day, week, calendar month or academic term.
+
+    Payments are grouped by the database in a single query, truncated in
+    the current time zone, and periods without payments are reported as
+    zero. The first and last periods only count payments inside the range.
+    """
+    if granularity not in GRANULARITIES:
+        raise InvalidRange(f"Granularity must be one of {', '.join(GRANULARITIES)}")
+    if start > end:
+        raise InvalidRange('Start date must not be after end date')
+    if granularity == 'term':
+        return _term_series(schools, start, end)
+
+    periods = []
+    period = period_start(start, granularity)
+    while period <= end:
+        periods.append(period)
+        if len(periods) > MAX_SERIES_POINTS:
+            raise InvalidRange(f"Range has more than {MAX_SERIES_POINTS} {granularity} periods")
+        period = next_period(period, granularity)
+
+    truncate = TRUNCATIONS[granularity]
+    rows = completed_payments(schools, start, end).annotate(
+        period=truncate('payment_date', output_field=DateField())
+    ).order_by().values('period').annotate(revenue=Sum('amount_paid'), payments=Count('pk'))
+    totals = {row['period']: row for row in rows}
+
+    return [
+        {
+            'period': period,
+            'end': next_period(period, granularity) - datetime.timedelta(days=1),
+            'label': period.strftime('%b %Y') if granularity == 'month' else period.isoformat(),
+            'revenue': float(totals.get(period, {}).get('revenue') or 0),
+            'payments': totals.get(period, {}).get('payments', 0),
+        }
+        for period in periods
+    ]
+
+
+def _term_series(schools, start, end):
+    """
+    One point per term of the schools' sessions overlapping the range.
+    Each payment counts towards the term of its student's school whose
+    dates contain the payment; payments made between terms are left out.
+    """
+    terms = list(Term.objects.filter(
+        session__school__in=schools,
+        start_date__lte=end,
+        end_date__gte=start
+    ).select_related('session').order_by('start_date', 'session__school'))
+    if not terms:
+        return []
+
+    # A handful of terms per school, so bucket payments by comparing against
+    # each term's bounds rather than looking the term up for every row
+    payment_term = Case(
+        *[
+            When(
+                student__school=term.session.school_id,
+                payment_date__gte=local_midnight(term.start_date),
+                payment_date__lt=local_midnight(term.end_date + datetime.timedelta(days=1)),
+                then=Value(term.pk)
+            )
+            for term in terms
+        ],
+        output_field=IntegerField()
+    )
+    rows = completed_payments(schools, start, end).annotate(term=payment_term).order_by().values('term').annotate(
+        revenue=Sum('amount_paid'), payments=Count('pk')
+    )
+    totals = {row['term']: row for row in rows if row['term']}
+
+    return [
+        {
+            'period': term.start_date,
+            'end': term.end_date,
+            'label': f"{term.session.name} {term.get_name_display()}",
+            'school': term.session.school_id,
+            'revenue': float(totals.get(term.pk, {}).get('revenue') or 0),
+            'payments': totals.get(term.pk, {}).get('payments', 0),
+        }
+        for term in terms
+    ]
@@ -0,0 +1,39 @@
+from django.db.models import F, Func, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import AcademicSession, Class, Enrollment, Event, Post, StudentProfile, TeacherProfile
+
+
+def count_subquery(queryset):
+    """
+    Correlated COUNT(*) over `queryset` (which should filter on an OuterRef),
+    usable as an annotation without joining and grouping the outer query
+    """
+    counted = queryset.order_by().annotate(count=Func(F('pk'), function='COUNT')).values('count')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def annotate_school_statistics(queryset):
+    """
+    Annotate schools with the counts SchoolSerializer reports, each as a
+    correlated subquery so a page of schools is fetched in a single query
+    """
+    school = OuterRef('pk')
+    return queryset.annotate(
+        stats_student_count=count_subquery(StudentProfile.objects.filter(school=school)),
+        stats_teacher_count=count_subquery(TeacherProfile.objects.filter(school=school)),
+        stats_current_session_id=Subquery(
+            AcademicSession.objects.filter(school=school, is_current=True).values('pk')[:1]
+        ),
+        stats_classes_count=count_subquery(Class.objects.filter(school=school, is_active=True)),
+        stats_enrollments_count=count_subquery(Enrollment.objects.filter(
+            class_enrolled__school=school,
+            session__school=school,
+            session__is_current=True,
+            is_active=True
+        )),
+        stats_posts_count=count_subquery(Post.objects.filter(school=school, is_published=True)),
+        stats_events_count=count_subquery(Event.objects.filter(school=school, start_date__gte=timezone.now())),
+    )
+
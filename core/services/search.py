@@ -0,0 +1,219 @@
+import re
+import unicodedata
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection, transaction
+from django.db.models import Case, Count, Q, Sum, Value, When
+
+from core.models import Post, School, SearchTerm, TeacherGroup, User
+
+from .timelines import visible_posts
+
+# Words are indexed with every prefix from MIN_TERM_LENGTH characters on,
+# so a prefix query is an equality lookup; longer words are cut to the
+# length of SearchTerm.term
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 20
+# Distinct words indexed per field, which bounds the entries of long posts
+MAX_FIELD_WORDS = 200
+MAX_QUERY_TERMS = 8
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 50
+INDEX_BATCH_SIZE = 500
+# PostgreSQL only: query words with no exact entry also match indexed terms
+# this similar to them (pg_trgm), best first
+FUZZY_SIMILARITY = 0.4
+FUZZY_TERMS = 5
+
+WORD = re.compile(r'\w+')
+PROFILE_FOR_USER_TYPE = {
+    'student': 'student_profile',
+    'teacher': 'teacher_profile',
+    'principal': 'principal_profile',
+}
+
+
+def words(text):
+    """The words of `text`, casefolded and stripped of accents"""
+    decomposed = unicodedata.normalize('NFKD', str(text or ''))
+    return WORD.findall(''.join(char for char in decomposed if not unicodedata.combining(char)).casefold())
+
+
+def query_terms(query):
+    """The distinct index terms a search query looks up, in order"""
+    terms = []
+    for word in words(query):
+        word = word[:MAX_TERM_LENGTH]
+        if len(word) >= MIN_TERM_LENGTH and word not in terms:
+            terms.append(word)
+    return terms[:MAX_QUERY_TERMS]
+
+
+def _user_school(user):
+    profile = PROFILE_FOR_USER_TYPE.get(user.user_type)
+    if profile is None:
+        return None
+    try:
+        return getattr(user, profile).school_id
+    except ObjectDoesNotExist:
+        return None
+
+
+# Per kind: the school the object is scoped to and its fields by weight
+DOCUMENTS = {
+    'user': lambda user: (_user_school(user), [
+        (user.first_name, 3), (user.last_name, 3), (user.email, 1),
+    ]),
+    'school': lambda school: (school.pk, [
+        (school.name, 3), (school.city, 1), (school.state, 1),
+    ]),
+    'post': lambda post: (post.school_id, [
+        (post.title, 3), (' '.join(map(str, post.tags)) if isinstance(post.tags, list) else '', 2), (post.content, 1),
+    ]),
+    'group': lambda group: (group.school_id, [
+        (group.name, 3), (group.description, 1),
+    ]),
+}
+
+# What each kind is indexed from
+SOURCES = {
+    'user': lambda: User.objects.select_related('student_profile', 'teacher_profile', 'principal_profile'),
+    'school': lambda: School.objects.all(),
+    'post': lambda: Post.objects.all(),
+    'group': lambda: TeacherGroup.objects.all(),
+}
+
+SEARCH_KINDS = {User: 'user', School: 'school', Post: 'post', TeacherGroup: 'group'}
+
+
+def document_terms(fields):
+    """
+    Index terms for a document's (text, weight) fields, each at the best
+    weight it reaches; a whole word counts double the prefixes of one
+    """
+    terms = {}
+    for text, weight in fields:
+        for word in list(dict.fromkeys(words(text)))[:MAX_FIELD_WORDS]:
+            word = word[:MAX_TERM_LENGTH]
+            if len(word) < MIN_TERM_LENGTH:
+                continue
+            terms[word] = max(terms.get(word, 0), 2 * weight)
+            for end in range(MIN_TERM_LENGTH, len(word)):
+                terms[word[:end]] = max(terms.get(word[:end], 0), weight)
+    return terms
+
+
+def _entries(kind, obj):
+    school_id, fields = DOCUMENTS[kind](obj)
+    return [
+        SearchTerm(term=term, kind=kind, weight=weight, school_id=school_id, **{kind: obj})
+        for term, weight in document_terms(fields).items()
+    ]
+
+
+def index_objects(kind, objects):
+    """Replace the index entries of `objects`, all of one kind"""
+    objects = list(objects)
+    if not objects:
+        return
+    entries = [entry for obj in objects for entry in _entries(kind, obj)]
+    with transaction.atomic():
+        SearchTerm.objects.filter(kind=kind, **{f'{kind}__in': objects}).delete()
+        SearchTerm.objects.bulk_create(entries, batch_size=INDEX_BATCH_SIZE)
+
+
+def rebuild_search_index(kinds=None):
+    """
+    Re-index every object of `kinds` (all kinds by default), e.g. after
+    rows were written with bulk_create or QuerySet.update()
+    """
+    for kind in kinds or DOCUMENTS:
+        with transaction.atomic():
+            SearchTerm.objects.filter(kind=kind).delete()
+            batch = []
+            for obj in SOURCES[kind]().order_by('pk').iterator(chunk_size=INDEX_BATCH_SIZE):
+                batch.extend(_entries(kind, obj))
+                if len(batch) >= INDEX_BATCH_SIZE:
+                    SearchTerm.objects.bulk_create(batch, batch_size=INDEX_BATCH_SIZE)
+                    batch = []
+            SearchTerm.objects.bulk_create(batch, batch_size=INDEX_BATCH_SIZE)
+
+
+def _term_groups(kind, terms):
+    """
+    The indexed terms each query term matches: itself and, on PostgreSQL,
+    similar terms if it has no entry of its own
+    """
+    groups = [{term} for term in terms]
+    if connection.vendor != 'postgresql':
+        return groups
+    found = set(SearchTerm.objects.filter(kind=kind, term__in=terms).values_list('term', flat=True).distinct())
+    with connection.cursor() as cursor:
+        for term, group in zip(terms, groups):
+            if term in found:
+                continue
+            # `%` is pg_trgm's similarity operator, answered from its GIN index
+            cursor.execute(
+                'SELECT term FROM (SELECT DISTINCT term FROM search_terms WHERE kind = %s AND term %% %s) AS similar'
+                ' WHERE similarity(term, %s) >= %s ORDER BY similarity(term, %s) DESC LIMIT %s',
+                [kind, term, term, FUZZY_SIMILARITY, term, FUZZY_TERMS],
+            )
+            group.update(row[0] for row in cursor.fetchall())
+    return groups
+
+
+def matching(kind, query, school=None, within=None):
+    """
+    Index entries of `kind` grouped by object, keeping the objects matching
+    every word of `query` (as a word or the start of one), with their score;
+    None if the query has no searchable words
+    """
+    terms = query_terms(query)
+    if not terms:
+        return None
+    groups = _term_groups(kind, terms)
+    entries = SearchTerm.objects.filter(kind=kind, term__in=set().union(*groups))
+    if school is not None:
+        entries = entries.filter(school=school)
+    if within is not None:
+        entries = entries.filter(**{f'{kind}__in': within})
+    matched = Count(Case(*[When(term__in=group, then=Value(index)) for index, group in enumerate(groups)]), distinct=True)
+    return entries.order_by().values(kind).annotate(matched=matched, score=Sum('weight')).filter(matched=len(groups))
+
+
+def searchable(kind, user):
+    """What `user` may find of `kind`, loaded with what a search result shows"""
+    if kind == 'user':
+        return User.objects.filter(is_active=True).select_related(
+            'student_profile__school', 'teacher_profile__school', 'principal_profile__school'
+        )
+    if kind == 'school':
+        return School.objects.filter(is_active=True)
+    if kind == 'post':
+        return visible_posts(user).select_related('author', 'school')
+    groups = TeacherGroup.objects.filter(is_active=True).select_related('school')
+    if not user.is_staff:
+        groups = groups.filter(
+            Q(is_public=True) | Q(pk__in=TeacherGroup.objects.filter(members__user=user).values('pk'))
+        )
+    return groups
+
+
+def search(kind, query, user, school=None, queryset=None, limit=SEARCH_LIMIT):
+    """
+    The best `limit` matches of `query` among the objects of `kind` that
+    `user` may find (or `queryset`), best first.
+
+    Ranking runs as one aggregate over the index, restricted to what the
+    user may see in the same query, and the results are loaded with one
+    more: two queries per kind whatever the size of the tables.
+    """
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    if queryset is None:
+        queryset = searchable(kind, user)
+    ranked = matching(kind, query, school=school, within=queryset.values('pk'))
+    if ranked is None:
+        return []
+    ids = [row[kind] for row in ranked.order_by('-score', kind)[:limit]]
+    objects = queryset.in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
@@ -1,178 +1,34 @@
-import africastalking
-from django.conf import settings
-
-# Initialize once
-africastalking.initialize(
-    username=settings.AFRICASTALKING_USERNAME,
-    api_key=settings.AFRICASTALKING_API_KEY
-)
-_sms = africastalking.SMS
-
-def send_sms(to: str, message: str) -> dict:
-    """
-    Send an SMS via Africa’s Talking.
-    `to` must include country code, e.g. "+2348012345678".
-    """
-    response = _sms.send(message, [to], sender_id=settings.AFRICASTALKING_SENDER)
-    return response  # production: log or inspect this
 import logging
-import requests
-from django.conf import settings
-
-logger = logging.getLogger(__name__)
 
-
-def send_sms(phone_number, message):
-    """
-    Send SMS using a third-party service (e.g., Twilio, African SMS providers)
-    This is a placeholder implementation - replace with actual SMS service
-    """
-    try:
-        # Example implementation for African SMS providers
-        # Replace with actual SMS service configuration
-        
-        if hasattr(settings, 'SMS_API_URL') and hasattr(settings, 'SMS_API_KEY'):
-            payload = {
-                'to': phone_number,
-                'message': message,
-                'api_key': settings.SMS_API_KEY
-            }
-            
-            response = requests.post(
-                settings.SMS_API_URL,
-                json=payload,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                logger.info(f"SMS sent successfully to {phone_number}")
-                return True
-            else:
-                logger.error(f"SMS failed to {phone_number}: {response.text}")
-                return False
-        else:
-            # Development/testing mode - just log the message
-            logger.info(f"SMS to {phone_number}: {message}")
-            return True
-            
-    except Exception as e:
-        logger.error(f"SMS service error: {str(e)}")
-        return False
-
-
-def send_bulk_sms(phone_numbers, message):
-    """
-    Send SMS to multiple recipients
-    """
-    results = []
-    for phone_number in phone_numbers:
-        result = send_sms(phone_number, message)
-        results.append({
-            'phone_number': phone_number,
-            'success': result
-        })
-    
-    return results
-import requests
-import logging
-from django.conf import settings
+from .sms_providers import get_provider
 
 logger = logging.getLogger(__name__)
 
 
 def send_sms(phone_number, message, sender_name="EMSU"):
     """
-    Send SMS using various SMS providers
-    This is a placeholder implementation - integrate with your preferred SMS provider
+    Send SMS through the provider configured in settings.SMS_PROVIDER,
+    reusing its long-lived client from the provider registry
     """
     try:
-        # For production, integrate with providers like:
-        # - Twilio
-        # - Africa's Talking
-        # - Bulk SMS Nigeria
-        # - Infobip
+        report = get_provider().send([phone_number], message, sender_name)[0]
+        if not report['success']:
+            logger.error(f"SMS to {phone_number} failed: {report['error']}")
+        return report['success']
         
-        # Placeholder implementation
-        if hasattr(settings, 'SMS_PROVIDER') and settings.SMS_PROVIDER == 'twilio':
-            return send_sms_twilio(phone_number, message)
-        elif hasattr(settings, 'SMS_PROVIDER') and settings.SMS_PROVIDER == 'africas_talking':
-            return send_sms_africas_talking(phone_number, message, sender_name)
-        else:
-            # Mock implementation for development
-            logger.info(f"SMS to {phone_number}: {message}")
-            return True
-            
     except Exception as e:
         logger.error(f"Error sending SMS: {str(e)}")
         return False
 
 
-def send_sms_twilio(phone_number, message):
-    """
-    Send SMS using Twilio
-    """
-    try:
-        from twilio.rest import Client
-        
-        client = Client(
-            settings.TWILIO_ACCOUNT_SID,
-            settings.TWILIO_AUTH_TOKEN
-        )
-        
-        message = client.messages.create(
-            body=message,
-            from_=settings.TWILIO_PHONE_NUMBER,
-            to=phone_number
-        )
-        
-        return True
-        
-    except Exception as e:
-        logger.error(f"Twilio SMS error: {str(e)}")
-        return False
-
-
-def send_sms_africas_talking(phone_number, message, sender_name):
-    """
-    Send SMS using Africa's Talking
-    """
-    try:
-        import africastalking
-        
-        # Initialize Africa's Talking
-        africastalking.initialize(
-            settings.AFRICAS_TALKING_USERNAME,
-            settings.AFRICAS_TALKING_API_KEY
-        )
-        
-        sms = africastalking.SMS
-        
-        response = sms.send(
-            message,
-            [phone_number],
-            sender_name
-        )
-        
-        return response['SMSMessageData']['Recipients'][0]['status'] == 'Success'
-        
-    except Exception as e:
-        logger.error(f"Africa's Talking SMS error: {str(e)}")
-        return False
-
-
 def send_bulk_sms(phone_numbers, message, sender_name="EMSU"):
     """
-    Send SMS to multiple recipients
+    Queue an SMS to multiple recipients; per-number results are recorded on
+    the returned TaskRecord
     """
-    results = []
-    for phone_number in phone_numbers:
-        result = send_sms(phone_number, message, sender_name)
-        results.append({
-            'phone_number': phone_number,
-            'success': result
-        })
+    from ..tasks import enqueue, send_bulk_sms_task
     
-    return results
+    return enqueue(send_bulk_sms_task, args=(list(phone_numbers), message, sender_name))
 
 
 def format_phone_number(phone_number, country_code="+234"):
@@ -0,0 +1,296 @@
+import logging
+import threading
+import time
+from collections import deque
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Africa's Talking status codes that mean the message was accepted
+AFRICAS_TALKING_ACCEPTED = {100, 101, 102}
+
+
+def delivery_report(phone_number, success, status, message_id='', error=''):
+    """Per-number outcome returned by every provider"""
+    return {
+        'phone_number': phone_number,
+        'success': success,
+        'status': status,
+        'message_id': message_id,
+        'error': error
+    }
+
+
+class ProviderMetrics:
+    """Thread-safe request counters and recent latencies for one provider client"""
+
+    def __init__(self, window=500):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.messages = 0
+        self.failed_messages = 0
+        self.last_error = ''
+        self.latencies = deque(maxlen=window)
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, latency, reports=None, error=None):
+        with self._lock:
+            self.in_flight -= 1
+            self.requests += 1
+            self.latencies.append(latency)
+            if error is not None:
+                self.errors += 1
+                self.last_error = str(error)
+            if reports is not None:
+                self.messages += len(reports)
+                self.failed_messages += sum(1 for report in reports if not report['success'])
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'error_rate': round(self.errors / self.requests, 4) if self.requests else 0.0,
+                'in_flight': self.in_flight,
+                'messages': self.messages,
+                'failed_messages': self.failed_messages,
+                'latency_ms': {
+                    'avg': round(1000 * sum(latencies) / len(latencies), 1) if latencies else None,
+                    'p50': round(1000 * latencies[len(latencies) // 2], 1) if latencies else None,
+                    'p95': round(1000 * latencies[int(len(latencies) * 0.95)], 1) if latencies else None,
+                },
+                'last_error': self.last_error,
+            }
+
+
+class SMSProvider:
+    """
+    Base class for SMS providers. `max_batch_size` is how many recipients a
+    single API request can address; providers without a multi-recipient API
+    leave it at 1 and are parallelised by the bulk sender instead.
+
+    Instances are long-lived (see `get_provider`) and shared between
+    threads, so they hold one HTTP session for every send.
+    """
+    name = ''
+    max_batch_size = 1
+    account = ''
+
+    def __init__(self):
+        self.metrics = ProviderMetrics()
+
+    def send(self, phone_numbers, message, sender_name):
+        """Send a batch, recording latency and errors in `metrics`"""
+        self.metrics.started()
+        start = time.monotonic()
+        try:
+            reports = self.send_batch(phone_numbers, message, sender_name)
+        except Exception as e:
+            self.metrics.finished(time.monotonic() - start, error=e)
+            raise
+        self.metrics.finished(time.monotonic() - start, reports=reports)
+        return reports
+
+    def send_batch(self, phone_numbers, message, sender_name):
+        """Send one message to a batch of numbers and return a delivery report per number"""
+        raise NotImplementedError
+
+    def warm_up(self):
+        """Open the connection to the provider ahead of the first send"""
+
+
+class AfricasTalkingProvider(SMSProvider):
+    """
+    Africa's Talking bulk messaging API, called over a shared keep-alive
+    session rather than through the SDK, which opens a new connection per
+    request.
+    """
+    name = 'africas_talking'
+    max_batch_size = 500
+
+    def __init__(self, username, api_key, timeout=30):
+        super().__init__()
+        self.username = self.account = username
+        self.timeout = timeout
+        host = 'api.sandbox.africastalking.com' if username == 'sandbox' else 'api.africastalking.com'
+        self.url = f'https://{host}/version1/messaging'
+        self.session = requests.Session()
+        # One pooled connection per bulk sender thread
+        pool_size = getattr(settings, 'SMS_BULK_MAX_WORKERS', 10)
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.headers.update({'apiKey': api_key, 'Accept': 'application/json'})
+
+    def warm_up(self):
+        self.session.head(self.url, timeout=self.timeout)
+
+    def send_batch(self, phone_numbers, message, sender_name):
+        data = {
+            'username': self.username,
+            'to': ','.join(phone_numbers),
+            'message': message,
+            'bulkSMSMode': 1
+        }
+        if sender_name:
+            data['from'] = sender_name
+
+        response = self.session.post(self.url, data=data, timeout=self.timeout)
+        response.raise_for_status()
+        recipients = response.json().get('SMSMessageData', {}).get('Recipients', [])
+
+        reports = {}
+        for recipient in recipients:
+            accepted = recipient.get('statusCode') in AFRICAS_TALKING_ACCEPTED
+            reports[recipient.get('number')] = delivery_report(
+                recipient.get('number'), accepted, recipient.get('status', ''),
+                message_id=recipient.get('messageId', ''),
+                error='' if accepted else recipient.get('status', '')
+            )
+        # Numbers the API silently dropped are reported as rejected
+        return [
+            reports.get(number) or delivery_report(number, False, 'Rejected', error='Not in provider response')
+            for number in phone_numbers
+        ]
+
+
+class TwilioProvider(SMSProvider):
+    """
+    Twilio Messaging API. It has no multi-recipient send, so each number is
+    a request; the client keeps one HTTP session for all of them.
+    """
+    name = 'twilio'
+
+    def __init__(self, account_sid, auth_token, from_number):
+        from twilio.rest import Client
+
+        super().__init__()
+        self.client = Client(account_sid, auth_token)
+        self.account = account_sid
+        self.from_number = from_number
+
+    def warm_up(self):
+        self.client.http_client.session.head('https://api.twilio.com', timeout=10)
+
+    def send_batch(self, phone_numbers, message, sender_name):
+        reports = []
+        for number in phone_numbers:
+            try:
+                sent = self.client.messages.create(body=message, from_=self.from_number, to=number)
+                reports.append(delivery_report(number, True, sent.status, message_id=sent.sid))
+            except Exception as e:
+                reports.append(delivery_report(number, False, 'failed', error=str(e)))
+        return reports
+
+
+class FakeProvider(SMSProvider):
+    """
+    In-process stand-in used in development and tests. The most recent
+    `outbox_size` sent messages are kept in `outbox` until `clear_outbox()`;
+    numbers in `fail_numbers` are reported as failed and `latency` simulates
+    the provider's round trip.
+    """
+    name = 'mock'
+
+    def __init__(self, max_batch_size=100, latency=0, fail_numbers=(), outbox_size=100):
+        super().__init__()
+        self.max_batch_size = max_batch_size
+        self.latency = latency
+        self.fail_numbers = set(fail_numbers)
+        self.outbox = deque(maxlen=outbox_size)
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def clear_outbox(self):
+        with self._lock:
+            self.outbox.clear()
+
+    def send_batch(self, phone_numbers, message, sender_name):
+        if self.latency:
+            time.sleep(self.latency)
+        reports = []
+        for number in phone_numbers:
+            if number in self.fail_numbers:
+                reports.append(delivery_report(number, False, 'failed', error='Rejected by fake provider'))
+                continue
+            with self._lock:
+                self.outbox.append({'phone_number': number, 'message': message, 'sender_name': sender_name})
+                self.sent += 1
+                message_id = f'fake-{self.sent}'
+            # Never the body, which may carry a one-time code
+            logger.info(f"SMS to {number} ({len(message)} characters)")
+            reports.append(delivery_report(number, True, 'Success', message_id=message_id))
+        return reports
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _provider_config(name):
+    """Return (factory, credentials) for a provider name"""
+    if name == 'africas_talking':
+        return AfricasTalkingProvider, (
+            settings.AFRICASTALKING_USERNAME,
+            settings.AFRICASTALKING_API_KEY,
+        )
+    if name == 'twilio':
+        return TwilioProvider, (
+            settings.TWILIO_ACCOUNT_SID,
+            settings.TWILIO_AUTH_TOKEN,
+            settings.TWILIO_PHONE_NUMBER,
+        )
+    return FakeProvider, ()
+
+
+def get_provider(name=None):
+    """
+    Return the long-lived client for the provider named in
+    settings.SMS_PROVIDER (or `name`). Clients are kept in a registry keyed
+    by provider and credentials, so every send reuses the same client and
+    its kept-alive connections, and rotated credentials get a fresh one.
+    """
+    name = name or getattr(settings, 'SMS_PROVIDER', 'mock')
+    factory, credentials = _provider_config(name)
+    key = (name,) + credentials
+    provider = _registry.get(key)
+    if provider is None:
+        with _registry_lock:
+            provider = _registry.get(key)
+            if provider is None:
+                # Drop the client for superseded credentials of this provider
+                for stale in [existing for existing in _registry if existing[0] == name]:
+                    del _registry[stale]
+                provider = _registry[key] = factory(*credentials)
+    return provider
+
+
+def warm_up_providers():
+    """
+    Build the configured provider and open its connection in the
+    background, so the first OTP after a deploy skips the TLS handshake
+    """
+    def warm():
+        try:
+            get_provider().warm_up()
+        except Exception as e:
+            logger.error(f"SMS provider warm-up failed: {str(e)}")
+
+    threading.Thread(target=warm, name='sms-warm-up', daemon=True).start()
+
+
+def provider_health():
+    """Metrics for every provider client created in this process"""
+    with _registry_lock:
+        providers = list(_registry.values())
+    return [
+        dict(provider=provider.name, account=provider.account, **provider.metrics.snapshot())
+        for provider in providers
+    ]
@@ -0,0 +1,202 @@
+from django.conf import settings
+from django.db.models import Q
+
+from core.models import Connection, FeedEntry, Post, PrincipalProfile, School, StudentProfile, TeacherProfile
+from core.utils.pagination import decode_keyset_cursor, encode_keyset_cursor
+
+FEED_PAGE_SIZE = 20
+MAX_FEED_PAGE_SIZE = 100
+# Timeline entries per INSERT when fanning a post out
+FANOUT_CHUNK_SIZE = 1000
+# Visibilities that reach an author's connections; school and teachers
+# posts reach a school's members through its page instead
+CONNECTION_VISIBILITIES = ('public', 'class')
+STAFF_TYPES = ('teacher', 'principal', 'proprietor')
+
+
+def user_schools(user):
+    """Ids of the schools `user` belongs to: their own, or their children's for a parent"""
+    if user.user_type == 'student':
+        schools = StudentProfile.objects.filter(user=user)
+    elif user.user_type == 'teacher':
+        schools = TeacherProfile.objects.filter(user=user)
+    elif user.user_type == 'principal':
+        schools = PrincipalProfile.objects.filter(user=user)
+    elif user.user_type == 'parent':
+        schools = StudentProfile.objects.filter(parents__user=user)
+    elif user.user_type == 'proprietor':
+        return list(School.objects.filter(proprietors__user=user).values_list('id', flat=True))
+    else:
+        return []
+    return list(schools.values_list('school_id', flat=True).distinct())
+
+
+def school_visibilities(user):
+    """Visibilities of a school's posts its member `user` may see"""
+    if user.is_staff or user.user_type in STAFF_TYPES:
+        return ('public', 'school', 'teachers')
+    return ('public', 'school')
+
+
+def followed_authors(user):
+    """
+    Authors whose connection posts reach `user`: everyone they have an
+    accepted connection with, except people who merely follow them
+    """
+    following = Connection.objects.filter(from_user=user, status='accepted').values('to_user')
+    connected = Connection.objects.filter(to_user=user, status='accepted').exclude(
+        connection_type='follow'
+    ).values('from_user')
+    return Q(author__in=following) | Q(author__in=connected)
+
+
+def followers(author):
+    """Accepted connections of `author` that their connection posts reach"""
+    return Connection.objects.filter(
+        Q(to_user=author) | Q(from_user=author, connection_type__in=['friend', 'classmate', 'colleague']),
+        status='accepted',
+    )
+
+
+def _follower_ids(author):
+    for from_user, to_user in followers(author).values_list('from_user_id', 'to_user_id').iterator():
+        yield to_user if from_user == author.pk else from_user
+
+
+def visible_posts(user):
+    """Posts `user` may read: the same rules the timeline is built from"""
+    schools = user_schools(user)
+    audience = (
+        Q(author=user)
+        | Q(visibility='public')
+        | Q(visibility__in=school_visibilities(user), school__in=schools)
+        | Q(followed_authors(user), visibility='class')
+    )
+    return Post.objects.filter(audience).filter(Q(is_published=True) | Q(author=user))
+
+
+def is_high_follower(author):
+    """Whether `author` has too many followers to fan their posts out on write"""
+    return followers(author).count() > settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def fan_out_post(post_id, chunk_size=FANOUT_CHUNK_SIZE):
+    """
+    Write a post to the timelines of its author and, for a published post
+    visible to connections, of the author's followers. Earlier entries are
+    replaced, so this is also how a post whose visibility changed is re-fanned.
+
+    Authors with more than FEED_FANOUT_MAX_FOLLOWERS followers only get the
+    entry in their own timeline; followers merge their posts in on read.
+
+    Returns the number of timelines written to.
+    """
+    post = Post.objects.select_related('author').filter(pk=post_id).first()
+    if post is None:
+        return 0
+    if not post.is_published:
+        FeedEntry.objects.filter(post=post).delete()
+        Post.objects.filter(pk=post.pk).update(fanned_out=False)
+        return 0
+
+    FeedEntry.objects.filter(post=post).exclude(user=post.author_id).delete()
+    FeedEntry.objects.get_or_create(user=post.author, post=post, defaults={'posted_at': post.created_at})
+    written = 1
+    fanned_out = True
+    if post.visibility in CONNECTION_VISIBILITIES:
+        if is_high_follower(post.author):
+            fanned_out = False
+        else:
+            # Two connections between the same pair yield the follower twice
+            follower_ids = set(_follower_ids(post.author))
+            entries = [FeedEntry(user_id=user_id, post=post, posted_at=post.created_at) for user_id in follower_ids]
+            FeedEntry.objects.bulk_create(entries, batch_size=chunk_size, ignore_conflicts=True)
+            written += len(entries)
+    Post.objects.filter(pk=post.pk).update(fanned_out=fanned_out)
+    return written
+
+
+def backfill_connection(connection, posts=None):
+    """
+    Copy the most recent fanned-out connection posts of each side of a newly
+    accepted connection into the timeline of the other side it reaches
+    """
+    limit = posts or settings.FEED_BACKFILL_POSTS
+    pairs = [(connection.to_user_id, connection.from_user_id)]
+    if connection.connection_type != 'follow':
+        pairs.append((connection.from_user_id, connection.to_user_id))
+    entries = []
+    for author_id, reader_id in pairs:
+        recent = Post.objects.filter(
+            author_id=author_id, visibility__in=CONNECTION_VISIBILITIES, is_published=True, fanned_out=True
+        ).order_by('-created_at').values_list('id', 'created_at')[:limit]
+        entries.extend(
+            FeedEntry(user_id=reader_id, post_id=post_id, posted_at=created_at) for post_id, created_at in recent
+        )
+    FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def remove_connection(from_user_id, to_user_id):
+    """
+    Take each side's connection posts out of the other's timeline, unless
+    another accepted connection still links them
+    """
+    if Connection.objects.filter(
+        Q(from_user_id=from_user_id, to_user_id=to_user_id) | Q(from_user_id=to_user_id, to_user_id=from_user_id),
+        status='accepted',
+    ).exists():
+        return
+    FeedEntry.objects.filter(
+        Q(user_id=from_user_id, post__author_id=to_user_id) | Q(user_id=to_user_id, post__author_id=from_user_id),
+        post__visibility__in=CONNECTION_VISIBILITIES,
+    ).delete()
+
+
+def get_feed_page(user, cursor=None, limit=FEED_PAGE_SIZE, queryset=None):
+    """
+    Fetch one page of `user`'s home timeline, newest first, keyset
+    paginated on (created_at, id).
+
+    The page is merged from three bounded reads: the user's materialized
+    timeline, the pages of their schools, and the posts of high-follower
+    connections (plus any written before timelines existed) that were not
+    fanned out. Each read takes at most limit + 1 rows from its own index,
+    so the cost is O(page) whatever the size of the network.
+
+    Posts are loaded from `queryset` (Post.objects by default) so callers
+    can attach what their serializer reads. Returns (posts, next_cursor).
+    """
+    limit = max(1, min(limit, MAX_FEED_PAGE_SIZE))
+    anchor = decode_keyset_cursor(cursor)
+    schools = user_schools(user)
+
+    branches = [
+        (FeedEntry.objects.filter(user=user), 'posted_at', 'post_id'),
+        (Post.objects.filter(
+            school__in=schools, visibility__in=school_visibilities(user), is_published=True
+        ), 'created_at', 'id'),
+        (Post.objects.filter(
+            Q(author=user) | Q(followed_authors(user), visibility__in=CONNECTION_VISIBILITIES),
+            is_published=True, fanned_out=False,
+        ), 'created_at', 'id'),
+    ]
+
+    rows = {}
+    for branch, at_field, id_field in branches:
+        if anchor:
+            at, post_id = anchor
+            branch = branch.filter(Q(**{f'{at_field}__lt': at}) | Q(**{at_field: at, f'{id_field}__lt': post_id}))
+        for post_id, at in branch.order_by(f'-{at_field}', f'-{id_field}').values_list(id_field, at_field)[:limit + 1]:
+            rows[post_id] = at
+
+    ordered = sorted(rows.items(), key=lambda row: (row[1], row[0]), reverse=True)
+    has_more = len(ordered) > limit
+    ordered = ordered[:limit]
+
+    posts = (queryset if queryset is not None else Post.objects.all()).in_bulk([post_id for post_id, at in ordered])
+    page = [posts[post_id] for post_id, at in ordered if post_id in posts]
+    next_cursor = None
+    if has_more and ordered:
+        at, post_id = ordered[-1][1], ordered[-1][0]
+        next_cursor = encode_keyset_cursor(at, post_id)
+    return page, next_cursor
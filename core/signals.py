@@ -1,29 +1,223 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from .models import Message, Announcement, Notification
-from .utils.notifications import push_notification
-
-@receiver(post_save, sender=Message)
-def notify_on_message(sender, instance: Message, created, **kwargs):
-    if created:
-        # create Notification object
-        notif = Notification.objects.create(
-            user=instance.recipient,
-            content_object=instance
-        )
-        push_notification(notif)
+from .models import (
+    Announcement, Attendance, Comment, CommentLike, Connection, Grade, Post, PostLike, PrincipalProfile, School,
+    StudentProfile, Subject, TeacherGroup, TeacherProfile, User
+)
+from .services.attendance import apply_attendance_changes, attendance_fact
+from .services.autocomplete import invalidate_autocomplete
+from .services.counters import adjust_counter, deleted_with
+from .services.results import refresh_results
+from .services.search import SEARCH_KINDS, index_objects
+from .services.timelines import backfill_connection, remove_connection
+from .tasks import enqueue, fan_out_announcement_task, fan_out_post_task
+
+# Message notifications are raised by the send paths (send_message and
+# ChatConsumer.create_message) once recipients are attached; a post_save
+# receiver on Message fires before any recipient exists.
 
 @receiver(post_save, sender=Announcement)
 def notify_on_announcement(sender, instance: Announcement, created, **kwargs):
-    if created:
-        # notify all relevant users: if school is set, notify students+teachers in that school; else all users
-        users = []
-        if instance.school:
-            users = list(instance.school.students.values_list('user_id', flat=True)) + \
-                    list(instance.school.teachers.values_list('user_id', flat=True))
-        else:
-            from django.contrib.auth import get_user_model
-            users = get_user_model().objects.values_list('id', flat=True)
-        for uid in users:
-            notif = Notification.objects.create(user_id=uid, content_object=instance)
-            push_notification(notif)
+    # Fan out once, when the announcement is first published; the delivery
+    # itself runs on the task queue so saving never waits on the audience size
+    if instance.is_published and instance.fanout_status == 'pending':
+        enqueue(fan_out_announcement_task, args=(str(instance.pk),), user=instance.author)
+
+
+# Attendance rollups follow every saved or deleted record. Bulk writes
+# (AttendanceViewSet.bulk_create) skip these receivers and apply their
+# changes in one batch instead; QuerySet.update() bypasses both, so call
+# apply_attendance_changes or rebuild_attendance_rollups after one.
+
+@receiver(pre_save, sender=Attendance)
+def remember_attendance_before_save(sender, instance: Attendance, raw=False, **kwargs):
+    instance._rollup_fact = None
+    if instance.pk and not raw:
+        instance._rollup_fact = Attendance.objects.filter(pk=instance.pk).values_list(
+            'student_id', 'class_attended_id', 'date', 'status'
+        ).first()
+
+
+@receiver(post_save, sender=Attendance)
+def roll_up_saved_attendance(sender, instance: Attendance, created, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_rollup_fact', None)
+    after = attendance_fact(instance)
+    if before != after:
+        apply_attendance_changes(added=[after], removed=[before] if before else [])
+
+
+@receiver(post_delete, sender=Attendance)
+def roll_up_deleted_attendance(sender, instance: Attendance, **kwargs):
+    apply_attendance_changes(removed=[instance])
+
+
+# Subject and term results are recomputed from the grades of whichever
+# student, subject and term a saved or deleted grade belongs to (and
+# belonged to, if those changed), re-ranking the classes involved.
+
+@receiver(pre_save, sender=Grade)
+def remember_grade_before_save(sender, instance: Grade, raw=False, **kwargs):
+    instance._result_key = None
+    if instance.pk and not raw:
+        instance._result_key = Grade.objects.filter(pk=instance.pk).values_list(
+            'student_id', 'subject_id', 'term_id'
+        ).first()
+
+
+@receiver(post_save, sender=Grade)
+def refresh_results_for_saved_grade(sender, instance: Grade, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_result_key', None)
+    refresh_results({(instance.student_id, instance.subject_id, instance.term_id)} | ({before} if before else set()))
+
+
+@receiver(post_delete, sender=Grade)
+def refresh_results_for_deleted_grade(sender, instance: Grade, **kwargs):
+    refresh_results({(instance.student_id, instance.subject_id, instance.term_id)})
+
+
+# Home timelines are written when a post is created, and rewritten when its
+# visibility or publication changes; connections bring each side's recent
+# posts into the other's timeline when accepted and take them out when
+# they end.
+
+@receiver(pre_save, sender=Post)
+def remember_post_audience(sender, instance: Post, raw=False, **kwargs):
+    instance._feed_audience = None
+    if instance.pk and not raw:
+        instance._feed_audience = Post.objects.filter(pk=instance.pk).values_list(
+            'visibility', 'is_published'
+        ).first()
+
+
+@receiver(post_save, sender=Post)
+def fan_out_saved_post(sender, instance: Post, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created or getattr(instance, '_feed_audience', None) != (instance.visibility, instance.is_published):
+        enqueue(fan_out_post_task, args=(str(instance.pk),), user=instance.author)
+
+
+@receiver(pre_save, sender=Connection)
+def remember_connection_status(sender, instance: Connection, raw=False, **kwargs):
+    instance._feed_status = None
+    if instance.pk and not raw:
+        instance._feed_status = Connection.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Connection)
+def update_timelines_for_connection(sender, instance: Connection, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_feed_status', None)
+    if instance.status == 'accepted' and before != 'accepted':
+        backfill_connection(instance)
+    elif before == 'accepted' and instance.status != 'accepted':
+        remove_connection(instance.from_user_id, instance.to_user_id)
+
+
+@receiver(post_delete, sender=Connection)
+def update_timelines_for_deleted_connection(sender, instance: Connection, **kwargs):
+    if instance.status == 'accepted':
+        remove_connection(instance.from_user_id, instance.to_user_id)
+
+
+# Like and comment counters move by one with every like or comment saved or
+# deleted, as a single UPDATE ... SET n = n + 1; rows cascading from a
+# deleted post (or comment) leave its counters alone. Bulk writes bypass
+# these receivers, so call recount_counters after one.
+
+@receiver(post_save, sender=PostLike)
+def count_saved_post_like(sender, instance: PostLike, created, raw=False, **kwargs):
+    if created and not raw:
+        adjust_counter(Post, instance.post_id, 'likes_count', 1)
+
+
+@receiver(post_delete, sender=PostLike)
+def count_deleted_post_like(sender, instance: PostLike, origin=None, **kwargs):
+    if not deleted_with(origin, Post):
+        adjust_counter(Post, instance.post_id, 'likes_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance: Comment, created, raw=False, **kwargs):
+    if created and not raw:
+        adjust_counter(Post, instance.post_id, 'comments_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance: Comment, origin=None, **kwargs):
+    if not deleted_with(origin, Post):
+        adjust_counter(Post, instance.post_id, 'comments_count', -1)
+
+
+@receiver(post_save, sender=CommentLike)
+def count_saved_comment_like(sender, instance: CommentLike, created, raw=False, **kwargs):
+    if created and not raw:
+        adjust_counter(Comment, instance.comment_id, 'likes_count', 1)
+
+
+@receiver(post_delete, sender=CommentLike)
+def count_deleted_comment_like(sender, instance: CommentLike, origin=None, **kwargs):
+    if not deleted_with(origin, Post, Comment):
+        adjust_counter(Comment, instance.comment_id, 'likes_count', -1)
+
+
+# The search index follows every saved user, school, post and teacher
+# group (and the profile a user's school comes from); deleted rows take
+# their entries with them. Saves that only touch other fields, such as
+# last_login on every sign-in, are skipped. Bulk writes bypass these
+# receivers, so call index_objects or rebuild_search_index after one.
+
+SEARCH_FIELDS = {
+    User: {'first_name', 'last_name', 'email', 'user_type'},
+    School: {'name', 'city', 'state'},
+    Post: {'title', 'content', 'tags', 'school'},
+    TeacherGroup: {'name', 'description', 'school'},
+}
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=School)
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=TeacherGroup)
+def index_saved_object(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not SEARCH_FIELDS[sender] & set(update_fields)):
+        return
+    index_objects(SEARCH_KINDS[sender], [instance])
+
+
+@receiver(post_save, sender=StudentProfile)
+@receiver(post_save, sender=TeacherProfile)
+@receiver(post_save, sender=PrincipalProfile)
+def index_profile_user(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_objects('user', [instance.user])
+
+
+# Typeahead indexes refresh on their own every AUTOCOMPLETE_REFRESH_SECONDS;
+# a change made in this process rebuilds its indexes straight away.
+
+AUTOCOMPLETE_KINDS = {School: 'schools', Subject: 'subjects', User: 'users'}
+
+
+@receiver(post_save, sender=School)
+@receiver(post_save, sender=Subject)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=School)
+@receiver(post_delete, sender=Subject)
+@receiver(post_delete, sender=User)
+def refresh_autocomplete(sender, instance, update_fields=None, **kwargs):
+    if sender is User and update_fields is not None and not SEARCH_FIELDS[User] & set(update_fields):
+        return
+    invalidate_autocomplete(AUTOCOMPLETE_KINDS[sender])
+
+
+@receiver(post_save, sender=StudentProfile)
+@receiver(post_save, sender=TeacherProfile)
+@receiver(post_save, sender=PrincipalProfile)
+def refresh_user_autocomplete(sender, instance, raw=False, **kwargs):
+    invalidate_autocomplete('users')
@@ -0,0 +1,201 @@
+import logging
+
+from celery import Task, shared_task
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Class, ImportJob, Notification, PrincipalProfile, School, StudentProfile, TaskRecord, TeacherProfile, Term, User
+from .services.announcements import fan_out_announcement
+from .services.bulk_sms import send_bulk
+from .services.imports import run_import
+from .services.invites import send_invites
+from .services.notification_dispatcher import push_notifications
+from .services.report_cards import generate_report_cards
+from .services.sms import send_sms
+from .services.timelines import fan_out_post
+from .utils.notifications import create_notification
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryFailed(Exception):
+    """Raised when a provider reports a failed delivery so the task is retried"""
+
+
+class TrackedTask(Task):
+    """
+    Base task that retries transient failures with backoff and mirrors its
+    lifecycle onto the TaskRecord created by `enqueue`. Tasks that are not
+    safe to repeat (they would notify someone twice) opt out of retries.
+    """
+    # OSError covers SMTP, socket and timeout errors from providers
+    autoretry_for = (DeliveryFailed, OSError)
+    retry_backoff = True
+    retry_backoff_max = 600
+    retry_jitter = True
+    max_retries = 5
+
+    def before_start(self, task_id, args, kwargs):
+        TaskRecord.objects.filter(pk=task_id).update(
+            status='running', attempts=F('attempts') + 1, started_at=timezone.now()
+        )
+
+    def on_retry(self, exc, task_id, args, kwargs, einfo):
+        TaskRecord.objects.filter(pk=task_id).update(status='retrying', error=str(exc))
+
+    def on_success(self, retval, task_id, args, kwargs):
+        TaskRecord.objects.filter(pk=task_id).update(
+            status='succeeded', result=retval, error='', finished_at=timezone.now()
+        )
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        logger.error(f"Task {self.name} failed: {str(exc)}")
+        TaskRecord.objects.filter(pk=task_id).update(
+            status='failed', error=str(exc), finished_at=timezone.now()
+        )
+
+    def update_progress(self, progress, total=None):
+        """Record how far a long-running task has got"""
+        fields = {'progress': progress}
+        if total is not None:
+            fields['total'] = total
+        TaskRecord.objects.filter(pk=self.request.id).update(**fields)
+
+
+def enqueue(task, args=(), kwargs=None, user=None):
+    """
+    Record a task and send it to its queue once the current transaction
+    commits, so workers never see rows the request has not written yet.
+
+    Returns the TaskRecord, whose id is also the Celery task id.
+    """
+    queue = settings.CELERY_TASK_ROUTES.get(task.name, {}).get('queue', settings.CELERY_TASK_DEFAULT_QUEUE)
+    record = TaskRecord.objects.create(name=task.name, queue=queue, created_by=user)
+    transaction.on_commit(
+        lambda: task.apply_async(args=args, kwargs=kwargs or {}, task_id=str(record.id))
+    )
+    return record
+
+
+@shared_task(base=TrackedTask, bind=True)
+def send_email_task(self, subject, message, recipient_list):
+    """Send a plain text email"""
+    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, recipient_list, fail_silently=False)
+    return len(recipient_list)
+
+
+# OTP codes sent through this task are valid for 10 minutes, so retries are
+# kept well inside that rather than backing off to TrackedTask's 600 s
+@shared_task(base=TrackedTask, bind=True, retry_backoff_max=60)
+def send_sms_task(self, phone_number, message, sender_name="EMSU"):
+    """Send a single SMS, retrying while the provider reports failure"""
+    if not send_sms(phone_number, message, sender_name):
+        raise DeliveryFailed(f"SMS to {phone_number} was not accepted")
+    return True
+
+
+@shared_task(base=TrackedTask, bind=True, autoretry_for=())
+def send_bulk_sms_task(self, phone_numbers, message, sender_name="EMSU"):
+    """
+    Send the same SMS to many recipients and return a delivery report per
+    number. Failures are reported rather than retried, so numbers that
+    succeeded are never sent twice.
+    """
+    self.update_progress(0, len(phone_numbers))
+    return send_bulk(
+        phone_numbers, message, sender_name,
+        on_progress=lambda done, total: self.update_progress(done, total)
+    )
+
+
+@shared_task(base=TrackedTask, bind=True, autoretry_for=())
+def notify_school_users_task(self, school_id, title, message, notification_type="info", exclude_user_id=None):
+    """Notify every active student, teacher and principal of a school"""
+    school = School.objects.get(id=school_id)
+    users = User.objects.filter(
+        id__in=StudentProfile.objects.filter(school=school, is_active=True).values('user_id')
+    ) | User.objects.filter(
+        id__in=TeacherProfile.objects.filter(school=school, is_active=True).values('user_id')
+    ) | User.objects.filter(
+        id__in=PrincipalProfile.objects.filter(school=school, is_active=True).values('user_id')
+    )
+    if exclude_user_id:
+        users = users.exclude(id=exclude_user_id)
+
+    users = list(users)
+    self.update_progress(0, len(users))
+    for index, user in enumerate(users, start=1):
+        create_notification(
+            recipient=user,
+            title=title,
+            message=message,
+            notification_type=notification_type
+        )
+        if index % 100 == 0:
+            self.update_progress(index)
+    self.update_progress(len(users))
+    return len(users)
+
+
+@shared_task(base=TrackedTask, bind=True, autoretry_for=())
+def bulk_notify_task(self, recipient_ids, title, message, notification_type="info"):
+    """Create notifications for many users in one insert and push them in one batch"""
+    notifications = Notification.objects.bulk_create([
+        Notification(
+            recipient_id=recipient_id,
+            title=title,
+            message=message,
+            notification_type=notification_type
+        )
+        for recipient_id in recipient_ids
+    ])
+    push_notifications(notifications)
+    return len(notifications)
+
+
+@shared_task(base=TrackedTask, bind=True, autoretry_for=())
+def fan_out_announcement_task(self, announcement_id):
+    """Deliver a published announcement to its audience"""
+    return fan_out_announcement(announcement_id)
+
+
+@shared_task(base=TrackedTask, bind=True)
+def fan_out_post_task(self, post_id):
+    """Write a new or changed post to its audience's home timelines"""
+    return fan_out_post(post_id)
+
+
+@shared_task(base=TrackedTask, bind=True, autoretry_for=())
+def generate_report_cards_task(self, term_id, class_ids):
+    """Render the term's report cards for each class into a zip per class"""
+    term = Term.objects.select_related('session').get(pk=term_id)
+    classes = Class.objects.filter(id__in=class_ids).select_related('school').order_by('level', 'name')
+    return generate_report_cards(
+        list(classes), term,
+        on_progress=lambda done, total: self.update_progress(done, total)
+    )
+
+
+@shared_task(base=TrackedTask, bind=True)
+def run_import_task(self, job_id):
+    """
+    Load an import job's spreadsheet. Batches commit as they finish, so a
+    retry (or a resumed job) carries on after the last one.
+    """
+    created_by = ImportJob.objects.select_related('created_by').get(pk=job_id).created_by
+    return run_import(
+        job_id,
+        on_progress=lambda done, total: self.update_progress(done, total),
+        on_invite=lambda user_ids: enqueue(
+            send_invites_task, args=([str(user_id) for user_id in user_ids],), user=created_by
+        ),
+    )
+
+
+@shared_task(base=TrackedTask, bind=True, autoretry_for=())
+def send_invites_task(self, user_ids):
+    """Email invites to imported users who have not chosen a password"""
+    return send_invites(user_ids)
@@ -1,3 +1,748 @@
+import datetime
+import itertools
+from decimal import Decimal
+
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import (
+    AcademicSession, Announcement, Attendance, AttendanceRollup, Class, Comment, CommentLike, Connection, Conversation,
+    ConversationParticipant, Enrollment, FeedEntry, Grade, Message, MessageRecipient, Notification, ParentProfile, Post,
+    PostLike, PrincipalProfile, ProprietorProfile, School, StudentProfile, Subject, SubjectResult, TeacherClass,
+    TeacherGroup, TeacherProfile, TeacherSubject, Term, TermResult, User,
+)
+from core.services.attendance import COUNTERS, rebuild_attendance_rollups, rollup_counts, rollup_key
+from core.services.conversations import (
+    add_recipients, get_conversation_summaries, mark_conversation_read, mark_message_read,
+)
+from core.services.counters import recount_counters, toggle_post_like
+from core.services.timelines import get_feed_page
+from core.urls import router
+
+_sequence = itertools.count()
+
+
+def make_user(user_type, **fields):
+    n = next(_sequence)
+    return User.objects.create_user(
+        email=f'{user_type}{n}@example.com', first_name=user_type.title(), last_name=str(n),
+        user_type=user_type, **fields
+    )
+
+
+def make_school(**fields):
+    n = next(_sequence)
+    return School.objects.create(
+        name=f'School {n}', address='1 School Road', city='Lagos', state='Lagos', phone='08000000000',
+        email=f'school{n}@example.com', school_type='secondary', ownership_type='private',
+        registration_number=f'REG-{n}', **fields
+    )
+
+
+def make_student(school, **fields):
+    user = make_user('student')
+    return StudentProfile.objects.create(
+        user=user, school=school, admission_number=f'ADM-{user.last_name}', date_of_birth=datetime.date(2010, 1, 1),
+        gender='male', address='1 Home Road', state_of_origin='Lagos', admission_date=datetime.date(2020, 9, 1),
+        guardian_name='Guardian', guardian_phone='08000000000', emergency_contact='Guardian',
+        emergency_phone='08000000000', **fields
+    )
+
+
+def make_teacher(school):
+    user = make_user('teacher')
+    return TeacherProfile.objects.create(user=user, school=school, employee_id=f'EMP-{user.last_name}')
+
+
+def make_principal(school):
+    user = make_user('principal')
+    return PrincipalProfile.objects.create(user=user, school=school, employee_id=f'EMP-{user.last_name}')
+
+
+class SchoolListQueryTests(TestCase):
+    """The school list annotates every school's statistics in one pass"""
+
+    SCHOOLS = 105
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('parent')
+        Subject.objects.create(name='Mathematics', code='MTH')
+        # Schools with nothing to count still cost queries each if unplanned
+        empty_schools = School.objects.bulk_create([
+            School(name=f'Empty School {n}', slug=f'empty-school-{n}', address='a', city='Abuja', state='FCT',
+                   phone='0', email=f'empty{n}@example.com', school_type='primary', ownership_type='public',
+                   registration_number=f'EMPTY-{n}')
+            for n in range(cls.SCHOOLS - 5)
+        ])
+        AcademicSession.objects.bulk_create([
+            AcademicSession(school=school, name='2025/2026', start_date=datetime.date(2025, 9, 1),
+                            end_date=datetime.date(2026, 7, 31), is_current=True)
+            for school in empty_schools
+        ])
+        for _ in range(5):
+            school = make_school()
+            session = AcademicSession.objects.create(
+                school=school, name='2025/2026', start_date=datetime.date(2025, 9, 1),
+                end_date=datetime.date(2026, 7, 31), is_current=True
+            )
+            school_class = Class.objects.create(school=school, name='JSS 1', level='jss1')
+            teacher = make_teacher(school)
+            for _ in range(3):
+                student = make_student(school, current_class=school_class)
+                Enrollment.objects.create(student=student, class_enrolled=school_class, session=session)
+            Post.objects.create(author=teacher.user, school=school, content='Welcome back', visibility='public')
+        cls.school = school
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        # Count, page, and the subject count shared by the page
+        for limit in (1, 20, 100):
+            with self.subTest(limit=limit), self.assertNumQueries(3):
+                response = self.client.get('/api/schools/', {'limit': limit})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_annotated_statistics_match_the_counts(self):
+        response = self.client.get('/api/schools/', {'limit': 200})
+        school = next(row for row in response.data['results'] if row['id'] == str(self.school.pk))
+        self.assertEqual(school['total_users'], 4)
+        self.assertEqual(school['statistics'], {
+            'classes_count': 1,
+            'subjects_count': 1,
+            'enrollments_count': 3,
+            'posts_count': 1,
+            'events_count': 0,
+        })
+
+
+class ListQueryBudgetTests(TestCase):
+    """Every router list endpoint serves a page in a fixed number of queries"""
+
+    # Queries per list page, whatever its size; a new viewset needs a budget
+    QUERY_BUDGETS = {
+        'users': 2,
+        'schools': 3,
+        'classes': 3,
+        'subjects': 2,
+        'teachers': 6,
+        'students': 4,
+        'parents': 5,
+        'principals': 2,
+        'enrollments': 2,
+        'attendance': 2,
+        'grades': 2,
+        'messages': 4,
+        'announcements': 2,
+        'notifications': 2,
+        'posts': 6,
+        'comments': 4,
+        'connections': 2,
+        'teacher-groups': 7,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('proprietor', is_staff=True)
+        proprietor = ProprietorProfile.objects.create(user=cls.user)
+        subjects = [Subject.objects.create(name=f'Subject {n}', code=f'SUB{n}') for n in range(2)]
+        today = timezone.now().date()
+        for _ in range(2):
+            school = make_school()
+            proprietor.schools.add(school)
+            session = AcademicSession.objects.create(
+                school=school, name='2025/2026', start_date=datetime.date(2025, 9, 1),
+                end_date=datetime.date(2026, 7, 31), is_current=True
+            )
+            term = Term.objects.create(
+                session=session, name='first', start_date=datetime.date(2025, 9, 1),
+                end_date=datetime.date(2025, 12, 15), is_current=True
+            )
+            principal = make_principal(school)
+            teachers = [make_teacher(school) for _ in range(2)]
+            classes = [
+                Class.objects.create(school=school, name=f'JSS {n}', level=f'jss{n}', class_teacher=teacher)
+                for n, teacher in enumerate(teachers, start=1)
+            ]
+            for teacher in teachers:
+                TeacherSubject.objects.create(teacher=teacher, subject=subjects[0], session=session)
+                for school_class in classes:
+                    TeacherClass.objects.create(
+                        teacher=teacher, class_assigned=school_class, subject=subjects[0], session=session
+                    )
+            group = TeacherGroup.objects.create(name='Staff Room', creator=teachers[0], school=school)
+            group.members.set(teachers)
+
+            students = []
+            for n in range(4):
+                school_class = classes[n % 2]
+                student = make_student(school, current_class=school_class)
+                students.append(student)
+                Enrollment.objects.create(student=student, class_enrolled=school_class, session=session)
+                Attendance.objects.create(
+                    student=student, class_attended=school_class, date=today, status='present', marked_by=teachers[0]
+                )
+                for subject in subjects:
+                    Grade.objects.create(
+                        student=student, subject=subject, class_taken=school_class, term=term,
+                        assessment_type='exam', score=50 + n, total_marks=100, teacher=teachers[0]
+                    )
+            for first, second in (students[:2], students[2:]):
+                parent = ParentProfile.objects.create(user=make_user('parent'), relationship='father')
+                parent.children.set([first, second])
+
+            Announcement.objects.create(
+                school=school, title='Resumption', content='School resumes on Monday', author=principal.user,
+                is_published=True
+            )
+            for teacher in teachers:
+                post = Post.objects.create(author=teacher.user, school=school, content='Welcome back', visibility='public')
+                PostLike.objects.create(post=post, user=students[0].user)
+                comment = Comment.objects.create(post=post, author=students[0].user, content='Thank you')
+                CommentLike.objects.create(comment=comment, user=students[1].user)
+                Comment.objects.create(post=post, author=students[1].user, content='Same here', parent=comment)
+            for student in students:
+                Connection.objects.create(from_user=student.user, to_user=cls.user)
+                message = Message.objects.create(sender=student.user, subject='Fees', body='When are fees due?')
+                add_recipients(message, [cls.user, principal.user])
+                Notification.objects.create(recipient=cls.user, title='Fees', message='A parent asked about fees')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_every_router_viewset_has_a_budget(self):
+        self.assertEqual({prefix for prefix, viewset, basename in router.registry}, set(self.QUERY_BUDGETS))
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        for prefix, viewset, basename in router.registry:
+            for limit in (1, 100):
+                with self.subTest(endpoint=prefix, limit=limit):
+                    with self.assertNumQueries(self.QUERY_BUDGETS[prefix]):
+                        response = self.client.get(f'/api/{prefix}/', {'limit': limit})
+                    self.assertEqual(response.status_code, 200)
+                    # Several rows on the larger page, so per-row queries would show
+                    self.assertGreater(response.data['count'], 1)
+                    self.assertEqual(len(response.data['results']), min(limit, response.data['count']))
+
+
+class ConversationCounterTests(TestCase):
+    """Conversations keep each member's unread count as messages are sent and read"""
+
+    def setUp(self):
+        self.sender = make_user('teacher')
+        self.recipient = make_user('parent')
+        self.other = make_user('parent')
+
+    def send(self, sender, recipients, body='Hello'):
+        message = Message.objects.create(sender=sender, subject='', body=body)
+        add_recipients(message, recipients)
+        return message
+
+    def membership(self, user, counterpart):
+        return ConversationParticipant.objects.get(user=user, counterpart=counterpart)
+
+    def test_sending_counts_unread_for_recipients_only(self):
+        self.send(self.sender, [self.recipient, self.other])
+        last = self.send(self.sender, [self.recipient])
+
+        self.assertEqual(self.membership(self.recipient, self.sender).unread_count, 2)
+        self.assertEqual(self.membership(self.other, self.sender).unread_count, 1)
+        self.assertEqual(self.membership(self.sender, self.recipient).unread_count, 0)
+        self.assertEqual(ConversationParticipant.objects.filter(user=self.sender).count(), 2)
+        conversation = Conversation.objects.get(
+            participant_key=Conversation.key_for(self.sender.pk, self.recipient.pk)
+        )
+        self.assertEqual(conversation.last_message, last)
+        self.assertEqual(conversation.participants.count(), 2)
+
+    def test_a_reply_counts_for_the_original_sender(self):
+        self.send(self.sender, [self.recipient])
+        self.send(self.recipient, [self.sender])
+
+        self.assertEqual(self.membership(self.sender, self.recipient).unread_count, 1)
+        self.assertEqual(self.membership(self.recipient, self.sender).unread_count, 1)
+        self.assertEqual(Conversation.objects.count(), 1)
+
+    def test_reading_a_message_decrements_once(self):
+        first = self.send(self.sender, [self.recipient])
+        self.send(self.sender, [self.recipient])
+
+        self.assertTrue(mark_message_read(self.recipient, first.pk))
+        self.assertFalse(mark_message_read(self.recipient, first.pk))
+        self.assertEqual(self.membership(self.recipient, self.sender).unread_count, 1)
+
+    def test_reading_the_conversation_clears_the_count(self):
+        self.send(self.sender, [self.recipient])
+        self.send(self.sender, [self.recipient])
+        self.send(self.other, [self.recipient])
+
+        self.assertEqual(mark_conversation_read(self.recipient, self.sender), 2)
+        self.assertEqual(self.membership(self.recipient, self.sender).unread_count, 0)
+        self.assertEqual(self.membership(self.recipient, self.other).unread_count, 1)
+        self.assertFalse(MessageRecipient.objects.filter(
+            recipient=self.recipient, message__sender=self.sender, is_read=False
+        ).exists())
+
+    def test_summary_of_a_conversation_without_messages(self):
+        message = self.send(self.sender, [self.recipient])
+        message.delete()
+
+        conversations, next_cursor = get_conversation_summaries(self.recipient)
+        self.assertEqual(len(conversations), 1)
+        self.assertIsNone(conversations[0]['last_message'])
+        self.assertIsNone(next_cursor)
+
+
+class AttendanceRollupTests(TestCase):
+    """Attendance rollups follow every record saved or deleted"""
+
+    def setUp(self):
+        self.school = make_school()
+        session = AcademicSession.objects.create(
+            school=self.school, name='2025/2026', start_date=datetime.date(2025, 9, 1),
+            end_date=datetime.date(2026, 7, 31), is_current=True
+        )
+        self.term = Term.objects.create(
+            session=session, name='first', start_date=datetime.date(2025, 9, 1),
+            end_date=datetime.date(2025, 12, 15), is_current=True
+        )
+        self.date = datetime.date(2025, 10, 6)
+        self.first_class = Class.objects.create(school=self.school, name='JSS 1', level='jss1')
+        self.second_class = Class.objects.create(school=self.school, name='JSS 2', level='jss2')
+        self.student = make_student(self.school, current_class=self.first_class)
+        self.classmate = make_student(self.school, current_class=self.first_class)
+
+    def mark(self, student, status, date=None, school_class=None):
+        return Attendance.objects.create(
+            student=student, class_attended=school_class or self.first_class, date=date or self.date, status=status
+        )
+
+    def counts(self, scope, entity, period, value='all'):
+        counts = rollup_counts(rollup_key(scope, entity.pk, period, value))
+        return {counter: count for counter, count in counts.items() if count}
+
+    def maintained(self):
+        return {
+            row.pop('key'): row
+            for row in AttendanceRollup.objects.exclude(total=0).values('key', *COUNTERS)
+        }
+
+    def assertMatchesRebuild(self):
+        maintained = self.maintained()
+        rebuild_attendance_rollups()
+        self.assertEqual(maintained, self.maintained())
+
+    def test_create_counts_every_scope_and_period(self):
+        self.mark(self.student, 'present')
+        self.mark(self.classmate, 'late')
+        # A day outside the term only counts towards the day and all time
+        self.mark(self.student, 'absent', date=datetime.date(2026, 1, 5))
+
+        self.assertEqual(self.counts('school', self.school, 'day', self.date.isoformat()),
+                         {'total': 2, 'present': 1, 'late': 1})
+        self.assertEqual(self.counts('class', self.first_class, 'term', self.term.pk),
+                         {'total': 2, 'present': 1, 'late': 1})
+        self.assertEqual(self.counts('student', self.student, 'term', self.term.pk), {'total': 1, 'present': 1})
+        self.assertEqual(self.counts('student', self.student, 'total'), {'total': 2, 'present': 1, 'absent': 1})
+        self.assertMatchesRebuild()
+
+    def test_edit_moves_the_count(self):
+        attendance = self.mark(self.student, 'present')
+        attendance.status = 'absent'
+        attendance.class_attended = self.second_class
+        attendance.save()
+
+        self.assertEqual(self.counts('class', self.first_class, 'term', self.term.pk), {})
+        self.assertEqual(self.counts('class', self.second_class, 'term', self.term.pk), {'total': 1, 'absent': 1})
+        self.assertEqual(self.counts('school', self.school, 'total'), {'total': 1, 'absent': 1})
+        self.assertMatchesRebuild()
+
+    def test_delete_removes_the_count(self):
+        self.mark(self.student, 'present')
+        self.mark(self.classmate, 'excused').delete()
+
+        self.assertEqual(self.counts('school', self.school, 'term', self.term.pk), {'total': 1, 'present': 1})
+        self.assertEqual(self.counts('student', self.classmate, 'total'), {})
+        self.assertMatchesRebuild()
+
+    def test_cascade_deletes_remove_the_counts(self):
+        self.mark(self.student, 'present')
+        self.mark(self.classmate, 'absent')
+        self.mark(self.classmate, 'late', date=datetime.date(2025, 10, 7), school_class=self.second_class)
+
+        student_id = self.student.pk
+        self.student.delete()
+        self.assertEqual(self.counts('school', self.school, 'total'), {'total': 2, 'absent': 1, 'late': 1})
+        self.assertFalse(AttendanceRollup.objects.filter(student=student_id).exists())
+
+        self.second_class.delete()
+        self.assertEqual(self.counts('school', self.school, 'total'), {'total': 1, 'absent': 1})
+        self.assertEqual(self.counts('student', self.classmate, 'term', self.term.pk), {'total': 1, 'absent': 1})
+        self.assertMatchesRebuild()
+
+
+class ResultPositionTests(TestCase):
+    """Results rank each class by score as grades change, tied scores sharing a position"""
+
+    def setUp(self):
+        school = make_school()
+        session = AcademicSession.objects.create(
+            school=school, name='2025/2026', start_date=datetime.date(2025, 9, 1),
+            end_date=datetime.date(2026, 7, 31), is_current=True
+        )
+        self.term = Term.objects.create(
+            session=session, name='first', start_date=datetime.date(2025, 9, 1),
+            end_date=datetime.date(2025, 12, 15), is_current=True
+        )
+        self.school_class = Class.objects.create(school=school, name='JSS 1', level='jss1')
+        self.mathematics = Subject.objects.create(name='Mathematics', code='MTH')
+        self.english = Subject.objects.create(name='English', code='ENG')
+        self.students = [make_student(school, current_class=self.school_class) for _ in range(4)]
+        self.grades = {}
+        for student, score in zip(self.students, (80, 70, 70, 60)):
+            for subject in (self.mathematics, self.english):
+                self.grades[student, subject] = Grade.objects.create(
+                    student=student, subject=subject, class_taken=self.school_class, term=self.term,
+                    assessment_type='exam', score=score, total_marks=100
+                )
+
+    def positions(self, subject=None):
+        if subject is None:
+            results = TermResult.objects.filter(term=self.term)
+        else:
+            results = SubjectResult.objects.filter(term=self.term, subject=subject)
+        positions = dict(results.values_list('student', 'position'))
+        return [positions.get(student.pk) for student in self.students]
+
+    def test_tied_scores_share_a_position(self):
+        self.assertEqual(self.positions(self.mathematics), [1, 2, 2, 4])
+        self.assertEqual(self.positions(), [1, 2, 2, 4])
+        result = SubjectResult.objects.get(student=self.students[1], subject=self.mathematics)
+        self.assertEqual((result.weighted_score, result.letter_grade), (Decimal('70.00'), 'B'))
+
+    def test_breaking_and_making_ties_re_ranks_the_class(self):
+        grade = self.grades[self.students[2], self.mathematics]
+        grade.score = 90
+        grade.save()
+        self.assertEqual(self.positions(self.mathematics), [2, 3, 1, 4])
+        self.assertEqual(self.positions(self.english), [1, 2, 2, 4])
+        # The term average is (90 + 70) / 2, tying with the first student
+        self.assertEqual(self.positions(), [1, 3, 1, 4])
+
+        grade.score = 60
+        grade.save()
+        self.assertEqual(self.positions(self.mathematics), [1, 2, 3, 3])
+
+    def test_deleting_grades_drops_the_result_and_closes_the_gap(self):
+        self.grades[self.students[0], self.mathematics].delete()
+
+        self.assertEqual(self.positions(self.mathematics), [None, 1, 1, 3])
+        self.assertEqual(self.positions(self.english), [1, 2, 2, 4])
+        self.assertEqual(TermResult.objects.get(student=self.students[0]).subjects, 1)
+
+
+class AttendanceRegisterTests(TestCase):
+    """A register is upserted on (student, date), reporting each row's outcome"""
+
+    def setUp(self):
+        school = make_school()
+        self.teacher = make_teacher(school)
+        self.school_class = Class.objects.create(
+            school=school, name='JSS 1', level='jss1', class_teacher=self.teacher
+        )
+        other_class = Class.objects.create(school=school, name='JSS 2', level='jss2')
+        self.students = [make_student(school, current_class=self.school_class) for _ in range(3)]
+        self.outsider = make_student(school, current_class=other_class)
+        self.date = datetime.date(2025, 10, 6)
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher.user)
+
+    def submit(self, statuses, **row):
+        rows = [
+            {'student': student.pk, 'class_attended': str(self.school_class.pk), 'date': str(self.date),
+             'status': status, **row}
+            for student, status in statuses
+        ]
+        return self.client.post('/api/attendance/bulk_create/', rows, format='json')
+
+    def outcomes(self, response):
+        return [result['outcome'] for result in response.data['results']]
+
+    def test_resubmission_creates_updates_and_leaves_unchanged(self):
+        first, second, third = self.students
+        response = self.submit([(first, 'present'), (second, 'present')])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.outcomes(response), ['created', 'created'])
+
+        response = self.submit([(first, 'present'), (second, 'late'), (third, 'absent')])
+        self.assertEqual(self.outcomes(response), ['unchanged', 'updated', 'created'])
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['unchanged']), (1, 1, 1))
+        self.assertEqual(Attendance.objects.count(), 3)
+        self.assertEqual(Attendance.objects.get(student=second).status, 'late')
+        self.assertEqual(Attendance.objects.get(student=second).marked_by, self.teacher)
+        self.assertEqual(
+            rollup_counts(rollup_key('class', self.school_class.pk, 'day', self.date.isoformat())),
+            {'total': 3, 'present': 1, 'absent': 1, 'late': 1, 'excused': 0}
+        )
+
+    def test_invalid_rows_are_rejected_alone(self):
+        first = self.students[0]
+        response = self.submit([(first, 'present'), (first, 'absent'), (self.outsider, 'present'), (first, 'asleep')])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.outcomes(response), ['created', 'rejected', 'rejected', 'rejected'])
+        self.assertIn('date', response.data['results'][1]['errors'])
+        self.assertIn('student', response.data['results'][2]['errors'])
+        self.assertIn('status', response.data['results'][3]['errors'])
+        self.assertEqual(Attendance.objects.get().student, first)
+
+    def test_a_register_with_nothing_recordable_is_a_bad_request(self):
+        self.client.force_authenticate(make_teacher(self.school_class.school).user)
+        response = self.submit([(self.students[0], 'present')])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.outcomes(response), ['rejected'])
+        self.assertFalse(Attendance.objects.exists())
+
+
+class GradeSheetTests(TestCase):
+    """A grade sheet is upserted on each student's assessment, reporting each row's outcome"""
+
+    def setUp(self):
+        school = make_school()
+        session = AcademicSession.objects.create(
+            school=school, name='2025/2026', start_date=datetime.date(2025, 9, 1),
+            end_date=datetime.date(2026, 7, 31), is_current=True
+        )
+        self.term = Term.objects.create(
+            session=session, name='first', start_date=datetime.date(2025, 9, 1),
+            end_date=datetime.date(2025, 12, 15), is_current=True
+        )
+        self.teacher = make_teacher(school)
+        self.school_class = Class.objects.create(school=school, name='JSS 1', level='jss1')
+        self.subject = Subject.objects.create(name='Mathematics', code='MTH')
+        TeacherClass.objects.create(
+            teacher=self.teacher, class_assigned=self.school_class, subject=self.subject, session=session
+        )
+        self.students = [make_student(school, current_class=self.school_class) for _ in range(3)]
+        self.outsider = make_student(school)
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher.user)
+
+    def submit(self, scores, total_marks=100):
+        return self.client.post('/api/grades/bulk_upsert/', {
+            'class_taken': str(self.school_class.pk),
+            'subject': str(self.subject.pk),
+            'term': str(self.term.pk),
+            'assessment_type': 'exam',
+            'total_marks': total_marks,
+            'grades': [{'student': student.pk, 'score': score} for student, score in scores],
+        }, format='json')
+
+    def outcomes(self, response):
+        return [result['outcome'] for result in response.data['results']]
+
+    def test_resubmission_creates_updates_and_leaves_unchanged(self):
+        first, second, third = self.students
+        response = self.submit([(first, 70), (second, 60)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.outcomes(response), ['created', 'created'])
+
+        response = self.submit([(first, 70), (second, 85), (third, 50)])
+        self.assertEqual(self.outcomes(response), ['unchanged', 'updated', 'created'])
+        self.assertEqual(Grade.objects.count(), 3)
+        self.assertEqual(Grade.objects.get(student=second).score, 85)
+        self.assertEqual(Grade.objects.get(student=second).teacher, self.teacher)
+        positions = dict(SubjectResult.objects.filter(term=self.term).values_list('student', 'position'))
+        self.assertEqual(positions, {first.pk: 2, second.pk: 1, third.pk: 3})
+
+    def test_invalid_rows_are_rejected_alone(self):
+        first = self.students[0]
+        response = self.submit([(first, 30), (first, 35), (self.outsider, 30), (self.students[1], 45)], total_marks=40)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.outcomes(response), ['created', 'rejected', 'rejected', 'rejected'])
+        self.assertIn('student', response.data['results'][1]['errors'])
+        self.assertIn('student', response.data['results'][2]['errors'])
+        self.assertIn('score', response.data['results'][3]['errors'])
+        self.assertEqual(Grade.objects.get().student, first)
+
+    def test_teachers_of_other_subjects_cannot_enter_the_sheet(self):
+        self.client.force_authenticate(make_teacher(self.school_class.school).user)
+        response = self.submit([(self.students[0], 70)])
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Grade.objects.exists())
+
+
+class TimelineTests(TestCase):
+    """Home timelines are written on post and connection changes and merged on read"""
+
+    def setUp(self):
+        self.author = make_user('teacher')
+        self.follower = make_user('parent')
+        self.friend = make_user('parent')
+        self.followed = make_user('teacher')
+        self.stranger = make_user('parent')
+        Connection.objects.create(
+            from_user=self.follower, to_user=self.author, connection_type='follow', status='accepted'
+        )
+        Connection.objects.create(from_user=self.author, to_user=self.friend, status='accepted')
+        # Following someone does not put your posts in their timeline
+        Connection.objects.create(
+            from_user=self.author, to_user=self.followed, connection_type='follow', status='accepted'
+        )
+
+    def post(self, author, visibility='class'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(author=author, content='Homework is due Friday', visibility=visibility)
+
+    def timeline(self, user):
+        return set(FeedEntry.objects.filter(user=user).values_list('post', flat=True))
+
+    def feed(self, user):
+        posts, next_cursor = get_feed_page(user)
+        return [post.pk for post in posts]
+
+    def test_a_post_is_fanned_out_to_followers(self):
+        post = self.post(self.author)
+
+        for user in (self.author, self.follower, self.friend):
+            self.assertEqual(self.timeline(user), {post.pk})
+            self.assertEqual(self.feed(user), [post.pk])
+        for user in (self.followed, self.stranger):
+            self.assertEqual(self.timeline(user), set())
+            self.assertEqual(self.feed(user), [])
+        self.assertTrue(Post.objects.get(pk=post.pk).fanned_out)
+
+    def test_unpublishing_takes_the_post_out_of_timelines(self):
+        post = self.post(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            post.is_published = False
+            post.save()
+
+        self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+        self.assertEqual(self.feed(self.follower), [])
+
+    def test_high_follower_posts_are_merged_in_on_read(self):
+        with self.settings(FEED_FANOUT_MAX_FOLLOWERS=1):
+            post = self.post(self.author)
+        later = self.post(self.friend)
+
+        self.assertFalse(Post.objects.get(pk=post.pk).fanned_out)
+        self.assertEqual(self.timeline(self.follower), set())
+        self.assertEqual(self.timeline(self.author), {post.pk, later.pk})
+        self.assertEqual(self.feed(self.follower), [post.pk])
+        self.assertEqual(self.feed(self.friend), [later.pk, post.pk])
+        self.assertEqual(self.feed(self.stranger), [])
+
+    def test_accepting_a_connection_backfills_recent_posts(self):
+        post = self.post(self.author)
+        own = self.post(self.stranger)
+        connection = Connection.objects.create(from_user=self.stranger, to_user=self.author, connection_type='follow')
+        self.assertEqual(self.timeline(self.stranger), {own.pk})
+
+        connection.status = 'accepted'
+        connection.save()
+        self.assertEqual(self.timeline(self.stranger), {own.pk, post.pk})
+        # A follow only brings the followed author's posts to the follower
+        self.assertEqual(self.timeline(self.author), {post.pk})
+
+    def test_ending_a_connection_removes_its_posts(self):
+        post = self.post(self.author)
+        public = self.post(self.author, visibility='public')
+        Connection.objects.get(from_user=self.author, to_user=self.friend).delete()
+        self.assertEqual(self.timeline(self.friend), set())
+
+        # Another accepted connection between the pair keeps the posts
+        Connection.objects.create(
+            from_user=self.author, to_user=self.follower, connection_type='colleague', status='accepted'
+        )
+        following = Connection.objects.get(from_user=self.follower, to_user=self.author)
+        following.status = 'blocked'
+        following.save()
+        self.assertEqual(self.timeline(self.follower), {post.pk, public.pk})
+
+
+class PostCounterTests(TestCase):
+    """Like and comment counters follow every like and comment written or deleted"""
+
+    def setUp(self):
+        self.author = make_user('teacher')
+        self.reader = make_user('parent')
+        self.other_reader = make_user('parent')
+        self.post = Post.objects.create(author=self.author, content='Sports day is on Friday')
+
+    def counts(self, obj):
+        obj.refresh_from_db()
+        if isinstance(obj, Post):
+            return obj.likes_count, obj.comments_count
+        return obj.likes_count
+
+    def assertMatchesRecount(self):
+        kept = (
+            sorted(Post.objects.values_list('pk', 'likes_count', 'comments_count')),
+            sorted(Comment.objects.values_list('pk', 'likes_count')),
+        )
+        recount_counters()
+        self.assertEqual(kept, (
+            sorted(Post.objects.values_list('pk', 'likes_count', 'comments_count')),
+            sorted(Comment.objects.values_list('pk', 'likes_count')),
+        ))
+
+    def test_repeated_toggles_count_each_user_once(self):
+        self.assertEqual(toggle_post_like(self.post, self.reader), (True, 1))
+        self.assertEqual(toggle_post_like(self.post, self.reader), (False, 0))
+        self.assertEqual(toggle_post_like(self.post, self.reader), (True, 1))
+        self.assertEqual(toggle_post_like(self.post, self.other_reader), (True, 2))
+
+        client = APIClient()
+        client.force_authenticate(self.other_reader)
+        for liked, likes_count in ((False, 1), (True, 2)):
+            response = client.post(f'/api/posts/{self.post.pk}/like/')
+            self.assertEqual((response.data['liked'], response.data['likes_count']), (liked, likes_count))
+        self.assertEqual(PostLike.objects.filter(post=self.post).count(), 2)
+        self.assertMatchesRecount()
+
+    def test_deleting_a_comment_takes_its_replies_with_it(self):
+        comment = Comment.objects.create(post=self.post, author=self.reader, content='See you there')
+        Comment.objects.create(post=self.post, author=self.author, content='Bring water', parent=comment)
+        reply = Comment.objects.create(post=self.post, author=self.other_reader, content='Will do', parent=comment)
+        CommentLike.objects.create(comment=reply, user=self.author)
+        kept = Comment.objects.create(post=self.post, author=self.other_reader, content='Great')
+        CommentLike.objects.create(comment=kept, user=self.reader)
+        self.assertEqual(self.counts(self.post), (0, 4))
+
+        comment.delete()
+        self.assertEqual(self.counts(self.post), (0, 1))
+        self.assertEqual(self.counts(kept), 1)
+        self.assertMatchesRecount()
+
+    def test_deleting_a_user_takes_back_their_likes_and_comments(self):
+        comment = Comment.objects.create(post=self.post, author=self.other_reader, content='Great')
+        Comment.objects.create(post=self.post, author=self.reader, content='Agreed', parent=comment)
+        PostLike.objects.create(post=self.post, user=self.reader)
+        PostLike.objects.create(post=self.post, user=self.other_reader)
+        CommentLike.objects.create(comment=comment, user=self.reader)
+
+        self.reader.delete()
+        self.assertEqual(self.counts(self.post), (1, 1))
+        self.assertEqual(self.counts(comment), 0)
+        self.assertMatchesRecount()
+
+    def test_deleting_a_post_leaves_other_posts_alone(self):
+        other = Post.objects.create(author=self.author, content='Results are out')
+        for post in (self.post, other):
+            PostLike.objects.create(post=post, user=self.reader)
+            comment = Comment.objects.create(post=post, author=self.reader, content='Thanks')
+            CommentLike.objects.create(comment=comment, user=self.other_reader)
 
-# Create your tests here.
+        self.post.delete()
+        self.assertEqual(self.counts(other), (1, 1))
+        self.assertEqual(self.counts(Comment.objects.get(post=other)), 1)
+        self.assertMatchesRecount()
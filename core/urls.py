@@ -35,12 +35,22 @@ urlpatterns = [
 
     # AJAX endpoints
     path('api/check-email/', views.check_email_availability, name='check_email'),
-    path('api/schools/', views.get_schools, name='get_schools'),
+    path('api/autocomplete/<str:kind>/', views.autocomplete_view, name='autocomplete'),
 
     # API endpoints
-    path('api/', include(router.urls)),
     path('api/dashboard-stats/', views.dashboard_stats, name='dashboard_stats'),
     path('api/public-stats/', views.public_stats, name='public_stats'),
+    path('api/finance/revenue/', views.revenue_report, name='revenue_report'),
+    path('api/exports/<str:dataset>/', views.export_data, name='export_data'),
+    path('api/report-cards/', views.queue_report_cards, name='queue_report_cards'),
+    path('api/tasks/<uuid:task_id>/', views.task_status, name='task_status'),
+    path('api/imports/', views.import_jobs, name='import_jobs'),
+    path('api/imports/<uuid:job_id>/', views.import_job, name='import_job'),
+    path('api/imports/<uuid:job_id>/resume/', views.resume_import, name='resume_import'),
+    path('api/imports/<uuid:job_id>/errors/', views.import_errors, name='import_errors'),
+    path('api/invites/accept/', views.accept_invite, name='accept_invite'),
+    path('api/sms/health/', views.sms_provider_health, name='sms_provider_health'),
+    path('api/notifications/health/', views.notification_push_health, name='notification_push_health'),
     
     # Advanced messaging endpoints
     path('api/messages/send/', views.send_message, name='send_message'),
@@ -54,5 +64,9 @@ urlpatterns = [
     
     # School management endpoints
     path('api/schools/create/', views.create_school, name='create_school'),
+    path('api/search/', views.search_all, name='search'),
     path('api/users/search/', views.search_users, name='search_users'),
+
+    # Router last so its detail routes do not shadow the endpoints above
+    path('api/', include(router.urls)),
 ]
\ No newline at end of file
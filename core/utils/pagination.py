@@ -0,0 +1,88 @@
+import base64
+import json
+import uuid
+
+from django.utils.dateparse import parse_datetime
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+CURSOR_QUERY_PARAM = 'cursor'
+PAGE_SIZE_QUERY_PARAM = 'limit'
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client supplied cursor cannot be decoded"""
+
+
+def encode_cursor(position):
+    """
+    Encode a keyset position (a dict of JSON-serializable values) into an
+    opaque, URL-safe cursor string
+    """
+    raw = json.dumps(position, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by `encode_cursor` back into its position dict
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        raise InvalidCursor('Invalid cursor')
+    if not isinstance(position, dict):
+        raise InvalidCursor('Invalid cursor')
+    return position
+
+
+
+def encode_keyset_cursor(at, pk):
+    """
+    Encode a (timestamp, id) keyset position, as read back by
+    `decode_keyset_cursor`
+    """
+    return encode_cursor({'at': at.isoformat(), 'id': str(pk)})
+
+
+def decode_keyset_cursor(cursor, id_type=uuid.UUID):
+    """
+    Decode a cursor produced by `encode_keyset_cursor` into a
+    (datetime, id) pair, converting the id with `id_type`
+    """
+    position = decode_cursor(cursor)
+    if position is None:
+        return None
+    try:
+        at = parse_datetime(str(position.get('at', '')))
+        pk = id_type(str(position.get('id')))
+    except (TypeError, ValueError):
+        raise InvalidCursor('Invalid cursor')
+    if at is None:
+        raise InvalidCursor('Invalid cursor')
+    return (at, pk)
+
+def get_page_size(request, default=20, maximum=100):
+    """
+    Read the requested page size from the query string, bounded to `maximum`
+    """
+    try:
+        size = int(request.GET.get(PAGE_SIZE_QUERY_PARAM, default))
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def build_cursor_url(request, cursor, param=CURSOR_QUERY_PARAM, drop=()):
+    """
+    Build an absolute URL for the current request pointing at `cursor`,
+    removing any query parameters listed in `drop`
+    """
+    if cursor is None:
+        return None
+    url = request.build_absolute_uri()
+    for name in drop:
+        url = remove_query_param(url, name)
+    return replace_query_param(url, param, cursor)
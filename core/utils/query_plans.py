@@ -0,0 +1,21 @@
+class QueryPlanMixin:
+    """
+    Declares the related rows a viewset's serializer reads, so listing a
+    page costs the same number of queries whatever its size.
+
+    `select_related` and `prefetch_related` are applied after filtering;
+    viewsets whose plan needs annotations or depends on the request
+    override `plan_queryset` instead.
+    """
+    select_related = ()
+    prefetch_related = ()
+
+    def plan_queryset(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        return queryset
+
+    def filter_queryset(self, queryset):
+        return self.plan_queryset(super().filter_queryset(queryset))
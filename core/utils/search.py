@@ -0,0 +1,18 @@
+from rest_framework import filters
+
+from core.services.search import SEARCH_KINDS, matching
+
+
+class IndexedSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter answered from the search index: each word of ?search=
+    must match a word, or the start of one, in the model's indexed fields.
+    The listing keeps the view's own ordering.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        kind = SEARCH_KINDS[queryset.model]
+        ranked = matching(kind, request.query_params.get(self.search_param, ''))
+        if ranked is None:
+            return queryset
+        return queryset.filter(pk__in=ranked.values(kind))
@@ -7,28 +7,65 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q, Count, Avg
+from django.db.models import Q, Count, Avg, Sum, Exists, OuterRef, Prefetch
 from django.utils import timezone
 from django.core.paginator import Paginator
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
 from django.contrib.auth.password_validation import validate_password
 from django.db import transaction
+from django.conf import settings
+from django.urls import reverse
+import datetime
 import json
 import logging
+import uuid
 
 from .models import (
     User, School, StudentProfile, TeacherProfile, 
     ParentProfile, PrincipalProfile, ProprietorProfile,
-    Class, Subject, Enrollment, Attendance, Grade, Message,
-    Announcement, Notification, Post, Comment, Connection, TeacherGroup
+    Class, Subject, Enrollment, TeacherClass, Term, Attendance, AttendanceRollup,
+    Grade, SubjectResult, TermResult, Message, MessageRecipient,
+    Announcement, Notification, Post, PostLike, Comment,
+    Connection, TeacherGroup, TaskRecord, ImportJob
 )
 from .serializers import *
+from .services.attendance import ingest_attendance, rollup_counts, rollup_key
+from .services.autocomplete import (
+    AUTOCOMPLETE_LIMIT, MAX_AUTOCOMPLETE_LIMIT, SOURCES as AUTOCOMPLETE_SOURCES, autocomplete, results_etag
+)
+from .services.broadsheets import class_broadsheet
+from .services.comment_threads import MAX_THREAD_PAGE_SIZE, THREAD_PAGE_SIZE, get_comment_page, get_reply_page
+from .services.conversations import (
+    CONVERSATION_PAGE_SIZE, MAX_CONVERSATION_PAGE_SIZE, MAX_MESSAGE_PAGE_SIZE, MESSAGE_PAGE_SIZE, add_recipients,
+    get_conversation_summaries, get_thread_page, mark_conversation_read, mark_message_read, message_cursor
+)
+from .services.counters import toggle_post_like
+from .services.dashboards import average_score, grouped, rate
+from .services.eager_loading import (
+    recent_comments, with_class_details, with_comment_details, with_student_details, with_teacher_details
+)
+from .services.exports import EXPORTS, FILE_FORMATS, export_response, export_scope, stream_csv
+from .services.grades import can_grade, ingest_grade_sheet
+from .services.imports import import_format, importable_schools
+from .services.invites import redeem_invite
+from .services.notification_dispatcher import dispatcher_health
+from .services.revenue import InvalidRange, add_months, revenue_series
+from .services.schools import annotate_school_statistics
+from .services.search import MAX_SEARCH_LIMIT, SEARCH_LIMIT, query_terms, search, searchable
+from .services.sms_providers import provider_health
+from .services.timelines import FEED_PAGE_SIZE, MAX_FEED_PAGE_SIZE, get_feed_page, user_schools, visible_posts
+from .tasks import enqueue, generate_report_cards_task, run_import_task
 from .utils.notifications import create_notification
+from .utils.pagination import InvalidCursor, build_cursor_url, get_page_size
+from .utils.query_plans import QueryPlanMixin
+from .utils.search import IndexedSearchFilter
 from django.http import HttpResponse
 
 def test_view(request):
@@ -53,9 +90,6 @@ def register_view(request):
     if request.user.is_authenticated:
         return redirect('dashboard')
 
-    # Get all schools for the registration form
-    schools = School.objects.filter(is_active=True).order_by('name')
-
     if request.method == 'POST':
         try:
             with transaction.atomic():
@@ -109,8 +143,14 @@ def register_view(request):
                 if errors:
                     for error in errors:
                         messages.error(request, error)
+                    # The school field is a typeahead; only the chosen school is rendered
+                    selected_school = None
+                    try:
+                        selected_school = School.objects.filter(id=school_id, is_active=True).first() if school_id else None
+                    except ValidationError:
+                        pass
                     context = {
-                        'schools': schools,
+                        'selected_school': selected_school,
                         'user_types': User.USER_TYPES,
                         'form_data': request.POST
                     }
@@ -173,7 +213,6 @@ def register_view(request):
             messages.error(request, 'Registration failed. Please try again.')
 
     context = {
-        'schools': schools,
         'user_types': User.USER_TYPES
     }
     return render(request, 'core/register.html', context)
@@ -298,7 +337,11 @@ def check_email_availability(request):
         if not email:
             return JsonResponse({'available': False, 'message': 'Email is required'})
 
-        if '@' not in email or '.' not in email:
+        # Only a complete address reaches the (unique-indexed) users lookup,
+        # so the keystrokes typing one are answered without a query
+        try:
+            validate_email(email)
+        except ValidationError:
             return JsonResponse({'available': False, 'message': 'Invalid email format'})
 
         exists = User.objects.filter(email=email).exists()
@@ -313,29 +356,68 @@ def check_email_availability(request):
         return JsonResponse({'available': False, 'message': 'Error checking email'})
 
 
-@require_http_methods(["GET"])
-def get_schools(request):
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def autocomplete_view(request, kind):
     """
-    Get schools list for dynamic loading
+    Typeahead matches for ?q= among schools, subjects or (signed in, with
+    ?school=) a school's users, answered from an in-memory prefix index.
+    Responses carry an ETag; a client sending it back in If-None-Match
+    gets 304 Not Modified while the matches are unchanged.
     """
     try:
-        schools = School.objects.filter(is_active=True).values('id', 'name', 'city', 'state')
-        return JsonResponse({'schools': list(schools)})
+        if kind not in AUTOCOMPLETE_SOURCES:
+            return Response({
+                'error': f"Unknown autocomplete type: {kind}"
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        scope = None
+        if kind == 'users':
+            if not request.user.is_authenticated:
+                return Response({
+                    'error': 'Authentication required'
+                }, status=status.HTTP_401_UNAUTHORIZED)
+            try:
+                scope = uuid.UUID(request.GET.get('school', ''))
+            except ValueError:
+                return Response({
+                    'error': 'A valid school is required'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            if not request.user.is_staff and scope not in user_schools(request.user):
+                return Response({
+                    'error': 'Permission denied'
+                }, status=status.HTTP_403_FORBIDDEN)
+        
+        limit = get_page_size(request, default=AUTOCOMPLETE_LIMIT, maximum=MAX_AUTOCOMPLETE_LIMIT)
+        results = autocomplete(kind, request.GET.get('q', ''), scope=scope, limit=limit)
+        
+        etag = results_etag(results)
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response({'results': results}, status=status.HTTP_200_OK)
+        response['ETag'] = etag
+        patch_cache_control(response, private=kind == 'users', max_age=60)
+        patch_vary_headers(response, ['Authorization', 'Cookie'] if kind == 'users' else [])
+        return response
+        
     except Exception as e:
-        logger.error(f"Schools fetch error: {str(e)}")
-        return JsonResponse({'schools': []})
+        logger.error(f"Autocomplete error: {str(e)}")
+        return Response({
+            'error': 'Autocomplete failed'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 
 # API ViewSets
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing users with advanced filtering and permissions
     """
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter, filters.OrderingFilter]
     filterset_fields = ['user_type', 'is_active', 'email_verified']
-    search_fields = ['email', 'first_name', 'last_name']
     ordering_fields = ['created_at', 'last_login']
     ordering = ['-created_at']
 
@@ -364,27 +446,31 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response({'status': 'User deactivated'})
 
 
-class SchoolViewSet(viewsets.ModelViewSet):
+class SchoolViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing schools
     """
     queryset = School.objects.all()
     serializer_class = SchoolSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter]
     filterset_fields = ['school_type', 'ownership_type', 'state']
-    search_fields = ['name', 'city', 'state']
 
     def get_queryset(self):
         user = self.request.user
         if user.user_type == 'proprietor':
-            return School.objects.filter(proprietorprofile__user=user)
+            schools = School.objects.filter(proprietors__user=user)
         elif user.user_type == 'principal':
-            return School.objects.filter(principalprofile__user=user)
-        return School.objects.all()
+            schools = School.objects.filter(principals__user=user)
+        else:
+            schools = School.objects.all()
+        return schools
+
+    def plan_queryset(self, queryset):
+        return annotate_school_statistics(queryset)
 
 
-class ClassViewSet(viewsets.ModelViewSet):
+class ClassViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing classes
     """
@@ -399,19 +485,66 @@ class ClassViewSet(viewsets.ModelViewSet):
         user = self.request.user
         if user.user_type in ['proprietor', 'principal']:
             # Get schools associated with user
-            if hasattr(user, 'proprietorprofile'):
-                schools = user.proprietorprofile.schools.all()
-            elif hasattr(user, 'principalprofile'):
-                schools = [user.principalprofile.school]
+            if hasattr(user, 'proprietor_profile'):
+                schools = user.proprietor_profile.schools.all()
+            elif hasattr(user, 'principal_profile'):
+                schools = [user.principal_profile.school]
             else:
                 schools = []
             return Class.objects.filter(school__in=schools)
         elif user.user_type == 'teacher':
-            return Class.objects.filter(teacherprofile__user=user)
+            return Class.objects.filter(teacherprofile__user=user).distinct()
         return Class.objects.all()
 
+    def plan_queryset(self, queryset):
+        return with_class_details(queryset)
+
+    def get_term(self, class_obj):
+        """The `term` query parameter's term of the class's school, or its current term"""
+        terms = Term.objects.filter(session__school=class_obj.school_id)
+        try:
+            if self.request.query_params.get('term'):
+                return terms.get(pk=self.request.query_params['term'])
+            return terms.get(session__is_current=True, is_current=True)
+        except (Term.DoesNotExist, Term.MultipleObjectsReturned, ValueError):
+            return None
+
+    @action(detail=True, methods=['get'])
+    def broadsheet(self, request, pk=None):
+        """End-of-term broadsheet for the class (`term`, the current term by default)"""
+        class_obj = self.get_object()
+        term = self.get_term(class_obj)
+        if term is None:
+            return Response({'error': 'Term not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(class_broadsheet(class_obj, term))
 
-class SubjectViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def rankings(self, request, pk=None):
+        """
+        Class positions for a term (`term`, the school's current term by
+        default), overall or in one `subject`
+        """
+        class_obj = self.get_object()
+        term = self.get_term(class_obj)
+        if term is None:
+            return Response({'error': 'Term not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        if request.query_params.get('subject'):
+            try:
+                results = SubjectResult.objects.filter(
+                    class_taken=class_obj, term=term, subject=request.query_params['subject']
+                ).select_related('student__user', 'subject').order_by('position')
+                return Response(SubjectResultSerializer(results, many=True).data)
+            except ValidationError:
+                return Response({'error': 'Invalid subject'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = TermResult.objects.filter(
+            class_taken=class_obj, term=term
+        ).select_related('student__user').order_by('position')
+        return Response(TermResultSerializer(results, many=True).data)
+
+
+class SubjectViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing subjects
     """
@@ -419,11 +552,11 @@ class SubjectViewSet(viewsets.ModelViewSet):
     serializer_class = SubjectSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-    filterset_fields = ['school', 'code']
+    filterset_fields = ['category', 'code']
     search_fields = ['name', 'code']
 
 
-class TeacherProfileViewSet(viewsets.ModelViewSet):
+class TeacherProfileViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing teacher profiles
     """
@@ -434,6 +567,9 @@ class TeacherProfileViewSet(viewsets.ModelViewSet):
     filterset_fields = ['school', 'specialization']
     search_fields = ['user__first_name', 'user__last_name', 'specialization']
 
+    def plan_queryset(self, queryset):
+        return with_teacher_details(queryset)
+
     @action(detail=True, methods=['get'])
     def students(self, request, pk=None):
         teacher = self.get_object()
@@ -446,7 +582,7 @@ class TeacherProfileViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class StudentProfileViewSet(viewsets.ModelViewSet):
+class StudentProfileViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing student profiles
     """
@@ -454,7 +590,7 @@ class StudentProfileViewSet(viewsets.ModelViewSet):
     serializer_class = StudentProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-    filterset_fields = ['school', 'admission_year']
+    filterset_fields = ['school', 'current_class']
     search_fields = ['user__first_name', 'user__last_name', 'student_id']
 
     def get_queryset(self):
@@ -462,9 +598,12 @@ class StudentProfileViewSet(viewsets.ModelViewSet):
         if user.user_type == 'student':
             return StudentProfile.objects.filter(user=user)
         elif user.user_type == 'parent':
-            return StudentProfile.objects.filter(parentprofile__user=user)
+            return StudentProfile.objects.filter(parents__user=user)
         return StudentProfile.objects.all()
 
+    def plan_queryset(self, queryset):
+        return with_student_details(queryset)
+
     @action(detail=True, methods=['get'])
     def grades(self, request, pk=None):
         student = self.get_object()
@@ -480,7 +619,7 @@ class StudentProfileViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class ParentProfileViewSet(viewsets.ModelViewSet):
+class ParentProfileViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing parent profiles
     """
@@ -496,8 +635,13 @@ class ParentProfileViewSet(viewsets.ModelViewSet):
             return ParentProfile.objects.filter(user=user)
         return ParentProfile.objects.all()
 
+    def plan_queryset(self, queryset):
+        return queryset.select_related('user').prefetch_related(
+            Prefetch('children', queryset=with_student_details(StudentProfile.objects.all()))
+        )
 
-class PrincipalProfileViewSet(viewsets.ModelViewSet):
+
+class PrincipalProfileViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing principal profiles
     """
@@ -506,9 +650,10 @@ class PrincipalProfileViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [filters.SearchFilter]
     search_fields = ['user__first_name', 'user__last_name']
+    select_related = ['user', 'school']
 
 
-class EnrollmentViewSet(viewsets.ModelViewSet):
+class EnrollmentViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing enrollments
     """
@@ -518,17 +663,34 @@ class EnrollmentViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_fields = ['class_enrolled', 'enrollment_date', 'is_active']
     search_fields = ['student__user__first_name', 'student__user__last_name']
+    select_related = ['student__user', 'class_enrolled', 'session']
 
     def get_queryset(self):
         user = self.request.user
         if user.user_type == 'student':
             return Enrollment.objects.filter(student__user=user)
         elif user.user_type == 'parent':
-            return Enrollment.objects.filter(student__parentprofile__user=user)
+            return Enrollment.objects.filter(student__parents__user=user)
         return Enrollment.objects.all()
 
 
-class AttendanceViewSet(viewsets.ModelViewSet):
+def ingestion_response(outcomes, count):
+    """
+    Response to a bulk write of `count` rows: a tally of outcomes and each
+    row's outcome, as a 400 only when no row could be recorded
+    """
+    results = [{'row': index, **outcomes[index]} for index in range(count)]
+    summary = {outcome: 0 for outcome in ('created', 'updated', 'unchanged', 'rejected')}
+    for result in results:
+        summary[result['outcome']] += 1
+    recorded = count - summary['rejected']
+    return Response(
+        {**summary, 'results': results},
+        status=status.HTTP_200_OK if recorded or not count else status.HTTP_400_BAD_REQUEST
+    )
+
+
+class AttendanceViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing attendance
     """
@@ -538,6 +700,7 @@ class AttendanceViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_fields = ['student', 'date', 'status']
     search_fields = ['student__user__first_name', 'student__user__last_name']
+    select_related = ['student__user', 'class_attended', 'marked_by__user']
 
     def get_queryset(self):
         user = self.request.user
@@ -545,21 +708,32 @@ class AttendanceViewSet(viewsets.ModelViewSet):
             return Attendance.objects.filter(student__user=user)
         elif user.user_type == 'teacher':
             return Attendance.objects.filter(
-                student__enrollment__class_enrolled__teacherprofile__user=user
-            )
+                class_attended__teacherprofile__user=user
+            ).distinct()
         return Attendance.objects.all()
 
     @action(detail=False, methods=['post'])
     def bulk_create(self, request):
-        """Bulk create attendance records"""
-        serializer = AttendanceSerializer(data=request.data, many=True)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        """
+        Record a register in bulk: each student's record for the day is
+        created, or updated if the register is resubmitted, and every row's
+        outcome is reported
+        """
+        if not isinstance(request.data, list):
+            return Response({'error': 'Expected a list of attendance records'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows, outcomes = {}, {}
+        for index, item in enumerate(request.data):
+            row = AttendanceRegisterRowSerializer(data=item)
+            if row.is_valid():
+                rows[index] = row.validated_data
+            else:
+                outcomes[index] = {'outcome': 'rejected', 'errors': row.errors}
+        outcomes.update(ingest_attendance(rows, request.user))
+        return ingestion_response(outcomes, len(request.data))
 
 
-class GradeViewSet(viewsets.ModelViewSet):
+class GradeViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing grades
     """
@@ -567,21 +741,45 @@ class GradeViewSet(viewsets.ModelViewSet):
     serializer_class = GradeSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-    filterset_fields = ['student', 'subject', 'grade_type']
+    filterset_fields = ['student', 'subject', 'assessment_type']
     search_fields = ['student__user__first_name', 'student__user__last_name']
+    select_related = ['student__user', 'subject', 'class_taken', 'term', 'teacher__user']
 
     def get_queryset(self):
         user = self.request.user
         if user.user_type == 'student':
             return Grade.objects.filter(student__user=user)
         elif user.user_type == 'parent':
-            return Grade.objects.filter(student__parentprofile__user=user)
+            return Grade.objects.filter(student__parents__user=user)
         elif user.user_type == 'teacher':
             return Grade.objects.filter(teacher__user=user)
         return Grade.objects.all()
 
+    @action(detail=False, methods=['post'])
+    def bulk_upsert(self, request):
+        """
+        Enter a grade sheet: the scores of one assessment in a subject for a
+        class, each created or updated, with every row's outcome reported
+        """
+        sheet = GradeSheetSerializer(data=request.data)
+        if not sheet.is_valid():
+            return Response(sheet.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = sheet.validated_data
+        if not can_grade(request.user, data['class_taken'], data['subject']):
+            return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+
+        rows, outcomes = {}, {}
+        for index, item in enumerate(data['grades']):
+            row = GradeSheetRowSerializer(data=item)
+            if row.is_valid():
+                rows[index] = row.validated_data
+            else:
+                outcomes[index] = {'outcome': 'rejected', 'errors': row.errors}
+        outcomes.update(ingest_grade_sheet(data, rows, request.user))
+        return ingestion_response(outcomes, len(data['grades']))
+
 
-class MessageViewSet(viewsets.ModelViewSet):
+class MessageViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing messages
     """
@@ -589,27 +787,30 @@ class MessageViewSet(viewsets.ModelViewSet):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-    filterset_fields = ['is_read', 'created_at']
-    search_fields = ['subject', 'content']
+    filterset_fields = ['message_type', 'is_urgent']
+    search_fields = ['subject', 'body']
+    select_related = ['sender']
+    prefetch_related = [
+        'recipients',
+        Prefetch('messagerecipient_set', queryset=MessageRecipient.objects.select_related('recipient')),
+    ]
 
     def get_queryset(self):
         user = self.request.user
         return Message.objects.filter(
-            Q(sender=user) | Q(recipient=user)
-        ).order_by('-created_at')
+            Q(sender=user) | Q(recipients=user)
+        ).distinct().order_by('-created_at')
 
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
         message = self.get_object()
-        if message.recipient == request.user:
-            message.is_read = True
-            message.read_at = timezone.now()
-            message.save()
+        if MessageRecipient.objects.filter(message=message, recipient=request.user).exists():
+            mark_message_read(request.user, message.id)
             return Response({'status': 'Message marked as read'})
         return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
 
 
-class AnnouncementViewSet(viewsets.ModelViewSet):
+class AnnouncementViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing announcements
     """
@@ -617,19 +818,29 @@ class AnnouncementViewSet(viewsets.ModelViewSet):
     serializer_class = AnnouncementSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-    filterset_fields = ['target_audience', 'priority', 'is_active']
+    filterset_fields = ['target_audience', 'announcement_type', 'is_published', 'fanout_status']
     search_fields = ['title', 'content']
     ordering = ['-created_at']
 
+    # Announcement audiences each user type belongs to, besides 'all'
+    AUDIENCES = {
+        'student': ['students'],
+        'teacher': ['teachers', 'staff'],
+        'principal': ['staff'],
+        'parent': ['parents'],
+    }
+
     def get_queryset(self):
         user = self.request.user
+        # Authors always see their own announcements, including fan-out progress
         return Announcement.objects.filter(
-            Q(target_audience='all') | Q(target_audience=user.user_type),
-            is_active=True
-        )
+            Q(target_audience='all', is_published=True) |
+            Q(target_audience__in=self.AUDIENCES.get(user.user_type, []), is_published=True) |
+            Q(author=user)
+        ).select_related('school', 'author')
 
 
-class NotificationViewSet(viewsets.ModelViewSet):
+class NotificationViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing notifications
     """
@@ -640,6 +851,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
     filterset_fields = ['is_read', 'notification_type']
     search_fields = ['title', 'message']
     ordering = ['-created_at']
+    select_related = ['recipient']
 
     def get_queryset(self):
         return Notification.objects.filter(recipient=self.request.user)
@@ -661,46 +873,77 @@ class NotificationViewSet(viewsets.ModelViewSet):
         return Response({'status': 'All notifications marked as read'})
 
 
-class PostViewSet(viewsets.ModelViewSet):
+class PostViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing social posts
     """
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter]
     filterset_fields = ['post_type', 'visibility']
-    search_fields = ['content']
     ordering = ['-created_at']
 
     def get_queryset(self):
+        return visible_posts(self.request.user)
+
+    def plan_queryset(self, queryset):
         user = self.request.user
-        return Post.objects.filter(
-            Q(visibility='public') | 
-            Q(author=user) |
-            Q(visibility='friends', author__in=user.friends.all())
-        )
+        return queryset.select_related('author', 'school').annotate(
+            liked_by_user=Exists(PostLike.objects.filter(post=OuterRef('pk'), user=user))
+        ).prefetch_related(recent_comments(user))
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(detail=False, methods=['get'])
+    def feed(self, request):
+        """
+        The user's home timeline, newest first, cursor paginated
+        """
+        try:
+            limit = get_page_size(request, default=FEED_PAGE_SIZE, maximum=MAX_FEED_PAGE_SIZE)
+            posts, next_cursor = get_feed_page(
+                request.user, cursor=request.GET.get('cursor'), limit=limit,
+                queryset=self.plan_queryset(Post.objects.all())
+            )
+        except InvalidCursor:
+            return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'next': build_cursor_url(request, next_cursor),
+            'results': self.get_serializer(posts, many=True).data
+        })
+
+    @action(detail=True, methods=['get'])
+    def comments(self, request, pk=None):
+        """
+        The post's top-level comments with their first replies, cursor paginated
+        """
+        post = self.get_object()
+        try:
+            limit = get_page_size(request, default=THREAD_PAGE_SIZE, maximum=MAX_THREAD_PAGE_SIZE)
+            comments, next_cursor = get_comment_page(post, request.user, cursor=request.GET.get('cursor'), limit=limit)
+        except InvalidCursor:
+            return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'next': build_cursor_url(request, next_cursor),
+            'results': CommentSerializer(comments, many=True, context=self.get_serializer_context()).data
+        })
+
     @action(detail=True, methods=['post'])
     def like(self, request, pk=None):
         post = self.get_object()
-        if request.user in post.likes.all():
-            post.likes.remove(request.user)
-            liked = False
-        else:
-            post.likes.add(request.user)
-            liked = True
+        liked, likes_count = toggle_post_like(post, request.user)
 
         return Response({
             'liked': liked,
-            'likes_count': post.likes.count()
+            'likes_count': likes_count
         })
 
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing comments
     """
@@ -711,11 +954,32 @@ class CommentViewSet(viewsets.ModelViewSet):
     filterset_fields = ['post']
     ordering = ['created_at']
 
+    def plan_queryset(self, queryset):
+        return with_comment_details(queryset, self.request.user)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(detail=True, methods=['get'])
+    def replies(self, request, pk=None):
+        """
+        Replies to the comment, cursor paginated, for threads deeper than
+        the replies embedded in each comment
+        """
+        comment = self.get_object()
+        try:
+            limit = get_page_size(request, default=THREAD_PAGE_SIZE, maximum=MAX_THREAD_PAGE_SIZE)
+            replies, next_cursor = get_reply_page(comment, request.user, cursor=request.GET.get('cursor'), limit=limit)
+        except InvalidCursor:
+            return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'next': build_cursor_url(request, next_cursor),
+            'results': self.get_serializer(replies, many=True).data
+        })
 
-class ConnectionViewSet(viewsets.ModelViewSet):
+
+class ConnectionViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing user connections
     """
@@ -724,6 +988,7 @@ class ConnectionViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['status']
+    select_related = ['from_user', 'to_user']
 
     def get_queryset(self):
         user = self.request.user
@@ -750,15 +1015,18 @@ class ConnectionViewSet(viewsets.ModelViewSet):
         return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
 
 
-class TeacherGroupViewSet(viewsets.ModelViewSet):
+class TeacherGroupViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing teacher groups
     """
     queryset = TeacherGroup.objects.all()
     serializer_class = TeacherGroupSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['name', 'description']
+    filter_backends = [IndexedSearchFilter]
+    select_related = ['creator__user', 'school']
+    prefetch_related = [
+        Prefetch('members', queryset=with_teacher_details(TeacherProfile.objects.all())),
+    ]
 
     def get_queryset(self):
         user = self.request.user
@@ -806,12 +1074,7 @@ def dashboard(request):
         if user.user_type == 'student':
             student_profile = user.studentprofile
             recent_grades = Grade.objects.filter(student=student_profile).order_by('-created_at')[:5]
-            attendance_stats = Attendance.objects.filter(
-                student=student_profile
-            ).aggregate(
-                total=Count('id'),
-                present=Count('id', filter=Q(status='present'))
-            )
+            attendance_stats = rollup_counts(rollup_key('student', student_profile.id, 'total'))
             
             # Calculate attendance percentage
             attendance_rate = 0
@@ -917,15 +1180,13 @@ def dashboard_stats(request):
                 }
         elif user.user_type == 'student':
             student = user.student_profile
+            attendance = rollup_counts(rollup_key('student', student.id, 'total'))
             stats = {
                 'total_subjects': student.enrollments.count(),
-                'average_grade': Grade.objects.filter(student=student).aggregate(
-                    avg=Avg('score')
-                )['avg'] or 0,
-                'attendance_rate': Attendance.objects.filter(
-                    student=student,
-                    status='present'
-                ).count() / max(Attendance.objects.filter(student=student).count(), 1) * 100,
+                'average_grade': average_score(TermResult.objects.filter(student=student).aggregate(
+                    total=Sum('score_total'), assessments=Sum('assessments')
+                )),
+                'attendance_rate': rate(attendance['present'], attendance['total']),
                 'recent_grades': get_recent_grades(student),
                 'upcoming_events': get_upcoming_events(student.school)
             }
@@ -941,9 +1202,9 @@ def dashboard_stats(request):
             }
         elif user.user_type == 'parent':
             parent = user.parent_profile
-            children = parent.children.all()
+            children = list(parent.children.select_related('user'))
             stats = {
-                'children_count': children.count(),
+                'children_count': len(children),
                 'overall_attendance': get_children_attendance(children),
                 'academic_summary': get_children_performance(children),
                 'fee_status': get_children_fee_status(children)
@@ -955,6 +1216,318 @@ def dashboard_stats(request):
     return Response(stats)
 
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def revenue_report(request):
+    """
+    Completed fee revenue over a date range, grouped by day, week, month
+    or term, for one or all of the schools the user manages
+    """
+    user = request.user
+    if user.is_staff:
+        schools = School.objects.all()
+    elif user.user_type == 'proprietor':
+        schools = School.objects.filter(proprietors__user=user)
+    elif user.user_type == 'principal':
+        schools = School.objects.filter(principals__user=user)
+    else:
+        return Response({
+            'error': 'Permission denied'
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    granularity = request.GET.get('granularity', 'month')
+    try:
+        end = datetime.date.fromisoformat(request.GET['end']) if request.GET.get('end') else timezone.localdate()
+        if request.GET.get('start'):
+            start = datetime.date.fromisoformat(request.GET['start'])
+        elif granularity == 'day':
+            start = end - datetime.timedelta(days=29)
+        else:
+            start = add_months(end, -11)
+    except ValueError:
+        return Response({
+            'error': 'Dates must be in YYYY-MM-DD format'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    school_id = request.GET.get('school')
+    if school_id:
+        try:
+            schools = schools.filter(id=school_id)
+            found = schools.exists()
+        except ValidationError:
+            found = False
+        if not found:
+            return Response({
+                'error': 'School not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        series = revenue_series(schools, start, end, granularity)
+    except InvalidRange as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Revenue report error: {str(e)}")
+        return Response({
+            'error': 'Failed to load revenue'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    return Response({
+        'granularity': granularity,
+        'start': start,
+        'end': end,
+        'total': sum(point['revenue'] for point in series),
+        'results': series
+    })
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def export_data(request, dataset):
+    """
+    Download grades, attendance or fee payments as CSV or XLSX, optionally
+    for one `school`, `class` and `term`, streamed so that exports of any
+    size use constant memory
+    """
+    if dataset not in EXPORTS:
+        return Response({
+            'error': 'Unknown export'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    scope = export_scope(request.user, dataset)
+    if scope is None:
+        return Response({
+            'error': 'Permission denied'
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    # `format` is DRF's renderer override, hence `file_format`
+    file_format = request.GET.get('file_format', 'csv')
+    if file_format not in FILE_FORMATS:
+        return Response({
+            'error': f"file_format must be one of {', '.join(FILE_FORMATS)}"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    term = None
+    if request.GET.get('term'):
+        try:
+            term = Term.objects.get(pk=request.GET['term'])
+        except (Term.DoesNotExist, ValueError):
+            return Response({
+                'error': 'Term not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        queryset = EXPORTS[dataset].queryset(
+            scope,
+            school=request.GET.get('school') or None,
+            class_id=request.GET.get('class') or None,
+            term=term
+        )
+        # Validates the ids before the response starts streaming
+        queryset.exists()
+    except ValidationError:
+        return Response({
+            'error': 'Invalid school or class'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    return export_response(dataset, queryset, file_format)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def queue_report_cards(request):
+    """
+    Queue report cards for a term, for the listed `classes` or every active
+    class of the term's school; poll the returned task for progress and
+    the per-class zip archives
+    """
+    user = request.user
+    if user.is_staff:
+        schools = School.objects.all()
+    elif user.user_type == 'proprietor':
+        schools = School.objects.filter(proprietors__user=user)
+    elif user.user_type == 'principal':
+        schools = School.objects.filter(principals__user=user)
+    else:
+        return Response({
+            'error': 'Permission denied'
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        term = Term.objects.get(pk=request.data.get('term'), session__school__in=schools)
+    except (Term.DoesNotExist, ValueError, TypeError):
+        return Response({
+            'error': 'Term not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    classes = Class.objects.filter(school=term.session.school_id)
+    class_ids = request.data.get('classes')
+    try:
+        if class_ids:
+            classes = classes.filter(id__in=class_ids)
+        else:
+            classes = classes.filter(is_active=True)
+        class_ids = [str(class_id) for class_id in classes.values_list('id', flat=True)]
+    except (ValidationError, TypeError):
+        return Response({
+            'error': 'Invalid classes'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if not class_ids:
+        return Response({
+            'error': 'No classes to generate report cards for'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    record = enqueue(generate_report_cards_task, args=(term.pk, class_ids), user=user)
+    return Response({
+        'task': record.id,
+        'status_url': request.build_absolute_uri(reverse('task_status', args=[record.id]))
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def task_status(request, task_id):
+    """Progress and result of a background task the user started"""
+    records = TaskRecord.objects.all() if request.user.is_staff else TaskRecord.objects.filter(created_by=request.user)
+    record = get_object_or_404(records, pk=task_id)
+    return Response({
+        'id': record.id,
+        'name': record.name,
+        'status': record.status,
+        'progress': record.progress,
+        'total': record.total,
+        'result': record.result,
+        'error': record.error,
+        'created_at': record.created_at,
+        'started_at': record.started_at,
+        'finished_at': record.finished_at,
+    })
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.IsAuthenticated])
+def import_jobs(request):
+    """
+    List the imports of the user's schools, or upload a CSV or XLSX file of
+    students (`kind=students`) or of grades for a `term` (`kind=grades`) to
+    load in the background
+    """
+    schools = importable_schools(request.user)
+    if schools is None:
+        return Response({
+            'error': 'Permission denied'
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    if request.method == 'GET':
+        jobs = ImportJob.objects.filter(school__in=schools).select_related('school')[:50]
+        return Response(ImportJobSerializer(jobs, many=True).data)
+
+    kind = request.data.get('kind')
+    upload = request.FILES.get('file')
+    if kind not in dict(ImportJob.KINDS):
+        return Response({
+            'error': f"kind must be one of {', '.join(dict(ImportJob.KINDS))}"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if upload is None or import_format(upload.name) is None:
+        return Response({
+            'error': 'Upload a CSV or XLSX file'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        school = schools.get(pk=request.data.get('school'))
+    except (School.DoesNotExist, ValidationError, ValueError):
+        return Response({
+            'error': 'School not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    options = {'send_invites': str(request.data.get('send_invites', 'true')).lower() not in ('false', '0')}
+    if kind == 'grades':
+        try:
+            options['term'] = Term.objects.get(pk=request.data.get('term'), session__school=school).pk
+        except (Term.DoesNotExist, ValueError, TypeError):
+            return Response({
+                'error': 'Term not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+    job = ImportJob.objects.create(
+        school=school, kind=kind, file=upload, options=options, created_by=request.user
+    )
+    return queue_import(request, job)
+
+
+def queue_import(request, job):
+    """Queue `job` to run and respond with where to follow it"""
+    record = enqueue(run_import_task, args=(str(job.id),), user=request.user)
+    ImportJob.objects.filter(pk=job.pk).update(task=record)
+    return Response({
+        'job': job.id,
+        'task': record.id,
+        'status_url': request.build_absolute_uri(reverse('import_job', args=[job.id]))
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+def get_import_job(request, job_id):
+    schools = importable_schools(request.user)
+    if schools is None:
+        raise Http404
+    return get_object_or_404(ImportJob.objects.select_related('school'), pk=job_id, school__in=schools)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def import_job(request, job_id):
+    """Progress and row counts of an import"""
+    return Response(ImportJobSerializer(get_import_job(request, job_id)).data)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def resume_import(request, job_id):
+    """Run a failed import again from after the last batch it committed"""
+    job = get_import_job(request, job_id)
+    if job.status != 'failed':
+        return Response({
+            'error': 'Only failed imports can be resumed'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    return queue_import(request, job)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def import_errors(request, job_id):
+    """The rows an import rejected and why, as a CSV to fix and upload again"""
+    job = get_import_job(request, job_id)
+    rows = (
+        [
+            row_number,
+            '; '.join(f"{column}: {' '.join(map(str, messages))}" for column, messages in errors.items()),
+            json.dumps(data),
+        ]
+        for row_number, errors, data in job.row_errors.values_list('row_number', 'errors', 'data').iterator()
+    )
+    return stream_csv(['Row', 'Errors', 'Data'], rows, f"import-{job.id}-errors")
+
+
+@api_view(['POST'])
+@permission_classes([permissions.AllowAny])
+def accept_invite(request):
+    """Set an invited user's first password using the `uid` and `token` from their invite"""
+    password = request.data.get('password', '')
+    try:
+        validate_password(password)
+    except ValidationError as e:
+        return Response({
+            'error': e.messages
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    user = redeem_invite(request.data.get('uid', ''), request.data.get('token', ''), password)
+    if user is None:
+        return Response({
+            'error': 'This invite link is invalid or has expired'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'status': 'Password set', 'email': user.email})
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def send_message(request):
@@ -973,25 +1546,22 @@ def send_message(request):
                 'error': 'Recipients and message body are required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create message
-        message = Message.objects.create(
-            sender=request.user,
-            subject=subject,
-            body=body,
-            message_type=message_type,
-            is_urgent=is_urgent
-        )
-        
-        # Add recipients
-        recipients = User.objects.filter(id__in=recipient_ids)
-        for recipient in recipients:
-            MessageRecipient.objects.create(
-                message=message,
-                recipient=recipient
+        with transaction.atomic():
+            # Create message
+            message = Message.objects.create(
+                sender=request.user,
+                subject=subject,
+                body=body,
+                message_type=message_type,
+                is_urgent=is_urgent
             )
             
-            # Send real-time notification
-            if is_urgent:
+            # Add recipients and update their conversations
+            recipients = add_recipients(message, User.objects.filter(id__in=recipient_ids))
+        
+        # Send real-time notification
+        if is_urgent:
+            for recipient in recipients:
                 create_notification(
                     recipient=recipient,
                     title=f"Urgent Message from {request.user.get_full_name()}",
@@ -1015,57 +1585,24 @@ def send_message(request):
 @permission_classes([permissions.IsAuthenticated])
 def get_conversations(request):
     """
-    Get user's conversations
+    Get user's conversations, most recent first, with cursor pagination
     """
     try:
-        # Get messages where user is sender or recipient
-        sent_messages = Message.objects.filter(sender=request.user)
-        received_messages = Message.objects.filter(
-            recipients=request.user
-        ).distinct()
-        
-        # Combine and get unique conversations
-        all_messages = sent_messages.union(received_messages).order_by('-created_at')
-        
-        conversations = {}
-        for message in all_messages:
-            # Get other participants
-            if message.sender == request.user:
-                participants = message.recipients.exclude(id=request.user.id)
-            else:
-                participants = [message.sender]
-            
-            for participant in participants:
-                conv_key = str(participant.id)
-                if conv_key not in conversations:
-                    conversations[conv_key] = {
-                        'participant': {
-                            'id': str(participant.id),
-                            'name': participant.get_full_name(),
-                            'email': participant.email,
-                            'profile_picture': participant.profile_picture.url if participant.profile_picture else None
-                        },
-                        'last_message': {
-                            'id': str(message.id),
-                            'subject': message.subject,
-                            'body': message.body[:100] + '...' if len(message.body) > 100 else message.body,
-                            'is_urgent': message.is_urgent,
-                            'created_at': message.created_at.isoformat(),
-                            'is_read': MessageRecipient.objects.filter(
-                                message=message,
-                                recipient=request.user,
-                                is_read=True
-                            ).exists() if message.sender != request.user else True
-                        },
-                        'unread_count': MessageRecipient.objects.filter(
-                            message__sender=participant,
-                            recipient=request.user,
-                            is_read=False
-                        ).count()
-                    }
+        conversations, next_cursor = get_conversation_summaries(
+            request.user,
+            cursor=request.GET.get('cursor'),
+            limit=get_page_size(request, CONVERSATION_PAGE_SIZE, MAX_CONVERSATION_PAGE_SIZE)
+        )
         
-        return Response(list(conversations.values()), status=status.HTTP_200_OK)
+        return Response({
+            'next': build_cursor_url(request, next_cursor),
+            'results': conversations
+        }, status=status.HTTP_200_OK)
         
+    except InvalidCursor:
+        return Response({
+            'error': 'Invalid cursor'
+        }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         logger.error(f"Get conversations error: {str(e)}")
         return Response({
@@ -1081,19 +1618,23 @@ def get_conversation_messages(request, user_id):
     """
     try:
         other_user = get_object_or_404(User, id=user_id)
+        before = request.GET.get('before')
+        after = request.GET.get('after')
+        limit = get_page_size(request, default=MESSAGE_PAGE_SIZE, maximum=MAX_MESSAGE_PAGE_SIZE)
         
-        # Get messages between users
-        messages = Message.objects.filter(
-            models.Q(sender=request.user, recipients=other_user) |
-            models.Q(sender=other_user, recipients=request.user)
-        ).distinct().order_by('created_at')
+        # Get one page of messages between users
+        try:
+            messages, has_older, has_newer = get_thread_page(
+                request.user, other_user, before=before, after=after, limit=limit
+            )
+        except InvalidCursor:
+            return Response({
+                'error': 'Invalid cursor'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Mark messages as read
-        MessageRecipient.objects.filter(
-            message__sender=other_user,
-            recipient=request.user,
-            is_read=False
-        ).update(is_read=True, read_at=timezone.now())
+        # Opening the latest page marks the conversation as read
+        if not before:
+            mark_conversation_read(request.user, other_user)
         
         # Serialize messages
         message_data = []
@@ -1109,10 +1650,20 @@ def get_conversation_messages(request, user_id):
                 'body': message.body,
                 'is_urgent': message.is_urgent,
                 'created_at': message.created_at.isoformat(),
-                'is_own': message.sender == request.user
+                'is_own': message.sender_id == request.user.id
             })
         
-        return Response(message_data, status=status.HTTP_200_OK)
+        previous_url = next_url = None
+        if messages and has_older:
+            previous_url = build_cursor_url(request, message_cursor(messages[0]), param='before', drop=['after'])
+        if messages and has_newer:
+            next_url = build_cursor_url(request, message_cursor(messages[-1]), param='after', drop=['before'])
+        
+        return Response({
+            'previous': previous_url,
+            'next': next_url,
+            'results': message_data
+        }, status=status.HTTP_200_OK)
         
     except Exception as e:
         logger.error(f"Get conversation messages error: {str(e)}")
@@ -1183,25 +1734,11 @@ def like_post(request, post_id):
     """
     try:
         post = get_object_or_404(Post, id=post_id)
-        
-        like, created = PostLike.objects.get_or_create(
-            post=post,
-            user=request.user
-        )
-        
-        if not created:
-            like.delete()
-            liked = False
-        else:
-            liked = True
-        
-        # Update likes count
-        post.likes_count = post.likes.count()
-        post.save()
+        liked, likes_count = toggle_post_like(post, request.user)
         
         return Response({
             'liked': liked,
-            'likes_count': post.likes_count
+            'likes_count': likes_count
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -1238,10 +1775,6 @@ def add_comment(request, post_id):
             content=content
         )
         
-        # Update comments count
-        post.comments_count = post.comments.count()
-        post.save()
-        
         # Notify post author
         if post.author != request.user:
             create_notification(
@@ -1329,6 +1862,81 @@ def create_school(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def user_search_result(user):
+    """A user as search results show them, from a user loaded by searchable('user')"""
+    result = {
+        'id': str(user.id),
+        'name': user.get_full_name(),
+        'email': user.email,
+        'user_type': user.get_user_type_display(),
+        'profile_picture': user.profile_picture.url if user.profile_picture else None
+    }
+    
+    # Add school info if applicable
+    for profile in ('student_profile', 'teacher_profile', 'principal_profile'):
+        if hasattr(user, profile):
+            result['school'] = getattr(user, profile).school.name
+            break
+    return result
+
+
+SEARCH_RESULTS = {
+    'users': ('user', user_search_result),
+    'schools': ('school', lambda school: {
+        'id': str(school.id), 'name': school.name, 'city': school.city, 'state': school.state,
+        'logo': school.logo.url if school.logo else None
+    }),
+    'posts': ('post', lambda post: {
+        'id': str(post.id), 'title': post.title, 'content': post.content[:200],
+        'author_name': post.author.get_full_name(), 'school_name': post.school.name if post.school else None,
+        'created_at': post.created_at
+    }),
+    'groups': ('group', lambda group: {
+        'id': group.id, 'name': group.name, 'description': group.description,
+        'school_name': group.school.name if group.school else None
+    }),
+}
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def search_all(request):
+    """
+    Search users, schools, posts and teacher groups from the search index,
+    best matches first; ?types= picks which and ?school= scopes them
+    """
+    try:
+        query = request.GET.get('q', '')
+        if not query_terms(query):
+            return Response({
+                'error': 'Search query must contain a word of at least 2 characters'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        types = [name for name in request.GET.get('types', '').split(',') if name] or list(SEARCH_RESULTS)
+        unknown = [name for name in types if name not in SEARCH_RESULTS]
+        if unknown:
+            return Response({
+                'error': f"Unknown search types: {', '.join(unknown)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        limit = get_page_size(request, default=SEARCH_LIMIT, maximum=MAX_SEARCH_LIMIT)
+        school_id = request.GET.get('school') or None
+        results = {}
+        for name in types:
+            kind, present = SEARCH_RESULTS[name]
+            results[name] = [
+                present(obj) for obj in search(kind, query, request.user, school=school_id, limit=limit)
+            ]
+        
+        return Response(results, status=status.HTTP_200_OK)
+        
+    except Exception as e:
+        logger.error(f"Search error: {str(e)}")
+        return Response({
+            'error': 'Search failed'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def search_users(request):
@@ -1345,45 +1953,14 @@ def search_users(request):
                 'error': 'Search query must be at least 2 characters'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        users = User.objects.filter(
-            models.Q(first_name__icontains=query) |
-            models.Q(last_name__icontains=query) |
-            models.Q(email__icontains=query),
-            is_active=True
-        ).exclude(id=request.user.id)
-        
+        users = searchable('user', request.user).exclude(id=request.user.id)
         if user_type:
             users = users.filter(user_type=user_type)
         
-        if school_id:
-            users = users.filter(
-                models.Q(student_profile__school_id=school_id) |
-                models.Q(teacher_profile__school_id=school_id) |
-                models.Q(principal_profile__school_id=school_id)
-            )
-        
-        # Limit results
-        users = users[:20]
-        
-        results = []
-        for user in users:
-            user_data = {
-                'id': str(user.id),
-                'name': user.get_full_name(),
-                'email': user.email,
-                'user_type': user.get_user_type_display(),
-                'profile_picture': user.profile_picture.url if user.profile_picture else None
-            }
-            
-            # Add school info if applicable
-            if hasattr(user, 'student_profile'):
-                user_data['school'] = user.student_profile.school.name
-            elif hasattr(user, 'teacher_profile'):
-                user_data['school'] = user.teacher_profile.school.name
-            elif hasattr(user, 'principal_profile'):
-                user_data['school'] = user.principal_profile.school.name
-            
-            results.append(user_data)
+        results = [
+            user_search_result(user)
+            for user in search('user', query, request.user, school=school_id or None, queryset=users)
+        ]
         
         return Response(results, status=status.HTTP_200_OK)
         
@@ -1397,26 +1974,13 @@ def search_users(request):
 # Helper functions for dashboard stats
 def get_monthly_revenue(schools):
     """Get monthly revenue data for charts"""
-    from datetime import datetime, timedelta
-    from django.db.models import Sum
-    
-    revenue_data = []
-    for i in range(6):
-        month_start = datetime.now().replace(day=1) - timedelta(days=30*i)
-        month_end = month_start.replace(day=28) + timedelta(days=4)
-        
-        revenue = FeePayment.objects.filter(
-            student__school__in=schools,
-            payment_date__range=[month_start, month_end],
-            status='completed'
-        ).aggregate(total=Sum('amount_paid'))['total'] or 0
-        
-        revenue_data.append({
-            'month': month_start.strftime('%b'),
-            'revenue': float(revenue)
-        })
+    today = timezone.localdate()
+    series = revenue_series(schools, add_months(today, -5), today, 'month')
     
-    return list(reversed(revenue_data))
+    return [{
+        'month': point['period'].strftime('%b'),
+        'revenue': point['revenue']
+    } for point in series]
 
 
 def get_recent_payments(schools):
@@ -1435,24 +1999,31 @@ def get_recent_payments(schools):
 
 def get_top_performing_schools(schools):
     """Get top performing schools based on various metrics"""
+    schools = list(schools)
+    school_ids = [school.id for school in schools]
+    grades = grouped(
+        Grade.objects.filter(student__school__in=school_ids), 'student__school', avg=Avg('score')
+    )
+    attendance = {
+        rollup.school_id: {'total': rollup.total, 'present': rollup.present}
+        for rollup in AttendanceRollup.objects.filter(
+            key__in=[rollup_key('school', school_id, 'total') for school_id in school_ids]
+        )
+    }
+    students = grouped(
+        StudentProfile.objects.filter(school__in=school_ids), 'school', count=Count('pk')
+    )
+
     school_stats = []
     for school in schools:
-        avg_grade = Grade.objects.filter(
-            student__school=school
-        ).aggregate(avg=Avg('score'))['avg'] or 0
-        
-        attendance_rate = Attendance.objects.filter(
-            student__school=school,
-            status='present'
-        ).count() / max(
-            Attendance.objects.filter(student__school=school).count(), 1
-        ) * 100
-        
+        avg_grade = grades.get(school.id, {}).get('avg') or 0
+        counts = attendance.get(school.id, {'total': 0, 'present': 0})
+
         school_stats.append({
             'name': school.name,
             'avg_grade': round(avg_grade, 2),
-            'attendance_rate': round(attendance_rate, 2),
-            'total_students': school.students.count()
+            'attendance_rate': round(rate(counts['present'], counts['total']), 2),
+            'total_students': students.get(school.id, {}).get('count', 0)
         })
     
     return sorted(school_stats, key=lambda x: x['avg_grade'], reverse=True)[:5]
@@ -1460,27 +2031,24 @@ def get_top_performing_schools(schools):
 
 def get_school_attendance_rate(school):
     """Get school attendance rate"""
-    total = Attendance.objects.filter(student__school=school).count()
-    present = Attendance.objects.filter(
-        student__school=school,
-        status='present'
-    ).count()
-    return (present / max(total, 1)) * 100
+    counts = rollup_counts(rollup_key('school', school.id, 'total'))
+    return rate(counts['present'], counts['total'])
 
 
 def get_school_performance(school):
     """Get school academic performance"""
-    avg_grade = Grade.objects.filter(
-        student__school=school
-    ).aggregate(avg=Avg('score'))['avg'] or 0
-    
-    grade_distribution = Grade.objects.filter(
-        student__school=school
-    ).values('letter_grade').annotate(count=Count('id'))
+    by_letter = grouped(
+        SubjectResult.objects.filter(student__school=school),
+        'letter_grade', count=Count('pk'), total=Sum('score_total'), assessments=Sum('assessments')
+    )
+    graded = sum(row['assessments'] for row in by_letter.values())
+    avg_grade = sum(row['total'] for row in by_letter.values()) / graded if graded else 0
     
     return {
         'average_grade': round(avg_grade, 2),
-        'grade_distribution': list(grade_distribution)
+        'grade_distribution': [
+            {'letter_grade': letter, 'count': row['count']} for letter, row in by_letter.items()
+        ]
     }
 
 
@@ -1549,19 +2117,18 @@ def get_grading_progress(teacher):
 
 def get_class_performance(teacher):
     """Get class performance for teacher"""
-    performance = []
-    for class_obj in teacher.classes.all():
-        avg_grade = Grade.objects.filter(
-            class_taken=class_obj,
-            teacher=teacher
-        ).aggregate(avg=Avg('score'))['avg'] or 0
-        
-        performance.append({
-            'class_name': class_obj.name,
-            'average_grade': round(avg_grade, 2)
-        })
-    
-    return performance
+    taught = TeacherClass.objects.filter(
+        teacher=teacher, class_assigned=OuterRef('class_taken'), subject=OuterRef('subject')
+    )
+    totals = grouped(
+        SubjectResult.objects.filter(Exists(taught)), 'class_taken',
+        total=Sum('score_total'), assessments=Sum('assessments')
+    )
+
+    return [{
+        'class_name': class_obj.name,
+        'average_grade': round(average_score(totals.get(class_obj.id)), 2)
+    } for class_obj in teacher.classes.all()]
 
 
 def get_children_attendance(children):
@@ -1569,46 +2136,40 @@ def get_children_attendance(children):
     if not children:
         return 0
     
-    total = sum(
-        Attendance.objects.filter(student=child).count()
-        for child in children
-    )
-    present = sum(
-        Attendance.objects.filter(student=child, status='present').count()
-        for child in children
-    )
-    
-    return (present / max(total, 1)) * 100
+    counts = AttendanceRollup.objects.filter(
+        key__in=[rollup_key('student', child.id, 'total') for child in children]
+    ).aggregate(total=Sum('total'), present=Sum('present'))
+    return rate(counts['present'] or 0, counts['total'] or 0)
 
 
 def get_children_performance(children):
     """Get academic performance for parent's children"""
-    performance = []
-    for child in children:
-        avg_grade = Grade.objects.filter(
-            student=child
-        ).aggregate(avg=Avg('score'))['avg'] or 0
-        
-        performance.append({
-            'name': child.user.get_full_name(),
-            'average_grade': round(avg_grade, 2)
-        })
-    
-    return performance
+    totals = grouped(
+        TermResult.objects.filter(student__in=children), 'student',
+        total=Sum('score_total'), assessments=Sum('assessments')
+    )
+
+    return [{
+        'name': child.user.get_full_name(),
+        'average_grade': round(average_score(totals.get(child.id)), 2)
+    } for child in children]
 
 
 def get_children_fee_status(children):
     """Get fee payment status for parent's children"""
+    fees = grouped(
+        FeeStructure.objects.filter(school__in={child.school_id for child in children}),
+        'school', total=Sum('amount')
+    )
+    payments = grouped(
+        FeePayment.objects.filter(student__in=children, status='completed'),
+        'student', total=Sum('amount_paid')
+    )
+
     fee_status = []
     for child in children:
-        total_fees = FeeStructure.objects.filter(
-            school=child.school
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        paid = FeePayment.objects.filter(
-            student=child,
-            status='completed'
-        ).aggregate(total=Sum('amount_paid'))['total'] or 0
+        total_fees = fees.get(child.school_id, {}).get('total') or 0
+        paid = payments.get(child.id, {}).get('total') or 0
         
         fee_status.append({
             'child_name': child.user.get_full_name(),
@@ -1631,4 +2192,25 @@ def public_stats(request):
         'total_teachers': User.objects.filter(user_type='teacher').count(),
         'total_users': User.objects.filter(is_active=True).count()
     }
-    return Response(stats)
\ No newline at end of file
+    return Response(stats)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def sms_provider_health(request):
+    """
+    Latency, error rate and in-flight requests for each SMS provider client
+    """
+    return Response({
+        'provider': getattr(settings, 'SMS_PROVIDER', 'mock'),
+        'clients': provider_health()
+    })
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def notification_push_health(request):
+    """
+    Queue depth, coalescing and push latency of this process's notification
+    dispatcher
+    """
+    return Response(dispatcher_health())
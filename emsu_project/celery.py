@@ -0,0 +1,23 @@
+"""
+Celery application for emsu_project.
+
+Work is split across three queues so slow providers cannot starve each
+other; run one worker per queue and size each independently, e.g.
+
+    celery -A emsu_project worker -Q notifications -c 8
+    celery -A emsu_project worker -Q sms -c 4
+    celery -A emsu_project worker -Q email -c 2
+
+Without CELERY_BROKER_URL, tasks run eagerly in the calling process, which
+is what local development and the tests rely on.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'emsu_project.settings')
+
+app = Celery('emsu_project')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
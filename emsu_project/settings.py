@@ -2,6 +2,7 @@ import os
 from pathlib import Path
 import environ
 from datetime import timedelta
+from django.core.exceptions import ImproperlyConfigured
 from django.db import transaction
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -105,6 +106,7 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = env('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER or 'noreply@example.com'
+FRONTEND_URL = env('FRONTEND_URL', default='http://localhost:5000')
 
 # ──── REST FRAMEWORK ─────────────────────────────────────────────────────
 REST_FRAMEWORK = {
@@ -193,6 +195,58 @@ AFRICASTALKING_USERNAME = os.getenv('AT_USERNAME')
 AFRICASTALKING_API_KEY = os.getenv('AT_API_KEY')
 AFRICASTALKING_SENDER = os.getenv('AT_SENDER')  # e.g. "EMSU"
 
+# Provider used for outgoing SMS: 'africas_talking', 'twilio' or 'mock'
+SMS_PROVIDER = env('SMS_PROVIDER', default='mock')
+TWILIO_ACCOUNT_SID = env('TWILIO_ACCOUNT_SID', default='')
+TWILIO_AUTH_TOKEN = env('TWILIO_AUTH_TOKEN', default='')
+TWILIO_PHONE_NUMBER = env('TWILIO_PHONE_NUMBER', default='')
+# Open the provider connection at startup so the first OTP skips the handshake
+SMS_WARM_UP = env.bool('SMS_WARM_UP', default=SMS_PROVIDER != 'mock')
+# Bulk sends: concurrent requests per job, and API requests per second per provider
+SMS_BULK_MAX_WORKERS = env.int('SMS_BULK_MAX_WORKERS', default=8)
+SMS_RATE_LIMITS = {
+    'africas_talking': env.int('SMS_RATE_LIMIT_AFRICAS_TALKING', default=5),
+    'twilio': env.int('SMS_RATE_LIMIT_TWILIO', default=10),
+}
+
+# ──── ACADEMICS ──────────────────────────────────────────────────────────
+# Relative weight of each assessment type in a term's subject score; the
+# weights of the types a student has been graded on are normalised to 100%
+GRADE_ASSESSMENT_WEIGHTS = {
+    'ca1': 10,
+    'ca2': 10,
+    'ca3': 10,
+    'ca4': 10,
+    'project': 10,
+    'practical': 10,
+    'exam': 60,
+}
+
+# Report cards: rendering processes (default: one per CPU), and an optional
+# PEM key and certificate to sign every card with
+REPORT_CARD_WORKERS = env.int('REPORT_CARD_WORKERS', default=0) or None
+REPORT_CARD_SIGNING = {
+    'key': env('REPORT_CARD_SIGNING_KEY'),
+    'cert': env('REPORT_CARD_SIGNING_CERT'),
+    'passphrase': env('REPORT_CARD_SIGNING_PASSPHRASE', default=''),
+} if env('REPORT_CARD_SIGNING_KEY', default='') else None
+
+# Spreadsheet imports: rows validated and written per batch, and threads
+# hashing the passwords given in a file (imported users without one get an
+# unusable password and an emailed invite)
+IMPORT_BATCH_SIZE = env.int('IMPORT_BATCH_SIZE', default=500)
+IMPORT_HASH_WORKERS = env.int('IMPORT_HASH_WORKERS', default=4)
+
+# Home timelines: posts by authors with more followers than this are merged
+# into followers' feeds on read instead of written to each one, and a new
+# connection brings this many of each side's recent posts into the other's feed
+FEED_FANOUT_MAX_FOLLOWERS = env.int('FEED_FANOUT_MAX_FOLLOWERS', default=1000)
+FEED_BACKFILL_POSTS = env.int('FEED_BACKFILL_POSTS', default=50)
+
+# Typeahead indexes are held in each process and rebuilt from the database
+# at most this often (and after a local change to what they list)
+AUTOCOMPLETE_REFRESH_SECONDS = env.int('AUTOCOMPLETE_REFRESH_SECONDS', default=300)
+
 # ──── CHANNELS & CACHING ─────────────────────────────────────────────────
 ASGI_APPLICATION = 'emsu_project.asgi.application'
 CHANNEL_LAYERS = {
@@ -201,9 +255,42 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Notification pushes sent within this window of each other are coalesced
+# per user and sent together, this many WebSocket groups at a time
+NOTIFICATION_PUSH_WINDOW_MS = env.int('NOTIFICATION_PUSH_WINDOW_MS', default=50)
+NOTIFICATION_PUSH_BATCH_SIZE = env.int('NOTIFICATION_PUSH_BATCH_SIZE', default=200)
+
 # Default Django cache
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
-}
\ No newline at end of file
+}
+# ──── BACKGROUND TASKS (Celery) ──────────────────────────────────────────
+# Point CELERY_BROKER_URL at Redis and run workers. Without a broker URL
+# there is nothing for workers to read from, so tasks run eagerly in the
+# calling process instead; that covers local development and every test
+# runner. Setting CELERY_TASK_ALWAYS_EAGER=False without a broker would
+# queue tasks no worker ever runs, so it is refused at startup.
+CELERY_BROKER_URL = env('CELERY_BROKER_URL', default=None)
+CELERY_RESULT_BACKEND = env('CELERY_RESULT_BACKEND', default='cache+memory://')
+CELERY_TASK_ALWAYS_EAGER = env.bool('CELERY_TASK_ALWAYS_EAGER', default=not CELERY_BROKER_URL)
+if not CELERY_TASK_ALWAYS_EAGER and (not CELERY_BROKER_URL or CELERY_BROKER_URL.startswith('memory://')):
+    raise ImproperlyConfigured(
+        'CELERY_TASK_ALWAYS_EAGER is off but CELERY_BROKER_URL names no broker workers can read; '
+        'set CELERY_BROKER_URL or leave CELERY_TASK_ALWAYS_EAGER unset'
+    )
+CELERY_TASK_DEFAULT_QUEUE = 'notifications'
+CELERY_TASK_ROUTES = {
+    'core.tasks.send_email_task': {'queue': 'email'},
+    'core.tasks.send_sms_task': {'queue': 'sms'},
+    'core.tasks.send_bulk_sms_task': {'queue': 'sms'},
+    'core.tasks.generate_report_cards_task': {'queue': 'reports'},
+    'core.tasks.run_import_task': {'queue': 'imports'},
+    'core.tasks.send_invites_task': {'queue': 'email'},
+}
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_ACCEPT_CONTENT = ['json']
+CELERY_TIMEZONE = TIME_ZONE